@@ -1,43 +1,752 @@
 from musicdl import musicdl
-from musicdl.modules.utils import SongInfo
+from musicdl.modules.sources import BaseMusicClient
+from musicdl.modules.utils import SongInfo, SongInfoUtils
 from musicdl.modules.utils.misc import AudioLinkTester
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed, wait, FIRST_COMPLETED
+from threading import Thread, Lock, Event, Timer, Condition
+from types import SimpleNamespace
+from array import array
+from collections import OrderedDict, deque
+from difflib import SequenceMatcher
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit, parse_qsl
+from email.utils import parsedate_to_datetime
+from urllib.request import Request, urlopen
+import argparse
+import atexit
+import bisect
+import copy
+import csv
+import gc
+import gzip
+import hashlib
+import json
+import math
 import os
+import queue
+import random
 import re
+import requests
+import shutil
+import socket
+import sqlite3
 import time
+import tracemalloc
 import sys
 
+try:
+    import readline  # Windows 上通常没有，命令行补全不可用
+except ImportError:
+    readline = None
 
-#  Monkey-patch：禁用耗时的链接验证
-_original_test = None
-_original_probe = None
 
-def fast_test(self, url, request_overrides=None):
-    """快速验证，只返回基本信息，不发送HTTP请求"""
-    return dict(ok=True, status=200, method="HEAD", final_url=url, 
-                ctype="audio/mpeg", clen=None, range=True, fmt=None, reason="fast mode")
+# ========== 协作式取消 ==========
+REQUEST_TIMEOUT = (10, 30)       # 未指定超时的请求使用的 (连接, 读取) 超时，保证取消后线程能在有限时间内退出
+CANCEL_POLL_INTERVAL = 0.2
 
-def fast_probe(self, url, request_overrides=None):
-    """快速探测，不发送实际请求"""
-    ext = url.split('?')[0].split('.')[-1] if '?' in url or '.' in url else 'mp3'
-    return dict(file_size='NULL', ctype='audio/mpeg', ext=ext, download_url=url, final_url=url)
 
-def enable_fast_mode():
-    """启用快速搜索模式（跳过链接验证）"""
-    global _original_test, _original_probe
-    if _original_test is None:
-        _original_test = AudioLinkTester.test
-        _original_probe = AudioLinkTester.probe
-    AudioLinkTester.test = fast_test
-    AudioLinkTester.probe = fast_probe
+class OperationCancelled(Exception):
+    """搜索或下载被用户取消"""
 
-def disable_fast_mode():
-    """恢复正常的链接验证"""
-    global _original_test, _original_probe
-    if _original_test is not None and _original_probe is not None:
-        AudioLinkTester.test = _original_test  # type: ignore
-        AudioLinkTester.probe = _original_probe  # type: ignore
+
+class CancelToken:
+    """协作式取消令牌：工作线程在每次请求前、每个数据块后检查；
+    cancel() 时执行登记的回调（中止传输、关闭会话），让正在进行的请求尽快结束
+    """
+    def __init__(self):
+        self._event = Event()
+        self._lock = Lock()
+        self._callbacks = []
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled()
+
+    def wait(self, timeout):
+        """最多等待 timeout 秒，被取消时提前返回 True"""
+        return self._event.wait(timeout)
+
+    def on_cancel(self, callback):
+        """登记取消回调；已经取消时立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+
+def bind_cancel_token(client, cancel_token):
+    """让客户端之后的 get/post 受 cancel_token 控制（需已 install_retry_policy），取消时关闭其会话"""
+    client._cancel_token = cancel_token
+    if cancel_token is not None:
+        def close_session():
+            session = getattr(client, 'session', None)
+            if session is not None:
+                session.close()
+        cancel_token.on_cancel(close_session)
+    return client
+
+
+def iter_completed(futures, cancel_token=None, poll=CANCEL_POLL_INTERVAL):
+    """可取消的 as_completed：每 poll 秒检查一次令牌，被取消时抛出 OperationCancelled"""
+    pending = set(futures)
+    while pending:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        done, pending = wait(pending, timeout=poll, return_when=FIRST_COMPLETED)
+        yield from done
+
+
+# ========== 请求合并：相同的进行中操作只做一次 ==========
+class SingleFlight:
+    """相同 key 的并发调用合并为一次：第一个调用者执行，其余的等待并共享它的结果或异常；
+    调用结束后立即移除，不做缓存（需要缓存的搜索结果见 SearchResultCache）
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.calls = {}     # key -> Future
+        self.stats = {'calls': 0, 'shared': 0}
+
+    def do(self, key, fn, cancel_token=None):
+        """执行 fn() 或等待进行中的同一个调用
+        cancel_token: 等待期间被取消时抛出 OperationCancelled（不影响正在执行的调用）
+        返回: (结果, 是否共享了其他调用者的结果)
+        """
+        with self.lock:
+            self.stats['calls'] += 1
+        while True:
+            with self.lock:
+                future = self.calls.get(key)
+                owner = future is None
+                if owner:
+                    future = self.calls[key] = Future()
+            if owner:
+                break
+            for _ in iter_completed([future], cancel_token):
+                pass
+            try:
+                result = future.result()
+            except OperationCancelled:
+                # 执行的那一方被它自己的令牌取消了，本次调用没有被取消，重新执行
+                continue
+            with self.lock:
+                self.stats['shared'] += 1
+            return result, True
+        # 先移除 key 再公布结果：被唤醒的等待者重试时不会再拿到这个已完成的 Future
+        try:
+            result = fn()
+        except Exception as e:
+            self._forget(key)
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # Ctrl+C 等中断不转交给等待者，让它们自己重新执行
+            self._forget(key)
+            future.set_exception(OperationCancelled())
+            raise
+        self._forget(key)
+        future.set_result(result)
+        return result, False
+
+    def _forget(self, key):
+        with self.lock:
+            del self.calls[key]
+
+
+# ========== 公平调度线程池：多个搜索会话共用 ==========
+SEARCH_POOL_WORKERS = 6         # 所有搜索会话合计的平台搜索并发上限
+
+
+class FairWorkerPool:
+    """多个会话共用的有界线程池
+    每个会话的任务单独排队，空闲线程在有任务的会话之间轮流取任务，
+    后开始的会话不必等前一个会话的任务全部跑完，总并发仍不超过 max_workers
+    """
+    def __init__(self, max_workers=SEARCH_POOL_WORKERS):
+        self.max_workers = max_workers
+        self.cond = Condition()
+        self.queues = OrderedDict()     # 会话 -> deque[(future, fn, args, kwargs)]，顺序即轮转顺序
+        self.threads = []
+        self.idle = 0
+        self._shutdown = False
+
+    def submit(self, session, fn, *args, **kwargs):
+        """把任务排进 session 的队列，返回 Future；取消未开始的 Future 即可撤销任务"""
+        future = Future()
+        with self.cond:
+            if self._shutdown:
+                raise RuntimeError('线程池已关闭')
+            self.queues.setdefault(session, deque()).append((future, fn, args, kwargs))
+            if self.idle == 0 and len(self.threads) < self.max_workers:
+                thread = Thread(target=self._worker, daemon=True)
+                self.threads.append(thread)
+                thread.start()
+            self.cond.notify()
+        return future
+
+    def executor(self, session):
+        """绑定会话的 submit(fn, *args)，可以传给只认 executor 接口的函数"""
+        return SimpleNamespace(submit=lambda fn, *args, **kwargs: self.submit(session, fn, *args, **kwargs))
+
+    def pending(self):
+        """各会话排队中的任务数"""
+        with self.cond:
+            return {session: len(tasks) for session, tasks in self.queues.items()}
+
+    def _next_task(self):
+        # 取队首会话的一个任务，然后把该会话移到队尾
+        session, tasks = next(iter(self.queues.items()))
+        task = tasks.popleft()
+        del self.queues[session]
+        if tasks:
+            self.queues[session] = tasks
+        return task
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.queues and not self._shutdown:
+                    self.idle += 1
+                    self.cond.wait()
+                    self.idle -= 1
+                if not self.queues:
+                    return
+                future, fn, args, kwargs = self._next_task()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def shutdown(self, cancel_futures=False):
+        with self.cond:
+            self._shutdown = True
+            if cancel_futures:
+                for tasks in self.queues.values():
+                    for future, *_ in tasks:
+                        future.cancel()
+                self.queues.clear()
+            self.cond.notify_all()
+
+
+# ========== 平台请求重试策略：退避 / 抖动 / 限流闸门 ==========
+RETRY_STATUS = {429, 500, 502, 503, 504}
+THROTTLE_STATUS = {429, 503}
+RETRY_MAX_ATTEMPTS = 4           # 单个请求最多尝试次数（含第一次）
+RETRY_BASE_DELAY = 0.5           # 第一次重试的基准等待（秒），之后每次翻倍
+RETRY_MAX_DELAY = 30.0
+RETRY_BUDGET = 10.0              # 每个平台的重试预算：每次重试消耗 1，成功的请求回补 0.2
+RETRY_BUDGET_REFILL = 0.2
+THROTTLE_PACE_MAX = 2.0          # 限流后同平台请求之间的最大间隔（秒），成功请求会逐步缩短
+
+
+def parse_retry_after(resp):
+    """读取 Retry-After 头（秒数或 HTTP 日期），返回秒数或 None"""
+    value = (getattr(resp, 'headers', None) or {}).get('Retry-After')
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class PlatformRetryPolicy:
+    """单个平台的重试策略，由该平台的所有客户端、所有线程共享
+    - 429/5xx/连接失败时指数退避 + 抖动后重试，避免各线程同时重试
+    - 429/503 视为平台在限流：遵守 Retry-After，并关闭闸门让所有线程一起等待，
+      之后同平台请求按 pace 间隔发出，成功的请求逐步恢复速度
+    - 重试预算耗尽时不再重试，直接把失败交给调用方
+    """
+    def __init__(self, source, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY,
+                 max_delay=RETRY_MAX_DELAY, budget=RETRY_BUDGET):
+        self.source = source
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_budget = budget
+        self.budget = budget
+        self.lock = Lock()
+        self.throttle_until = 0.0
+        self.next_slot = 0.0
+        self.pace = 0.0
+        self.stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'backoff_seconds': 0.0, 'budget_exhausted': 0}
+
+    def _wait_for_slot(self, cancel_token=None):
+        # 闸门关闭或处于限速期时，各线程按顺序领取发送时间
+        with self.lock:
+            now = time.time()
+            start = max(now, self.throttle_until, self.next_slot)
+            self.next_slot = start + self.pace
+            self.stats['requests'] += 1
+            delay = start - now
+            if delay > 0:
+                self.stats['backoff_seconds'] += delay
+        if delay > 0:
+            _sleep(delay, cancel_token)
+
+    def _on_success(self):
+        with self.lock:
+            self.budget = min(self.max_budget, self.budget + RETRY_BUDGET_REFILL)
+            self.pace = self.pace * 0.8 if self.pace > 0.05 else 0.0
+
+    def _on_failure(self, attempt, resp):
+        """记录一次可重试的失败，返回需要等待的秒数；不再重试时返回 None"""
+        status = getattr(resp, 'status_code', None)
+        retry_after = parse_retry_after(resp) if status in THROTTLE_STATUS else None
+        backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay = max(retry_after or 0.0, random.uniform(backoff / 2, backoff))
+        with self.lock:
+            if status in THROTTLE_STATUS:
+                self.stats['throttled'] += 1
+                self.throttle_until = max(self.throttle_until, time.time() + delay)
+                self.pace = min(THROTTLE_PACE_MAX, max(self.pace * 2, 0.25))
+            if attempt + 1 >= self.max_attempts:
+                return None
+            if self.budget < 1:
+                self.stats['budget_exhausted'] += 1
+                return None
+            self.budget -= 1
+            self.stats['retries'] += 1
+        return delay
+
+    def call(self, request_fn, url, cancel_token=None, **kwargs):
+        """按策略执行 request_fn(url, **kwargs)（客户端原本的 get/post，已设为只尝试一次）
+        cancel_token: 每次尝试前检查，退避等待中被取消时立即抛出 OperationCancelled
+        """
+        kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+        attempt = 0
+        while True:
+            self._wait_for_slot(cancel_token)
+            resp = request_fn(url, **dict(kwargs))
+            status = getattr(resp, 'status_code', None)
+            if resp is not None and status not in RETRY_STATUS:
+                self._on_success()
+                return resp
+            delay = self._on_failure(attempt, resp)
+            if delay is None:
+                return resp
+            if resp is not None:
+                resp.close()
+            if getattr(resp, 'status_code', None) not in THROTTLE_STATUS:
+                # 限流时等待由闸门统一完成，其他错误只让当前线程退避
+                with self.lock:
+                    self.stats['backoff_seconds'] += delay
+                _sleep(delay, cancel_token)
+            attempt += 1
+
+
+def _sleep(seconds, cancel_token=None):
+    """可被取消打断的 sleep"""
+    if cancel_token is None:
+        time.sleep(seconds)
+        return
+    if cancel_token.wait(seconds):
+        raise OperationCancelled()
+
+
+_retry_policies = {}
+_retry_policies_lock = Lock()
+
+
+def get_retry_policy(source):
+    """取平台共享的重试策略"""
+    with _retry_policies_lock:
+        if source not in _retry_policies:
+            _retry_policies[source] = PlatformRetryPolicy(source)
+        return _retry_policies[source]
+
+
+def install_retry_policy(client):
+    """让客户端的 get/post 走平台共享的重试策略（客户端自身只尝试一次）；
+    配置了出口会话池时，每次尝试由池中的出口发出
+    """
+    if getattr(client, '_retry_policy', None) is not None:
+        return client
+    policy = get_retry_policy(client.source)
+    raw_get, raw_post = client.get, client.post
+    pool = get_egress_pool(client.source)
+    if pool is not None:
+        raw_get = lambda url, **kwargs: pool.request(client, 'GET', url, **kwargs)
+        raw_post = lambda url, **kwargs: pool.request(client, 'POST', url, **kwargs)
+    client.max_retries = 1
+    client._cancel_token = None
+    client.get = lambda url, **kwargs: policy.call(raw_get, url, cancel_token=client._cancel_token, **kwargs)
+    client.post = lambda url, **kwargs: policy.call(raw_post, url, cancel_token=client._cancel_token, **kwargs)
+    client._retry_policy = policy
+    return client
+
+
+def install_retry_policies(music_client):
+    """为 musicdl.MusicClient 下的所有平台客户端安装重试策略"""
+    for client in music_client.music_clients.values():
+        install_retry_policy(client)
+    return music_client
+
+
+def build_music_client(source, link_check=None, **cfg):
+    """创建单个平台客户端并安装重试策略；link_check 为链接验证模式，None 时完整验证"""
+    from musicdl.modules.sources import BuildMusicClient
+    client = install_retry_policy(BuildMusicClient(module_cfg={'type': source, **cfg}))
+    if link_check is not None:
+        install_link_validation(client, link_check)
+    return client
+
+
+def retry_stats():
+    """各平台重试统计的快照 {source: stats}"""
+    with _retry_policies_lock:
+        policies = list(_retry_policies.values())
+    snapshot = {}
+    for policy in policies:
+        with policy.lock:
+            snapshot[policy.source] = dict(policy.stats)
+    return snapshot
+
+
+def format_retry_summary(since=None):
+    """本次运行的重试摘要；since 为开始时的 retry_stats()，没有重试时返回空字符串"""
+    since = since or {}
+    retries = throttled = exhausted = 0
+    backoff = 0.0
+    throttled_sources = []
+    for source, stats in retry_stats().items():
+        base = since.get(source, {})
+        retries += stats['retries'] - base.get('retries', 0)
+        backoff += stats['backoff_seconds'] - base.get('backoff_seconds', 0.0)
+        exhausted += stats['budget_exhausted'] - base.get('budget_exhausted', 0)
+        count = stats['throttled'] - base.get('throttled', 0)
+        if count:
+            throttled += count
+            throttled_sources.append(source)
+    if not (retries or throttled or exhausted):
+        return ''
+    text = f"重试 {retries} 次 | 退避等待 {backoff:.1f} 秒"
+    if throttled:
+        text += f" | 限流 {throttled} 次 ({', '.join(throttled_sources)})"
+    if exhausted:
+        text += f" | 预算耗尽放弃 {exhausted} 次"
+    return text
+
+
+# ========== 链接验证策略：抽样 / 完整 / 跳过 ==========
+LINK_CHECK_MODES = ('sampled', 'full', 'none')
+LINK_CHECK_NAMES = {'sampled': '抽样', 'full': '标准', 'none': '极速'}
+LINK_SAMPLE_EVERY = 5           # 抽样模式下每个平台每 5 个链接完整验证 1 个
+LINK_SAMPLE_WINDOW = 10         # 按最近多少次验证判断平台是否可靠
+LINK_UNRELIABLE_FAILURES = 3    # 最近的验证中失败达到这么多次，该平台标记为不可靠，链接改为全部验证
+
+
+def unchecked_link_status(url):
+    """不发请求的链接状态，格式与 AudioLinkTester.test 的返回值相同；扩展名从 URL 推断，推断不出时按 mp3"""
+    ext = AudioLinkTester.normalizeext(AudioLinkTester.extractsuffixfromurl(url)) if isinstance(url, str) else None
+    return {
+        'ok': isinstance(url, str) and url.startswith('http'), 'ctype': 'NULL',
+        'ext': ext if AudioLinkTester.isvalidaudioext(ext) else 'mp3',
+        'original_download_url': url, 'download_url': url, 'file_size': 'NULL', 'file_size_bytes': 0,
+        'method': 'unchecked', 'status_code': 0, 'reason': ['链接验证已跳过'],
+    }
+
+
+class LinkSampler:
+    """一个平台的链接验证统计，该平台的所有客户端共享
+    抽样模式下每 LINK_SAMPLE_EVERY 个链接完整验证一个；最近 LINK_SAMPLE_WINDOW 次验证中失败达到
+    LINK_UNRELIABLE_FAILURES 次时平台被标记为不可靠，此后链接全部验证，直到最近的验证重新大多通过
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.lock = Lock()
+        self.sampled = 0
+        self.recent = deque(maxlen=LINK_SAMPLE_WINDOW)  # 最近的验证结果 True / False
+        self.stats = {'links': 0, 'checked': 0, 'failed': 0, 'escalated': 0}
+
+    @property
+    def unreliable(self):
+        return self.recent.count(False) >= LINK_UNRELIABLE_FAILURES
+
+    def should_check(self, mode):
+        with self.lock:
+            self.stats['links'] += 1
+            if mode != 'sampled':
+                return mode == 'full'
+            self.sampled += 1
+            if (self.sampled - 1) % LINK_SAMPLE_EVERY == 0:
+                return True
+            if self.unreliable:
+                self.stats['escalated'] += 1
+                return True
+            return False
+
+    def record(self, ok):
+        with self.lock:
+            self.stats['checked'] += 1
+            if not ok:
+                self.stats['failed'] += 1
+            self.recent.append(bool(ok))
+
+
+class PolicyLinkTester:
+    """按验证模式工作的 AudioLinkTester 包装，只装在单个客户端上，不同模式的搜索可以同时进行"""
+
+    def __init__(self, tester, mode, sampler):
+        if mode not in LINK_CHECK_MODES:
+            raise ValueError(f"未知的链接验证模式: {mode}")
+        self.tester = tester
+        self.mode = mode
+        self.sampler = sampler
+
+    def __getattr__(self, name):
+        return getattr(self.tester, name)
+
+    def test(self, url, request_overrides=None, renew_session=True):
+        if not self.sampler.should_check(self.mode):
+            return unchecked_link_status(url)
+        result = self.tester.test(url, request_overrides=request_overrides, renew_session=renew_session)
+        self.sampler.record(result.get('ok'))
+        return result
+
+
+_link_samplers = {}
+_link_samplers_lock = Lock()
+
+
+def get_link_sampler(source):
+    """取平台共享的链接验证统计"""
+    with _link_samplers_lock:
+        if source not in _link_samplers:
+            _link_samplers[source] = LinkSampler(source)
+        return _link_samplers[source]
+
+
+def _wrap_link_testers(client):
+    sampler = get_link_sampler(client.source)
+    for attr in ('audio_link_tester', 'quark_audio_link_tester'):
+        tester = getattr(client, attr, None)
+        if tester is None:
+            continue
+        if isinstance(tester, PolicyLinkTester):
+            tester = tester.tester
+        setattr(client, attr, PolicyLinkTester(tester, client._link_check, sampler))
+
+
+def install_link_validation(client, mode):
+    """为单个客户端设置链接验证模式（sampled / full / none），可重复调用切换；
+    不保持会话的客户端每次请求都会重建 tester，重建后再包装一次
+    """
+    if getattr(client, '_link_check', None) is None:
+        raw_initsession = client._initsession
+
+        def initsession():
+            raw_initsession()
+            _wrap_link_testers(client)
+
+        client._initsession = initsession
+    client._link_check = mode
+    _wrap_link_testers(client)
+    return client
+
+
+def install_link_validations(music_client, mode):
+    """为 musicdl.MusicClient 下的所有平台客户端设置链接验证模式"""
+    for client in music_client.music_clients.values():
+        install_link_validation(client, mode)
+    return music_client
+
+
+def link_check_stats():
+    """各平台链接验证统计的快照 {source: stats}"""
+    with _link_samplers_lock:
+        samplers = list(_link_samplers.values())
+    snapshot = {}
+    for sampler in samplers:
+        with sampler.lock:
+            snapshot[sampler.source] = dict(sampler.stats, unreliable=sampler.unreliable)
+    return snapshot
+
+
+def format_link_check_summary(since=None):
+    """本次运行的链接验证摘要；since 为开始时的 link_check_stats()，验证都通过时返回空字符串"""
+    since = since or {}
+    links = checked = failed = 0
+    unreliable = []
+    for source, stats in link_check_stats().items():
+        base = since.get(source, {})
+        links += stats['links'] - base.get('links', 0)
+        checked += stats['checked'] - base.get('checked', 0)
+        failed += stats['failed'] - base.get('failed', 0)
+        if stats['unreliable']:
+            unreliable.append(source)
+    if not (failed or unreliable):
+        return ''
+    text = f"链接验证 {checked}/{links} 个 | 失效 {failed} 个"
+    if unreliable:
+        text += f" | 不可靠平台 ({', '.join(unreliable)}) 已改为全部验证"
+    return text
+
+
+# ========== 出口会话池：多代理轮询 ==========
+EGRESS_EVICT_SECONDS = 300      # 被限流的出口暂停使用的时长（秒）
+EGRESS_MAX_FAILURES = 3         # 连续连接失败这么多次的出口同样暂停使用
+DIRECT_EGRESS = 'direct'        # --proxy direct 表示本机直连
+
+
+def normalize_proxy(proxy):
+    """'host:port' 补全为 'http://host:port'；direct 原样返回"""
+    proxy = proxy.strip()
+    if proxy == DIRECT_EGRESS or '://' in proxy:
+        return proxy
+    return f"http://{proxy}"
+
+
+class Egress:
+    """一个出口：独立的会话（连接池 / cookie），可选绑定一个 HTTP 代理"""
+    def __init__(self, proxy=None):
+        self.proxy = proxy
+        self.proxies = {'http': proxy, 'https': proxy} if proxy else {}
+        self.session = requests.Session()
+        self.evicted_until = 0.0
+        self.failures = 0
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'evictions': 0}
+
+    @property
+    def name(self):
+        return self.proxy or DIRECT_EGRESS
+
+
+class EgressPool:
+    """单个平台的出口会话池，由该平台的所有客户端共享
+    - 请求按轮询分摊到各出口，每个出口有自己的会话，平台看到的是多个来源
+    - 被限流（429/503）的出口立即换下一个出口重发，并暂停使用 evict_seconds 秒；连续连接失败的出口同样暂停
+    - 所有出口都被暂停时仍使用最早恢复的那个，所有出口都被限流时才把结果交给 PlatformRetryPolicy 统一退避
+    """
+    def __init__(self, source, proxies, evict_seconds=EGRESS_EVICT_SECONDS, max_failures=EGRESS_MAX_FAILURES):
+        self.source = source
+        self.egresses = [Egress(None if proxy == DIRECT_EGRESS else proxy) for proxy in proxies]
+        self.evict_seconds = evict_seconds
+        self.max_failures = max_failures
+        self.lock = Lock()
+        self.next_index = 0
+
+    def acquire(self, exclude=()):
+        """轮询取下一个可用的出口（exclude 中的跳过），没有可选的出口时返回 None"""
+        with self.lock:
+            candidates = [e for e in self.egresses if e not in exclude]
+            if not candidates:
+                return None
+            now = time.time()
+            count = len(self.egresses)
+            for i in range(count):
+                egress = self.egresses[(self.next_index + i) % count]
+                if egress in candidates and egress.evicted_until <= now:
+                    self.next_index = (self.next_index + i + 1) % count
+                    break
+            else:
+                egress = min(candidates, key=lambda e: e.evicted_until)
+            egress.stats['requests'] += 1
+            return egress
+
+    def report(self, egress, status=None, error=False):
+        """记录一次请求结果，更新出口的健康状态"""
+        with self.lock:
+            if status in THROTTLE_STATUS:
+                egress.stats['throttled'] += 1
+                self._evict(egress)
+            elif error:
+                egress.stats['errors'] += 1
+                egress.failures += 1
+                if egress.failures >= self.max_failures:
+                    self._evict(egress)
+            else:
+                egress.failures = 0
+
+    def _evict(self, egress):
+        egress.evicted_until = time.time() + self.evict_seconds
+        egress.failures = 0
+        egress.stats['evictions'] += 1
+
+    def request(self, client, method, url, **kwargs):
+        """按客户端 get/post 的约定发送一次请求：非 2xx 时照样返回响应，所有出口都连不上时返回 None"""
+        headers = dict(getattr(getattr(client, 'session', None), 'headers', None) or client.default_headers or {})
+        headers.update(kwargs.pop('headers', None) or {})
+        kwargs.setdefault('cookies', client.default_cookies)
+        kwargs.pop('proxies', None)
+        kwargs.pop('impersonate', None)
+        tried = []
+        resp = None
+        while True:
+            egress = self.acquire(exclude=tried)
+            if egress is None:
+                return resp
+            tried.append(egress)
+            if resp is not None:
+                resp.close()
+            try:
+                resp = egress.session.request(method, url, headers=headers, proxies=egress.proxies, **kwargs)
+            except requests.RequestException:
+                self.report(egress, error=True)
+                resp = None
+                continue
+            self.report(egress, resp.status_code)
+            if resp.status_code not in THROTTLE_STATUS:
+                return resp
+
+    def snapshot(self):
+        with self.lock:
+            now = time.time()
+            return [dict(e.stats, name=e.name, evicted=e.evicted_until > now) for e in self.egresses]
+
+
+_egress_proxies = []
+_egress_pools = {}
+
+
+def configure_egress(proxies):
+    """设置出口列表（在创建平台客户端之前调用）；为空时各客户端照常使用自己的单个会话"""
+    global _egress_proxies
+    with _retry_policies_lock:
+        _egress_proxies = [normalize_proxy(p) for p in proxies or [] if p.strip()]
+        _egress_pools.clear()
+    return len(_egress_proxies)
+
+
+def get_egress_pool(source):
+    """取平台共享的出口会话池，未配置出口时返回 None"""
+    with _retry_policies_lock:
+        if not _egress_proxies:
+            return None
+        if source not in _egress_pools:
+            _egress_pools[source] = EgressPool(source, _egress_proxies)
+        return _egress_pools[source]
+
+
+def egress_stats():
+    """各平台出口的统计快照 {source: [出口统计]}"""
+    with _retry_policies_lock:
+        pools = list(_egress_pools.values())
+    return {pool.source: pool.snapshot() for pool in pools}
 
 
 def sanitize_filename(filename):
@@ -117,7 +826,7 @@ def extract_song_info_from_filename(filename):
 
 
 def scan_existing_songs(directory):
-    """扫描目录中已存在的歌曲
+    """扫描目录中已存在的歌曲（分片曲库直接读路径索引，不遍历目录）
     返回: set((singer, songname))
     """
     existing_songs = set()
@@ -125,6 +834,10 @@ def scan_existing_songs(directory):
     if not os.path.exists(directory):
         return existing_songs
     
+    library = get_library(directory)
+    if library.sharded:
+        return library.song_keys()
+    
     # 支持的音频文件扩展名
     audio_extensions = {'.mp3', '.flac', '.wav', '.m4a', '.aac', '.ogg', '.wma', '.ape'}
     
@@ -184,6 +897,387 @@ def filter_duplicate_songs(songs, existing_songs):
     return new_songs, skipped
 
 
+# ========== 分片曲库：首字母 / 歌手 / 专辑 ==========
+LIBRARY_LAYOUT_FILE = '.musicdl_layout.json'   # 曲库根目录下的布局标记，存在时按分片目录保存
+LIBRARY_INDEX_FILE = '.musicdl_index.jsonl'    # 分片曲库的路径索引，每行 [相对路径, 大小]，只追加
+LIBRARY_MIGRATE_WORKERS = 8     # 迁移时并行移动文件的线程数（网络共享上移动单个文件延迟很高）
+LIBRARY_AUDIO_EXTENSIONS = {'.mp3', '.flac', '.wav', '.m4a', '.aac', '.ogg', '.wma', '.ape'}
+LIBRARY_SIDECAR_EXTENSIONS = ('.lrc', '.jpg', '.png')  # 跟随音频一起移动的同名文件
+
+
+def _shard_dir_name(text, default):
+    return sanitize_filename(text or '')[:80].strip(' .') or default
+
+
+def shard_dirs(singers, album):
+    """分片目录 (首字母, 歌手, 专辑)；多位歌手时按第一位归档，非字母数字开头的归到 #"""
+    names = [name for name in re.split(r'\s*[,、/&;]\s*', singers or '') if name.strip()]
+    artist = _shard_dir_name(names[0] if names else '', '未知歌手')
+    first = artist[0].upper()
+    initial = '0-9' if first.isdigit() else first if first.isalnum() else '#'
+    return initial, artist, _shard_dir_name(album, '未知专辑')
+
+
+class MusicLibrary:
+    """曲库目录：平铺（文件直接放在根目录）或分片（首字母/歌手/专辑/文件名）
+    分片曲库的重复检测读路径索引，不遍历目录；其他进程 / 节点追加的索引行按偏移量增量读入
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.sharded = os.path.exists(os.path.join(root, LIBRARY_LAYOUT_FILE))
+        self.index_path = os.path.join(root, LIBRARY_INDEX_FILE)
+        self.lock = Lock()
+        self.entries = {}       # 相对路径 -> 大小
+        self.keys = set()       # (歌手, 歌名)，与 scan_existing_songs 的结果相同
+        self.index_offset = 0
+
+    def relpath(self, song):
+        filename = format_filename(song)
+        if not self.sharded:
+            return filename
+        return os.path.join(*shard_dirs(song.singers, song.album), filename)
+
+    def path_for(self, song):
+        return os.path.join(self.root, self.relpath(song))
+
+    def _remember(self, rel, size):
+        self.entries[rel] = size
+        info = extract_song_info_from_filename(os.path.basename(rel))
+        if info:
+            self.keys.add(info)
+
+    def load_index(self):
+        with self.lock:
+            try:
+                size = os.path.getsize(self.index_path)
+            except OSError:
+                size = 0
+            if size < self.index_offset:
+                # 索引被重建过，从头读
+                self.entries, self.keys, self.index_offset = {}, set(), 0
+            if size == self.index_offset:
+                return
+            with open(self.index_path, 'rb') as f:
+                f.seek(self.index_offset)
+                data = f.read(size - self.index_offset)
+            # 只处理完整的行，别的进程写到一半的行下次再读
+            end = data.rfind(b'\n') + 1
+            for line in data[:end].splitlines():
+                try:
+                    rel, file_size = json.loads(line)
+                except ValueError:
+                    continue
+                self._remember(os.path.join(*rel.split('/')), file_size)
+            self.index_offset += end
+
+    def add(self, path):
+        """登记一个新下载的文件"""
+        rel = os.path.relpath(path, self.root)
+        size = os.path.getsize(path)
+        line = json.dumps([rel.replace(os.sep, '/'), size], ensure_ascii=False) + '\n'
+        with self.lock:
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self._remember(rel, size)
+
+    def song_keys(self):
+        if not self.sharded:
+            return scan_existing_songs(self.root)
+        self.load_index()
+        with self.lock:
+            return set(self.keys)
+
+    def version(self):
+        """内容变化时会改变的标记：平铺曲库用目录的修改时间，分片曲库用已读入的索引长度；目录不存在时为 None"""
+        try:
+            mtime = os.stat(self.root).st_mtime_ns
+        except OSError:
+            return None
+        if not self.sharded:
+            return mtime
+        self.load_index()
+        return self.index_offset
+
+    def files(self):
+        """曲库中的音频文件 [(路径, 大小)]"""
+        if self.sharded:
+            self.load_index()
+            with self.lock:
+                return [(os.path.join(self.root, rel), size) for rel, size in self.entries.items()]
+        files = []
+        try:
+            for entry in os.scandir(self.root):
+                if os.path.splitext(entry.name)[1].lower() in LIBRARY_AUDIO_EXTENSIONS and entry.is_file():
+                    files.append((entry.path, entry.stat().st_size))
+        except OSError:
+            pass
+        return files
+
+
+_libraries = {}
+_libraries_lock = Lock()
+
+
+def get_library(root):
+    """曲库目录对应的 MusicLibrary（按目录缓存，布局标记变化时重新创建）"""
+    root = os.path.abspath(root)
+    sharded = os.path.exists(os.path.join(root, LIBRARY_LAYOUT_FILE))
+    with _libraries_lock:
+        library = _libraries.get(root)
+        if library is None or library.sharded != sharded:
+            library = _libraries[root] = MusicLibrary(root)
+        return library
+
+
+def library_path(save_dir, song):
+    """歌曲在曲库中的保存路径：平铺曲库为 save_dir/文件名，分片曲库为 save_dir/首字母/歌手/专辑/文件名"""
+    return get_library(save_dir).path_for(song)
+
+
+def _sharded_library_of(path):
+    path = os.path.abspath(path)
+    with _libraries_lock:
+        libraries = list(_libraries.values())
+    for library in libraries:
+        if library.sharded and path.startswith(library.root + os.sep):
+            return library
+    return None
+
+
+def register_library_file(path):
+    """下载完成后登记到所在分片曲库的路径索引（平铺曲库不需要索引）"""
+    library = _sharded_library_of(path)
+    if library is not None:
+        library.add(os.path.abspath(path))
+
+
+def rebuild_library_index(root):
+    """遍历分片曲库重建路径索引（跳过 . 开头的目录，如隔离目录），返回文件数"""
+    root = os.path.abspath(root)
+    lines = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() in LIBRARY_AUDIO_EXTENSIONS:
+                path = os.path.join(dirpath, filename)
+                rel = os.path.relpath(path, root).replace(os.sep, '/')
+                lines.append(json.dumps([rel, os.path.getsize(path)], ensure_ascii=False) + '\n')
+    index_path = os.path.join(root, LIBRARY_INDEX_FILE)
+    with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    os.replace(index_path + '.tmp', index_path)
+    return len(lines)
+
+
+def migrate_library(root, workers=LIBRARY_MIGRATE_WORKERS, on_progress=None):
+    """把平铺曲库迁移为分片布局：音频连同同名的歌词 / 封面并行移动到 首字母/歌手/专辑/ 下，
+    然后重建路径索引、写入布局标记；目标已存在的文件留在原处。对已分片的曲库再运行一次即重建索引
+    on_progress(done, total): 每移动完一首回调一次
+    返回: {'moved', 'skipped', 'failed', 'indexed'}
+    """
+    root = os.path.abspath(root)
+    entries = [entry for entry in os.scandir(root) if entry.is_file()]
+    audio = [entry for entry in entries if os.path.splitext(entry.name)[1].lower() in LIBRARY_AUDIO_EXTENSIONS]
+    sidecars = {}
+    for entry in entries:
+        stem, ext = os.path.splitext(entry.name)
+        if ext.lower() in LIBRARY_SIDECAR_EXTENSIONS:
+            sidecars.setdefault(stem, []).append(entry.name)
+    summary = {'moved': 0, 'skipped': 0, 'failed': 0}
+    lock = Lock()
+
+    def move(entry):
+        singer, _, album, _ = parse_library_filename(entry.name)
+        target_dir = os.path.join(root, *shard_dirs(singer, album))
+        target = os.path.join(target_dir, entry.name)
+        try:
+            if os.path.exists(target):
+                result = 'skipped'
+            else:
+                os.makedirs(target_dir, exist_ok=True)
+                os.replace(entry.path, target)
+                for name in sidecars.get(os.path.splitext(entry.name)[0], []):
+                    if not os.path.exists(os.path.join(target_dir, name)):
+                        os.replace(os.path.join(root, name), os.path.join(target_dir, name))
+                result = 'moved'
+        except OSError:
+            result = 'failed'
+        with lock:
+            summary[result] += 1
+            if on_progress:
+                on_progress(sum(summary.values()), len(audio))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(move, audio))
+    # 先写索引再写标记：中途中断时曲库仍按平铺处理，再运行一次会接着迁移
+    summary['indexed'] = rebuild_library_index(root)
+    with open(os.path.join(root, LIBRARY_LAYOUT_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'layout': 'sharded', 'version': 1}, f)
+    return summary
+
+
+# ========== 本地曲库索引：先查本地再搜网络 ==========
+LOCAL_SOURCE = 'Local'          # 本地曲库结果分组的来源名
+LOCAL_RESULT_LIMIT = 50         # 本地结果最多显示的条数
+
+
+def _index_text(text):
+    """索引用的文本：小写，去掉空白和标点"""
+    return re.sub(r'[\W_]+', '', (text or '').lower())
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def parse_library_filename(filename):
+    """按 format_filename 的格式拆出 (歌手, 歌名, 专辑, 音质)，不符合格式时整个文件名当作歌名"""
+    name = os.path.splitext(filename)[0]
+    match = re.match(r'^(.+?)\s+-\s+(.+?)(?:\s*\(([^()]*)\))?(?:\s*\[([^\[\]]*)\])?$', name)
+    if not match:
+        return '', name.strip(), '', ''
+    return tuple((group or '').strip() for group in match.groups())
+
+
+class LibraryIndex:
+    """曲库全文索引：歌手 / 歌名 / 专辑的二元组倒排表，搜索网络之前先在本地查一遍
+    中文歌名多为两三个字，用二元组而不是三元组，两个字的查询也能走索引；候选再做一次子串校验
+    曲库内容变化（平铺曲库的目录修改时间、分片曲库的路径索引）时才重新建立
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.songs = []
+        self.texts = []
+        self.postings = {}      # 二元组 -> 按顺序排列的歌曲下标
+        self.version = -1
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.songs)
+
+    def refresh(self):
+        library = get_library(self.directory)
+        version = library.version()
+        with self.lock:
+            if version == self.version:
+                return
+            songs, texts, postings = [], [], {}
+            for path, size in (library.files() if version is not None else []):
+                name = os.path.basename(path)
+                ext = os.path.splitext(name)[1].lower()
+                singer, title, album, quality = parse_library_filename(name)
+                song = SongInfo(source=LOCAL_SOURCE, singers=singer, song_name=title, album=album, ext=ext[1:],
+                                file_size_bytes=size, file_size=f"{size / 1024 / 1024:.2f} MB")
+                song.raw_data = {'download': {'data': {'quality': quality}}} if quality else {}
+                song._save_path = path
+                song._source_platform = LOCAL_SOURCE
+                text = _index_text(singer) + _index_text(title) + _index_text(album)
+                for gram in _bigrams(text):
+                    postings.setdefault(gram, []).append(len(songs))
+                songs.append(song)
+                texts.append(text)
+            self.songs, self.texts, self.postings, self.version = songs, texts, postings, version
+
+    def search(self, keyword, limit=LOCAL_RESULT_LIMIT):
+        """曲库中匹配关键词的歌曲；空格分开的每个词都要出现在歌手、歌名或专辑中，歌名命中的排在前面"""
+        self.refresh()
+        terms = [term for term in (_index_text(word) for word in (keyword or '').split()) if term]
+        if not terms:
+            return []
+        with self.lock:
+            candidates = None
+            for gram in set().union(*(_bigrams(term) for term in terms)):
+                ids = self.postings.get(gram, ())
+                candidates = set(ids) if candidates is None else candidates.intersection(ids)
+                if not candidates:
+                    return []
+            # 只有单字的查询没有二元组，逐条比对
+            ids = sorted(candidates) if candidates is not None else range(len(self.songs))
+            hits = [i for i in ids if all(term in self.texts[i] for term in terms)]
+            hits.sort(key=lambda i: not any(term in _index_text(self.songs[i].song_name) for term in terms))
+            return [self.songs[i] for i in hits[:limit]]
+
+
+# ========== 结果排序：相关度 + 音质 + 大小 ==========
+RANK_MATCH_WEIGHT = 0.7         # 关键词与歌名/歌手的相似度
+RANK_QUALITY_WEIGHT = 0.2       # 音质（无损 > 320k > 128k）
+RANK_SIZE_WEIGHT = 0.1          # 文件大小，同音质时大文件通常是完整版
+RANK_SIZE_FULL_MB = 40          # 文件大小得分在这个大小时达到满分（按对数增长）
+LOSSLESS_EXTENSIONS = {'flac', 'ape', 'wav'}
+
+
+class RelevanceRanker:
+    """按相关度给流式到达的搜索结果排序：
+    关键词只预处理一次（SequenceMatcher 缓存了关键词一侧的分析），每批结果逐首打分后用二分插入有序表，
+    add 返回每首歌在当前排名中的位置，界面直接插到该位置，不需要每来一批就整体重排
+    """
+
+    def __init__(self, keyword):
+        self.keyword = _index_text(keyword)
+        self.terms = [term for term in (_index_text(word) for word in (keyword or '').split()) if term]
+        self.matcher = SequenceMatcher(None, '', self.keyword, autojunk=False)
+        self.keys = []          # 升序的 (-得分, 到达序号)
+        self.songs = {}         # 到达序号 -> 歌曲
+        self.lock = Lock()
+
+    def _match_score(self, song):
+        title = _index_text(song.song_name)
+        singer = _index_text(song.singers)
+        if not self.keyword:
+            return 0.0
+        ratio = 0.0
+        for text in (title, singer + title, title + singer):
+            self.matcher.set_seq1(text)
+            ratio = max(ratio, self.matcher.ratio())
+        # 关键词中的每个词都出现在歌名或歌手中时，额外加分
+        text = singer + title
+        coverage = sum(term in text for term in self.terms) / len(self.terms) if self.terms else 0.0
+        return ratio * 0.6 + coverage * 0.4
+
+    @staticmethod
+    def _quality_score(song):
+        if (song.ext or '').lower() in LOSSLESS_EXTENSIONS:
+            return 1.0
+        quality = str(get_song_quality(song)).lower()
+        if any(word in quality for word in ('无损', 'flac', 'lossless', 'hires', 'hi-res', 'sq')):
+            return 1.0
+        match = re.search(r'(\d{2,4})\s*k', quality)
+        if match:
+            return min(int(match.group(1)) / 320, 1.0) * 0.8
+        return 0.4
+
+    @staticmethod
+    def _size_score(song):
+        size_mb = (song.file_size_bytes or 0) / 1024 / 1024
+        return min(1.0, math.log1p(size_mb) / math.log1p(RANK_SIZE_FULL_MB))
+
+    def score(self, song):
+        return (self._match_score(song) * RANK_MATCH_WEIGHT + self._quality_score(song) * RANK_QUALITY_WEIGHT
+                + self._size_score(song) * RANK_SIZE_WEIGHT)
+
+    def add(self, songs):
+        """加入一批结果，返回每首歌插入时在排名中的位置（按顺序逐个插入即得到当前排名）；
+        得分记在 song._relevance 上，同分时先到的在前
+        """
+        positions = []
+        with self.lock:
+            for song in songs:
+                song._relevance = self.score(song)
+                key = (-song._relevance, len(self.songs))
+                position = bisect.bisect(self.keys, key)
+                self.keys.insert(position, key)
+                self.songs[key[1]] = song
+                positions.append(position)
+        return positions
+
+    def ranked(self):
+        """当前排名中的全部歌曲"""
+        with self.lock:
+            return [self.songs[seq] for _, seq in self.keys]
+
+
 def print_progress_bar(current, total, prefix='', suffix='', length=50):
     """打印进度条"""
     if total == 0:
@@ -198,22 +1292,41 @@ def print_progress_bar(current, total, prefix='', suffix='', length=50):
         sys.stdout.flush()
 
 
-def search_single_platform(client, source_name, keyword, progress_lock, completed_count, total_count):
-    """搜索单个平台，带进度显示"""
+def search_single_platform(client, source_name, keyword, progress_lock, completed_count, total_count,
+                           search_cache=None, search_size=None, cancel_token=None, link_check=None):
+    """搜索单个平台，带进度显示
+    search_cache: SearchResultCache，命中时直接使用缓存（或正在进行的预取）的结果
+    link_check: 客户端的链接验证模式，不同模式的结果分开缓存
+    cancel_token: 已取消时不再发起搜索
+    """
     try:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
         # 执行搜索
-        result = client.music_clients[source_name].search(
-            keyword=keyword,
-            num_threadings=client.clients_threadings.get(source_name, 5)
-        )
+        def do_search():
+            result = client.music_clients[source_name].search(
+                keyword=keyword,
+                num_threadings=client.clients_threadings.get(source_name, 5)
+            )
+            # 客户端内部会吞掉请求异常，取消后返回的残缺结果不能进缓存
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            return result
+        
+        if search_cache is not None:
+            result, cached = search_cache.fetch(source_name, keyword, search_size, link_check, do_search)
+        else:
+            result, cached = do_search(), False
         
         # 更新进度
         with progress_lock:
             completed_count[0] += 1
             count = completed_count[0]
-            print(f"\n✓ [{count}/{total_count}] {source_name} 完成 - 找到 {len(result)} 首")
+            print(f"\n✓ [{count}/{total_count}] {source_name} 完成 - 找到 {len(result)} 首{' (缓存)' if cached else ''}")
         
         return source_name, result
+    except OperationCancelled:
+        return source_name, []
     except Exception as e:
         with progress_lock:
             completed_count[0] += 1
@@ -222,21 +1335,29 @@ def search_single_platform(client, source_name, keyword, progress_lock, complete
         return source_name, []
 
 
-def parallel_search(music_client, sources, keyword, search_size):
-    """并行搜索多个平台，实时显示进度"""
+def parallel_search(music_client, sources, keyword, search_size, search_cache=None, cancel_token=None,
+                    link_check=None):
+    """并行搜索多个平台，实时显示进度
+    cancel_token: 被取消（或按下 Ctrl+C）时中止搜索并抛出 OperationCancelled
+    """
     print(f"\n{'=' * 80}")
     print(f"🔍 开始并行搜索: '{keyword}'")
     print(f"   平台数: {len(sources)} | 每平台: {search_size} 结果")
     print('=' * 80)
     
     start_time = time.time()
+    retry_before = retry_stats()
+    link_before = link_check_stats()
     results = {}
     progress_lock = Lock()
     completed_count = [0]
     total_count = len(sources)
     
+    cancel_token = cancel_token or CancelToken()
+    
     # 使用线程池并行搜索
-    with ThreadPoolExecutor(max_workers=min(len(sources), 10)) as executor:
+    executor = ThreadPoolExecutor(max_workers=min(len(sources), 10))
+    try:
         # 提交所有搜索任务
         future_to_source = {
             executor.submit(
@@ -246,104 +1367,2715 @@ def parallel_search(music_client, sources, keyword, search_size):
                 keyword,
                 progress_lock,
                 completed_count,
-                total_count
+                total_count,
+                search_cache,
+                search_size,
+                cancel_token,
+                link_check
             ): source for source in sources
         }
         
         # 收集结果
-        for future in as_completed(future_to_source):
+        for future in iter_completed(future_to_source, cancel_token):
             source_name, result = future.result()
             results[source_name] = result
+    except (KeyboardInterrupt, OperationCancelled):
+        cancel_token.cancel()
+        print(f"\n\n⏹  搜索已取消")
+        raise OperationCancelled()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
     
     elapsed = time.time() - start_time
     total_songs = sum(len(songs) for songs in results.values())
     print(f"\n{'=' * 80}")
     print(f"✅ 搜索完成！耗时 {elapsed:.1f} 秒 | 共找到 {total_songs} 首")
+    memory_profiler.checkpoint(f"搜索完成: {keyword}")
+    retry_summary = format_retry_summary(retry_before)
+    if retry_summary:
+        print(f"   请求: {retry_summary}")
+    link_summary = format_link_check_summary(link_before)
+    if link_summary:
+        print(f"   {link_summary}")
     print('=' * 80)
     
     return results
 
 
-def download_single_song(music_client, song, save_dir, completed_count, total_count, download_lock):
-    """下载单首歌曲，带进度显示"""
+# ========== 分页规划：大搜索量时并行请求各页 ==========
+SEARCH_MAX_PAGE_SIZE = 20       # 未登记平台的单页上限
+SEARCH_MAX_CONCURRENT_PAGES = 4 # 未登记平台同时请求的页数上限
+# 各平台搜索接口单页能返回的条数上限（再大会被截断或报错）和同时请求的页数上限（太多容易被限流）
+PLATFORM_PAGE_LIMITS = {
+    'KugouMusicClient': (30, 4),
+    'NeteaseMusicClient': (100, 4),
+    'QQMusicClient': (30, 3),
+    'KuwoMusicClient': (50, 4),
+    'MiguMusicClient': (20, 3),
+    'QianqianMusicClient': (20, 3),
+}
+
+
+def plan_search_pages(source, search_size):
+    """按平台的单页上限规划一次搜索，返回 (每页条数, 页数, 并发请求数)
+    一页放得下时只请求一页；放不下时按上限均分成若干页（避免最后一页只有几条），由客户端并行请求、按页序合并
+    """
+    max_page_size, max_concurrent = PLATFORM_PAGE_LIMITS.get(source, (SEARCH_MAX_PAGE_SIZE, SEARCH_MAX_CONCURRENT_PAGES))
+    search_size = max(1, int(search_size))
+    pages = -(-search_size // max_page_size)
+    page_size = -(-search_size // pages)
+    return page_size, pages, min(pages, max_concurrent)
+
+
+def search_client_cfg(source, search_size, **cfg):
+    """按分页规划生成平台客户端的搜索配置"""
+    page_size, _, _ = plan_search_pages(source, search_size)
+    return {'search_size_per_source': search_size, 'search_size_per_page': page_size, **cfg}
+
+
+# ========== 分页加载 ==========
+class PlatformPager:
+    """单个平台的分页游标：首次搜索只取一小页，之后每次 next_page() 复用同一个客户端（和会话）只请求下一页
+    client: 已完成首次搜索的平台客户端，页大小取 client.search_size_per_page
+    first_page: 首次搜索的结果，用于跳过已加载的页并在后续页中去重
+    """
+    def __init__(self, client, keyword, first_page=None):
+        self.client = client
+        self.keyword = keyword
+        self.page_size = max(1, client.search_size_per_page)
+        # 首次搜索请求了 search_size_per_source 条，按页大小向上取整就是已加载的页数
+        self.pages = -(-max(1, client.search_size_per_source) // self.page_size)
+        self.seen = {self._key(song) for song in (first_page or [])}
+        self.exhausted = False
+        self.lock = Lock()
+
+    @staticmethod
+    def _key(song):
+        return song.identifier or song_key(song)
+
+    def next_page(self, cancel_token=None):
+        """请求下一页，返回之前各页没有出现过的歌曲；没有更多结果时返回 []"""
+        with self.lock:
+            if self.exhausted:
+                return []
+            client = self.client
+            # 平台客户端按 search_size_per_source 生成全部页的请求，这里只取第 pages+1 页
+            saved = (client.search_size_per_source, client.search_size_per_page)
+            client.search_size_per_page = self.page_size
+            client.search_size_per_source = (self.pages + 1) * self.page_size
+            try:
+                request_overrides = {}
+                search_urls = client._constructsearchurls(keyword=self.keyword, rule={}, request_overrides=request_overrides)
+            finally:
+                client.search_size_per_source, client.search_size_per_page = saved
+            if len(search_urls) <= self.pages:
+                self.exhausted = True
+                return []
+            found = []
+            client._search(self.keyword, search_urls[self.pages], request_overrides, found, TransferProgress())
+            # 客户端内部会吞掉请求异常，取消后的残缺结果不算作已加载的页
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            self.pages += 1
+            songs = []
+            for song in found:
+                key = self._key(song)
+                if song.with_valid_download_url and key not in self.seen:
+                    self.seen.add(key)
+                    songs.append(song)
+            if not found:
+                self.exhausted = True
+            return songs
+
+
+def load_more_pages(pagers, sources, cancel_token=None):
+    """并行为多个平台各加载下一页，返回 {平台: 新歌曲列表}"""
+    sources = [s for s in sources if s in pagers and not pagers[s].exhausted]
+    results = {}
+    if not sources:
+        print("\n⚠️ 所选平台没有更多结果了")
+        return results
+    print(f"\n🔍 正在加载更多: {len(sources)} 个平台")
+    cancel_token = cancel_token or CancelToken()
+    executor = ThreadPoolExecutor(max_workers=min(len(sources), 10))
     try:
-        # 设置保存路径
-        filename = format_filename(song)
-        song.work_dir = save_dir
-        song._save_path = os.path.join(save_dir, filename)
-        
-        source = song.source
-        
-        # 执行下载
-        with download_lock:
-            current = completed_count[0] + 1
-            print(f"\n[{current}/{total_count}] 📥 正在下载: {filename[:60]}...")
-        
-        music_client.music_clients[source].download(
-            song_infos=[song],
-            num_threadings=1  # 单首歌曲单线程
-        )
-        
-        with download_lock:
-            completed_count[0] += 1
-            current = completed_count[0]
-            if os.path.exists(song._save_path):
-                file_size = os.path.getsize(song._save_path)
-                size_mb = file_size / 1024 / 1024
-                print(f"   ✓ 完成 ({size_mb:.2f} MB) - {filename[:50]}...")
+        future_to_source = {executor.submit(pagers[s].next_page, cancel_token): s for s in sources}
+        for future in iter_completed(future_to_source, cancel_token):
+            source_name = future_to_source[future]
+            try:
+                results[source_name] = future.result()
+            except OperationCancelled:
+                raise
+            except Exception as e:
+                print(f"  ✗ {source_name} 失败: {str(e)[:50]}")
+                continue
+            pager = pagers[source_name]
+            if results[source_name]:
+                print(f"  ✓ {source_name} 第 {pager.pages} 页 - 新增 {len(results[source_name])} 首")
             else:
-                print(f"   ? 文件未找到 - {filename[:50]}...")
-        
-        return True
-    except Exception as e:
-        with download_lock:
-            completed_count[0] += 1
-            print(f"   ✗ 失败: {str(e)[:80]}")
-        return False
+                print(f"  - {source_name} 没有更多结果")
+    except (KeyboardInterrupt, OperationCancelled):
+        cancel_token.cancel()
+        print(f"\n⏹  加载已取消")
+        raise OperationCancelled()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    memory_profiler.checkpoint("加载更多")
+    return results
 
 
-def parallel_download(music_client, songs, save_dir, thread_count):
-    """并行下载多首歌曲，实时显示进度"""
-    if not songs:
-        return
-    
-    print(f"\n{'=' * 80}")
-    print(f"⬇️  开始并行下载")
-    print(f"   歌曲数: {len(songs)} | 线程数: {thread_count}")
-    print(f"   保存到: {save_dir}")
-    print('=' * 80)
-    
-    os.makedirs(save_dir, exist_ok=True)
-    start_time = time.time()
-    completed_count = [0]
-    total_count = len(songs)
-    download_lock = Lock()
-    
-    # 使用线程池并行下载
-    with ThreadPoolExecutor(max_workers=thread_count) as executor:
-        futures = [
-            executor.submit(
-                download_single_song,
-                music_client,
-                song,
-                save_dir,
-                completed_count,
-                total_count,
-                download_lock
-            ) for song in songs
-        ]
-        
-        # 等待所有下载完成
-        for future in as_completed(futures):
-            future.result()
-    
-    elapsed = time.time() - start_time
-    print(f"\n{'=' * 80}")
-    print(f"✅ 下载完成！耗时 {elapsed:.1f} 秒 | 共 {total_count} 首")
-    print('=' * 80)
+# ========== 搜索历史：前缀补全 / 预取缓存 ==========
+APP_DATA_DIR = os.path.join(os.path.expanduser("~"), ".musicdl")
+SEARCH_HISTORY_FILE = os.path.join(APP_DATA_DIR, "search_history.json")
+HISTORY_MAX_ENTRIES = 500       # 超出后淘汰得分最低的记录
+HISTORY_HALF_LIFE_DAYS = 30     # 搜索次数的权重每 30 天减半
+SEARCH_CACHE_TTL = 600          # 搜索结果缓存有效期（秒）
+SEARCH_CACHE_MAX_ENTRIES = 200
+PREFETCH_DELAY = 0.4            # 停止输入多久后开始预取（秒）
 
 
-def main():
+def normalize_keyword(keyword):
+    """统一关键词：小写、合并空白"""
+    return ' '.join((keyword or '').lower().split())
+
+
+class _TrieNode:
+    __slots__ = ('children', 'keys')
+
+    def __init__(self):
+        self.children = {}
+        self.keys = set()
+
+
+class SearchHistory:
+    """搜索历史索引：字典树做前缀匹配，按搜索次数 + 时间衰减排序，保存为 JSON
+    每个词的开头都建立索引，输入 "晴天" 也能补全出 "周杰伦 晴天"
+    """
+    def __init__(self, path=SEARCH_HISTORY_FILE, max_entries=HISTORY_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.entries = {}  # 规范化关键词 -> {'keyword', 'count', 'last'}
+        self.root = _TrieNode()
+        self.load()
+
+    def _index(self, key):
+        words = key.split(' ')
+        for i in range(len(words)):
+            node = self.root
+            for ch in ' '.join(words[i:]):
+                node = node.children.setdefault(ch, _TrieNode())
+                node.keys.add(key)
+
+    def _rebuild(self):
+        self.root = _TrieNode()
+        for key in self.entries:
+            self._index(key)
+
+    @staticmethod
+    def _score(entry, now):
+        age_days = max(0.0, now - entry['last']) / 86400
+        return entry['count'] * 0.5 ** (age_days / HISTORY_HALF_LIFE_DAYS)
+
+    def add(self, keyword):
+        """记录一次搜索"""
+        key = normalize_keyword(keyword)
+        if not key:
+            return
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.entries[key] = {'keyword': keyword.strip(), 'count': 1, 'last': now}
+                self._index(key)
+            else:
+                entry.update(keyword=keyword.strip(), count=entry['count'] + 1, last=now)
+            if len(self.entries) > self.max_entries:
+                ranked = sorted(self.entries, key=lambda k: self._score(self.entries[k], now), reverse=True)
+                self.entries = {k: self.entries[k] for k in ranked[:self.max_entries]}
+                self._rebuild()
+
+    def remove(self, keyword):
+        with self.lock:
+            if self.entries.pop(normalize_keyword(keyword), None) is not None:
+                self._rebuild()
+
+    def complete(self, prefix, limit=8):
+        """返回以 prefix 开头的历史关键词，得分高的在前"""
+        key = normalize_keyword(prefix)
+        if not key:
+            return []
+        now = time.time()
+        with self.lock:
+            node = self.root
+            for ch in key:
+                node = node.children.get(ch)
+                if node is None:
+                    return []
+            ranked = sorted(node.keys, key=lambda k: (self._score(self.entries[k], now), self.entries[k]['last']),
+                            reverse=True)
+            return [self.entries[k]['keyword'] for k in ranked[:limit]]
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self.lock:
+            for item in data.get('entries', []):
+                key = normalize_keyword(item.get('keyword'))
+                if key:
+                    self.entries[key] = {'keyword': item['keyword'], 'count': int(item.get('count', 1)),
+                                         'last': float(item.get('last', 0))}
+            self._rebuild()
+
+    def save(self):
+        """写入历史文件（先写临时文件再替换，失败时忽略，历史记录不影响使用）"""
+        with self.lock:
+            data = {'version': 1, 'entries': list(self.entries.values())}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+class SearchResultCache:
+    """搜索结果缓存：(平台, 关键词, 条数, 链接验证模式) -> 结果，过期时间 ttl 秒
+    不同验证模式得到的结果（如极速模式未验证的链接）互不复用
+    正在进行的搜索也会登记，同一个请求再次到来时等待它完成而不是重新搜索
+    """
+    def __init__(self, ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.entries = OrderedDict()  # key -> (开始时间, Future)
+
+    @staticmethod
+    def _key(source, keyword, size, link_check):
+        return (source, normalize_keyword(keyword), size, link_check)
+
+    def _fresh(self, entry):
+        return entry is not None and (not entry[1].done() or time.time() - entry[0] < self.ttl)
+
+    def contains(self, source, keyword, size, link_check):
+        with self.lock:
+            return self._fresh(self.entries.get(self._key(source, keyword, size, link_check)))
+
+    def fetch(self, source, keyword, size, link_check, search_fn):
+        """取缓存结果，没有时调用 search_fn() 搜索并缓存
+        返回: (结果列表, 是否来自缓存)
+        """
+        key = self._key(source, keyword, size, link_check)
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if self._fresh(entry):
+                    self.entries.move_to_end(key)
+                    future, owner = entry[1], False
+                else:
+                    future, owner = Future(), True
+                    self.entries[key] = (time.time(), future)
+                    while len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+            if owner:
+                break
+            try:
+                return list(future.result()), True
+            except OperationCancelled:
+                # 被等待的那次搜索中途取消了（条目已删除），由本次调用重新搜索
+                continue
+        try:
+            result = search_fn()
+        except BaseException as e:
+            # 失败的搜索不缓存
+            with self.lock:
+                if self.entries.get(key, (None, None))[1] is future:
+                    del self.entries[key]
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return list(result), False
+
+
+class SearchPrefetcher:
+    """预取：输入停顿 delay 秒后在后台调用 prefetch_fn(keyword, *args)，新的输入会取消尚未开始的预取"""
+    def __init__(self, prefetch_fn, delay=PREFETCH_DELAY):
+        self.prefetch_fn = prefetch_fn
+        self.delay = delay
+        self.lock = Lock()
+        self._timer = None
+
+    def schedule(self, keyword, *args):
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = Timer(self.delay, self._run, (keyword,) + args)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self):
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _run(self, keyword, *args):
+        try:
+            self.prefetch_fn(keyword, *args)
+        except Exception:
+            pass
+
+
+def prefetch_platforms(search_cache, search_fn, sources, keyword, size, link_check, executor):
+    """在 executor 中为各平台预取 keyword 的搜索结果（已缓存或正在搜索的跳过）
+    search_fn(source, keyword): 实际执行单平台搜索，使用 link_check 验证模式
+    """
+    for source in sources:
+        if not search_cache.contains(source, keyword, size, link_check):
+            executor.submit(search_cache.fetch, source, keyword, size, link_check,
+                            lambda source=source: search_fn(source, keyword))
+
+
+def enable_history_completion(history, on_complete=None):
+    """命令行输入时按 Tab 补全历史关键词（需要 readline）
+    on_complete(keyword): 补全出候选时回调，用于预取排名第一的候选
+    返回: 是否启用成功
+    """
+    if readline is None:
+        return False
+
+    def completer(text, state):
+        matches = history.complete(readline.get_line_buffer())
+        if state == 0 and matches and on_complete:
+            on_complete(matches[0])
+        return matches[state] if state < len(matches) else None
+
+    readline.set_completer_delims('')
+    readline.set_completer(completer)
+    readline.parse_and_bind('tab: complete')
+    # 上下方向键翻阅最近的搜索
+    readline.clear_history()
+    with history.lock:
+        recent = sorted(history.entries.values(), key=lambda e: e['last'])
+    for entry in recent[-50:]:
+        readline.add_history(entry['keyword'])
+    return True
+
+
+def disable_history_completion():
+    if readline is not None:
+        readline.set_completer(None)
+
+
+# ========== 单曲下载：字节进度 / 取消 / 多源对冲 ==========
+# 对冲下载：主源开始 HEDGE_GRACE_SECONDS 秒后速度仍低于 HEDGE_MIN_RATE，就启动下一个平台的备份下载
+HEDGE_MIN_RATE = 64 * 1024
+HEDGE_GRACE_SECONDS = 5
+HEDGE_MAX_PARALLEL = 2
+HEDGE_CHUNK_SIZE = 64 * 1024  # 小块读取，测速和取消更及时
+
+
+class DownloadCancelled(OperationCancelled):
+    """下载被取消"""
+
+
+class TransferProgress:
+    """模拟 rich.progress.Progress 的最小接口，传给 client._download 接收字节进度
+    on_bytes(n): 每写入一块数据时回调
+    on_total(total): 得知文件总大小时回调
+    cancel(): 在下一块数据到达时中止传输
+    """
+    def __init__(self, on_bytes=None, on_total=None):
+        self.on_bytes = on_bytes
+        self.on_total = on_total
+        self.tasks = {}
+        self.downloaded = 0
+        self.total = None
+        self.started_at = time.time()
+        self._cancel_event = Event()
+
+    def add_task(self, description='', total=None, completed=0, **fields):
+        task_id = len(self.tasks)
+        self.tasks[task_id] = SimpleNamespace(description=description, total=total, completed=completed)
+        return task_id
+
+    def update(self, task_id, total=None, completed=None, description=None, **fields):
+        task = self.tasks[task_id]
+        if total is not None and total != task.total:
+            task.total = total
+            self.total = total
+            if self.on_total:
+                self.on_total(total)
+        if completed is not None:
+            task.completed = completed
+        if description is not None:
+            task.description = description
+
+    def advance(self, task_id, advance=1):
+        if self._cancel_event.is_set():
+            raise DownloadCancelled()
+        self.tasks[task_id].completed += advance
+        self.downloaded += advance
+        if self.on_bytes:
+            self.on_bytes(advance)
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def rate(self):
+        """从开始到现在的平均速度（字节/秒）"""
+        elapsed = time.time() - self.started_at
+        return self.downloaded / elapsed if elapsed > 0 else 0.0
+
+
+PROGRESS_REPORT_INTERVAL = 0.5   # 进度回调的最小间隔（秒）
+PROGRESS_CHUNK_SIZE = 256 * 1024 # 汇报字节进度时的读取块大小，块太大时小文件的进度会一跳到底
+SPEED_WINDOW_SECONDS = 5         # 计算实时速度的时间窗口（秒）
+
+
+class ByteProgressAggregator:
+    """汇总多个下载线程的字节进度：单文件/总字节、实时速度和剩余时间
+    on_update(snapshot): 节流回调，至多每 interval 秒一次；在下载线程中持锁调用（保证快照按顺序送达），不要做耗时操作
+    """
+    def __init__(self, total_files, on_update=None, interval=PROGRESS_REPORT_INTERVAL):
+        self.total_files = total_files
+        self.on_update = on_update
+        self.interval = interval
+        self.lock = Lock()
+        self.files = {}
+        self.finished = 0
+        self.failed = 0
+        self.bytes_received = 0
+        self.started_at = time.time()
+        self._samples = deque([(self.started_at, 0)])
+        self._last_report = 0.0
+
+    def track(self, key, name=''):
+        """开始跟踪一个文件，返回 TransferProgress 的回调参数：TransferProgress(**callbacks)"""
+        with self.lock:
+            self.files[key] = {'name': name, 'downloaded': 0, 'total': None, 'done': False, 'failed': False}
+        return {
+            'on_bytes': lambda n: self._add_bytes(key, n),
+            'on_total': lambda total: self._set_total(key, total),
+        }
+
+    def _add_bytes(self, key, n):
+        with self.lock:
+            self.files[key]['downloaded'] += n
+            self.bytes_received += n
+            now = time.time()
+            if now - self._last_report >= self.interval:
+                self._report_locked(now)
+
+    def _set_total(self, key, total):
+        with self.lock:
+            self.files[key]['total'] = total
+
+    def finish(self, key, ok=True):
+        """文件结束（成功或失败），立即回调一次"""
+        with self.lock:
+            info = self.files.setdefault(key, {'name': '', 'downloaded': 0, 'total': None, 'done': False, 'failed': False})
+            if info['done']:
+                return
+            info['done'] = True
+            info['failed'] = not ok
+            self.finished += 1
+            self.failed += int(not ok)
+            if ok and info['total'] is None:
+                info['total'] = info['downloaded']
+            self._report_locked(time.time())
+
+    def _report_locked(self, now):
+        self._last_report = now
+        self._samples.append((now, self.bytes_received))
+        while len(self._samples) > 2 and now - self._samples[0][0] > SPEED_WINDOW_SECONDS:
+            self._samples.popleft()
+        if self.on_update:
+            self.on_update(self._snapshot_locked(now))
+
+    def snapshot(self):
+        with self.lock:
+            return self._snapshot_locked(time.time())
+
+    def _snapshot_locked(self, now):
+        first_time, first_bytes = self._samples[0]
+        rate = (self.bytes_received - first_bytes) / (now - first_time) if now > first_time else 0.0
+
+        # 失败的文件不计入总量；还没拿到大小的文件按已知文件的平均大小估算
+        files = [f for f in self.files.values() if not f['failed']]
+        known = [f for f in files if f['total']]
+        expected_files = max(self.total_files - self.failed, len(files))
+        bytes_done = sum(min(f['downloaded'], f['total'] or f['downloaded']) for f in files)
+        bytes_total = None
+        if known:
+            known_total = sum(f['total'] for f in known)
+            bytes_total = known_total + known_total / len(known) * (expected_files - len(known))
+            bytes_total = max(bytes_total, bytes_done)
+
+        if self.total_files and self.finished >= self.total_files:
+            percent = 100.0
+        elif bytes_total:
+            percent = 100.0 * bytes_done / bytes_total
+        else:
+            percent = 100.0 * self.finished / self.total_files if self.total_files else 0.0
+        eta = (bytes_total - bytes_done) / rate if bytes_total and rate > 0 else None
+        return {
+            'files_done': self.finished,
+            'files_failed': self.failed,
+            'total_files': self.total_files,
+            'bytes_done': bytes_done,
+            'bytes_total': bytes_total,
+            'estimated': len(known) < expected_files,
+            'rate': rate,
+            'eta': eta,
+            'percent': percent,
+            'elapsed': now - self.started_at,
+            'active': [
+                (f['name'], f['downloaded'], f['total'])
+                for f in self.files.values() if not f['done'] and f['downloaded']
+            ],
+        }
+
+
+def format_bytes(n):
+    """字节数 -> 可读字符串"""
+    if n is None:
+        return '?'
+    if n >= 1024 * 1024 * 1024:
+        return f"{n / 1024 / 1024 / 1024:.2f} GB"
+    if n >= 1024 * 1024:
+        return f"{n / 1024 / 1024:.1f} MB"
+    return f"{n / 1024:.0f} KB"
+
+
+def format_transfer_status(snapshot):
+    """进度快照 -> 一行状态文本，如：[3/10] 12.3 MB / 45.6 MB | 2.31 MB/s | 剩余 0:15"""
+    text = f"[{snapshot['files_done']}/{snapshot['total_files']}] {format_bytes(snapshot['bytes_done'])}"
+    if snapshot['bytes_total']:
+        text += f" / {'≈' if snapshot['estimated'] else ''}{format_bytes(snapshot['bytes_total'])}"
+    text += f" | {snapshot['rate'] / 1024 / 1024:.2f} MB/s"
+    if snapshot['eta'] is not None and snapshot['files_done'] < snapshot['total_files']:
+        minutes, seconds = divmod(int(snapshot['eta']), 60)
+        text += f" | 剩余 {minutes}:{seconds:02d}"
+    return text
+
+
+# ========== 下载结果校验：音频文件头 ==========
+AUDIO_HEAD_BYTES = 4096         # 只读取文件开头这么多字节判断格式
+AUDIO_MIN_SIZE_RATIO = 0.9      # 实际大小低于已知大小的该比例视为不完整
+AUDIO_REQUEUE_ATTEMPTS = 1      # 校验失败后重新获取链接再下载的次数
+QUARANTINE_DIR = '.quarantine'  # 隔离目录（保存目录下），不会被 scan_existing_songs 扫到
+
+audio_check_stats = {'checked': 0, 'quarantined': 0, 'recovered': 0}
+_audio_check_lock = Lock()
+
+
+def _count_audio_check(key):
+    with _audio_check_lock:
+        audio_check_stats[key] += 1
+
+
+def _is_mpeg_sync(b0, b1, b2):
+    """MPEG 音频帧头：11 位同步字，layer / 码率字段不能是保留值"""
+    return b0 == 0xFF and (b1 & 0xE0) == 0xE0 and (b1 >> 1) & 0x03 != 0 and (b2 >> 4) != 0x0F
+
+
+def sniff_audio_format(head):
+    """根据文件开头的字节判断容器格式，返回 'mp3' / 'flac' / 'm4a' 等，无法识别时返回 None"""
+    if head[:4] == b'fLaC':
+        return 'flac'
+    if head[4:8] == b'ftyp':
+        return 'm4a'
+    if head[:4] == b'OggS':
+        return 'ogg'
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return 'wav'
+    if head[:4] == b'MAC ':
+        return 'ape'
+    if head[:16] == bytes.fromhex('3026b2758e66cf11a6d900aa0062ce6c'):
+        return 'wma'
+    if len(head) > 188 and head[0] == 0x47 and head[188] == 0x47:
+        return 'ts'
+    if len(head) >= 3 and head[0] == 0xFF and (head[1] & 0xF6) == 0xF0:
+        return 'aac'
+    # 开头有少量垃圾数据的 MP3：在读到的范围内找帧同步字（文本内容里不会出现 0xFF）
+    for i in range(len(head) - 2):
+        if _is_mpeg_sync(head[i], head[i + 1], head[i + 2]):
+            return 'mp3'
+    return None
+
+
+def read_audio_head(path, size=AUDIO_HEAD_BYTES):
+    """读取音频数据的开头：有 ID3v2 标签时按标签头里的长度跳过（内嵌封面可能很大），不读整个文件"""
+    with open(path, 'rb') as f:
+        head = f.read(size)
+        if head[:3] == b'ID3' and len(head) >= 10:
+            tag_size = (head[6] & 0x7F) << 21 | (head[7] & 0x7F) << 14 | (head[8] & 0x7F) << 7 | (head[9] & 0x7F)
+            f.seek(10 + tag_size + (10 if head[5] & 0x10 else 0))
+            head = f.read(size)
+    return head
+
+
+def validate_audio_file(path, expected_size=None):
+    """下载完成后的快速校验：文件头是否是已知的音频格式，大小是否与已知大小相符
+    返回: None 表示正常，否则为问题描述
+    """
+    _count_audio_check('checked')
+    try:
+        size = os.path.getsize(path)
+        head = read_audio_head(path) if size else b''
+    except OSError as e:
+        return f"无法读取: {e}"
+    if not size:
+        return "文件为空"
+    if expected_size and size < expected_size * AUDIO_MIN_SIZE_RATIO:
+        return f"文件不完整 ({format_bytes(size)} / {format_bytes(expected_size)})"
+    if sniff_audio_format(head) is None:
+        text = head.lstrip()[:64].lower()
+        if text.startswith((b'<', b'{', b'[')) or b'html' in text:
+            return "内容是网页或错误信息，不是音频"
+        return "无法识别的音频格式"
+    return None
+
+
+def quarantine_file(path, reason):
+    """把校验失败的文件移到同目录（分片曲库为曲库根目录）下的隔离目录并记录原因，返回新路径"""
+    library = _sharded_library_of(path)
+    quarantine_dir = os.path.join(library.root if library else os.path.dirname(path), QUARANTINE_DIR)
+    os.makedirs(quarantine_dir, exist_ok=True)
+    target = os.path.join(quarantine_dir, f"{time.strftime('%Y%m%d-%H%M%S')} {os.path.basename(path)}")
+    os.replace(path, target)
+    try:
+        with open(os.path.join(quarantine_dir, 'quarantine.log'), 'a', encoding='utf-8') as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{os.path.basename(path)}\t{reason}\n")
+    except OSError:
+        pass
+    _count_audio_check('quarantined')
+    return target
+
+
+def format_audio_check_summary(since=None):
+    """本次下载期间隔离 / 重新下载成功的文件数，没有隔离时返回空字符串"""
+    since = since or {}
+    quarantined = audio_check_stats['quarantined'] - since.get('quarantined', 0)
+    recovered = audio_check_stats['recovered'] - since.get('recovered', 0)
+    if not quarantined:
+        return ''
+    return f"校验: 隔离 {quarantined} 个无效文件，重新下载成功 {recovered} 首"
+
+
+# ========== 下载链接预解析 ==========
+URL_RESOLVE_WORKERS = 4
+URL_RESOLVE_TOP_N = 10          # 搜索完成后预解析的结果条数
+URL_CACHE_TTL = 300             # 链接里没有过期时间时的缓存时长（秒）
+URL_EXPIRY_MARGIN = 60          # 距离链接过期不足该秒数时视为已过期
+URL_CACHE_MAX_ENTRIES = 1000
+# 常见 CDN 签名链接里表示过期时间（Unix 时间戳）的参数
+URL_EXPIRY_PARAMS = ('expires', 'expire', 'e', 'x-expires', 'x-oss-expires', 'deadline', 'validtime', 't')
+
+
+def parse_url_expiry(url):
+    """从签名链接的查询参数中读取过期时间戳，读不到时返回 None"""
+    try:
+        params = {k.lower(): v for k, v in parse_qsl(urlsplit(url).query)}
+    except ValueError:
+        return None
+    for name in URL_EXPIRY_PARAMS:
+        value = params.get(name, '')
+        if value.isdigit() and 1e9 < int(value) < 1e10:
+            return int(value)
+    return None
+
+
+def response_total_size(resp):
+    """响应对应的完整文件大小：206 部分响应的 Content-Length 只是本段长度，总大小取 Content-Range 的 /total；
+    200 时取 Content-Length；都读不到时返回 None
+    """
+    if resp.status_code == 206:
+        total = (resp.headers.get('Content-Range') or '').rpartition('/')[2].strip()
+        return int(total) if total.isdigit() else None
+    length = str(resp.headers.get('Content-Length') or '').strip()
+    return int(length) if resp.status_code == 200 and length.isdigit() else None
+
+
+class DownloadUrlResolver:
+    """下载链接预解析：在用户确认下载之前，后台跟随跳转拿到最终链接和文件大小，
+    按链接自身的过期时间（或 URL_CACHE_TTL）缓存。download_song_file 会先查这里，
+    命中时直接请求最终链接，已知失效的链接立即返回失败。
+    """
+    def __init__(self, workers=URL_RESOLVE_WORKERS, ttl=URL_CACHE_TTL, max_entries=URL_CACHE_MAX_ENTRIES):
+        self.workers = workers
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.entries = OrderedDict()  # 原始链接 -> {'ok', 'url', 'size', 'expires_at'}
+        self.pending = {}
+        self._pool = None
+        self.stats = {'resolved': 0, 'hits': 0, 'dead': 0}
+
+    def _get_pool(self):
+        with self.lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='url-resolver')
+            return self._pool
+
+    def lookup(self, url):
+        """返回未过期的解析结果，没有时返回 None"""
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return None
+            if entry['expires_at'] - URL_EXPIRY_MARGIN <= time.time():
+                del self.entries[url]
+                return None
+            return entry
+
+    def resolve(self, client, song):
+        """同步解析一首歌的下载链接：带 Range 的 GET 只取响应头，不下载内容
+        只有确定的结果才缓存（有效，或 404/410/返回网页）；超时等情况下次下载时照常请求
+        """
+        url = song.download_url
+        headers = dict(getattr(client, 'default_download_headers', None) or {})
+        headers.update(song.default_download_headers or {})
+        cookies = song.default_download_cookies or getattr(client, 'default_download_cookies', None) or {}
+        tester = AudioLinkTester(timeout=(5, 10), headers=headers, cookies=cookies)
+        try:
+            info = tester.request('GET', url, range_bytes=(0, 0))
+            info['resp'].close()
+        except Exception:
+            return None
+        finally:
+            tester.session.close()
+        ctype = AudioLinkTester.normalizectype(info['ctype']) or ''
+        ok = info['ok'] and not ctype.startswith('text/')
+        if not info['ok'] and info['status_code'] not in (404, 410):
+            return None
+        final_url = info['download_url'] or url
+        expiry = parse_url_expiry(final_url) or parse_url_expiry(url)
+        entry = {
+            'ok': ok,
+            'url': final_url,
+            'size': response_total_size(info['resp']),
+            'expires_at': min(expiry, time.time() + self.ttl * 4) if expiry else time.time() + self.ttl,
+        }
+        with self.lock:
+            self.entries[url] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.stats['resolved'] += 1
+            self.stats['dead'] += int(not ok)
+        return entry
+
+    def prefetch(self, get_client, songs):
+        """在后台预解析 songs 的下载链接（已缓存或正在解析的跳过）
+        get_client: source -> 平台客户端
+        """
+        pool = self._get_pool()
+        for song in songs:
+            url = song.download_url
+            if not isinstance(url, str) or not url.startswith('http') or (song.protocol or 'HTTP').upper() != 'HTTP':
+                continue
+            if self.lookup(url) is not None:
+                continue
+            with self.lock:
+                if url in self.pending:
+                    continue
+                self.pending[url] = pool.submit(self._prefetch_one, get_client, song, url)
+
+    def _prefetch_one(self, get_client, song, url):
+        try:
+            return self.resolve(get_client(song.source), song)
+        except Exception:
+            return None
+        finally:
+            with self.lock:
+                self.pending.pop(url, None)
+
+    def apply(self, song):
+        """下载前调用：命中缓存时把 song 的链接换成最终链接并补上文件大小
+        返回: True 命中且有效 / False 已知失效 / None 未解析
+        """
+        url = song.download_url
+        if not isinstance(url, str):
+            return None
+        entry = self.lookup(url)
+        if entry is None:
+            return None
+        with self.lock:
+            self.stats['hits'] += 1
+        if not entry['ok']:
+            return False
+        song.download_url = entry['url']
+        if entry['size'] and not song.file_size_bytes:
+            song.file_size_bytes = entry['size']
+        return True
+
+
+# 进程内共享的链接缓存：搜索结果出来后预解析，下载时先查
+url_resolver = DownloadUrlResolver()
+
+
+# 进程内共享：同一首歌下载到同一路径的并发调用只下载一次
+download_flights = SingleFlight()
+
+
+def download_song_file(client, song, save_path, progress=None, auto_supplement_song=True, cancel_token=None):
+    """通过平台客户端把单首歌曲下载到 save_path
+    下载完成后校验文件头，不是有效音频时移入隔离目录，在原平台重新获取链接后再下载（AUDIO_REQUEUE_ATTEMPTS 次）
+    同一首歌（平台, 曲目ID）正在下载到同一路径时不再重复下载，等待并共享那次下载的结果
+    progress: TransferProgress，用于字节回调和取消
+    cancel_token: CancelToken，取消时在下一个数据块中止传输
+    返回: bool，被取消时抛出 DownloadCancelled
+    """
+    key = (song.source, str(song.identifier), os.path.abspath(save_path))
+    ok, shared = download_flights.do(
+        key, lambda: _download_song_file(client, song, save_path, progress, auto_supplement_song, cancel_token),
+        cancel_token
+    )
+    if shared:
+        song.work_dir = os.path.dirname(save_path)
+        song._save_path = save_path
+    return ok
+
+
+def _download_song_file(client, song, save_path, progress, auto_supplement_song, cancel_token):
+    if cancel_token is not None and cancel_token.cancelled:
+        raise DownloadCancelled()
+    if getattr(song, '_loaded_at', None) and not revalidate_loaded_song(client, song):
+        return False
+    if not song.with_valid_download_url or url_resolver.apply(song) is False:
+        return False
+    if progress is None:
+        progress = TransferProgress()
+    elif progress.on_bytes and (song.chunk_size or 0) > PROGRESS_CHUNK_SIZE:
+        song.chunk_size = PROGRESS_CHUNK_SIZE
+    if cancel_token is not None:
+        cancel_token.on_cancel(progress.cancel)
+    song.work_dir = os.path.dirname(save_path)
+    song._save_path = save_path
+    # 分片曲库的 首字母/歌手/专辑 目录在第一次下载时创建
+    os.makedirs(song.work_dir, exist_ok=True)
+    for attempt in range(AUDIO_REQUEUE_ATTEMPTS + 1):
+        downloaded = []
+        task_id = progress.add_task(song.song_name or '', total=None)
+        client._download(song, {}, downloaded, progress, task_id, auto_supplement_song)
+        if progress.cancelled:
+            if os.path.exists(save_path):
+                os.remove(save_path)
+            raise DownloadCancelled()
+        if not (downloaded and os.path.exists(save_path)):
+            return False
+        problem = validate_audio_file(save_path, song.file_size_bytes)
+        if problem is None:
+            if attempt:
+                _count_audio_check('recovered')
+            if not save_path.endswith('.part'):
+                register_library_file(save_path)
+            return True
+        quarantine_file(save_path, problem)
+        if attempt == AUDIO_REQUEUE_ATTEMPTS:
+            return False
+        # 错误页多半来自过期或被限流的链接，换一个新链接再试
+        try:
+            refresh_download_url(client, song)
+        except OperationCancelled:
+            raise
+        except Exception:
+            pass
+    return False
+
+
+def song_key(song):
+    """歌曲去重键：(歌手, 歌名)，统一小写"""
+    singer = (song.singers or '未知歌手').strip().lower()
+    songname = (song.song_name or '未知歌曲').strip().lower()
+    return (singer, songname)
+
+
+def find_song_candidates(song, song_pool):
+    """在搜索结果中找到同一首歌在其他平台的副本
+    返回: [song, 其他平台副本...]，每个平台只保留文件最大的一份
+    """
+    key = song_key(song)
+    best_per_source = {}
+    for other in song_pool:
+        if other is song or other.source == song.source or song_key(other) != key:
+            continue
+        current = best_per_source.get(other.source)
+        if current is None or (other.file_size_bytes or 0) > (current.file_size_bytes or 0):
+            best_per_source[other.source] = other
+    alternatives = sorted(best_per_source.values(), key=lambda s: s.file_size_bytes or 0, reverse=True)
+    return [song] + alternatives
+
+
+def hedged_download(get_client, candidates, save_dir, min_rate=HEDGE_MIN_RATE, grace_seconds=HEDGE_GRACE_SECONDS,
+                    progress_callbacks=None, cancel_token=None):
+    """多源对冲下载：先从第一个候选源下载，速度过慢时启动下一个源作为备份，
+    谁先完成就保留谁，其余传输被取消；某个源失败时自动换下一个候选。
+    get_client: source -> 平台客户端
+    progress_callbacks: 传给每个源的 TransferProgress 的字节回调（见 ByteProgressAggregator.track）
+    cancel_token: 取消时中止所有源的传输并抛出 DownloadCancelled
+    返回: (成功的歌曲, 保存路径) 或 (None, None)
+    """
+    pending = list(candidates)
+    running = {}
+    winner = None
+    pool = ThreadPoolExecutor(max_workers=HEDGE_MAX_PARALLEL)
+
+    def launch():
+        song = pending.pop(0)
+        part_path = f"{library_path(save_dir, song)}.{song.source}.part"
+        progress = TransferProgress(**(progress_callbacks or {}))
+        attempt = copy.copy(song)
+        attempt.chunk_size = HEDGE_CHUNK_SIZE
+        future = pool.submit(download_song_file, get_client(song.source), attempt, part_path, progress, False,
+                             cancel_token)
+        running[future] = (song, progress, part_path)
+
+    try:
+        launch()
+        while running and winner is None:
+            if cancel_token is not None and cancel_token.cancelled:
+                raise DownloadCancelled()
+            done, _ = wait(list(running), timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                song, progress, part_path = running.pop(future)
+                try:
+                    ok = future.result()
+                except Exception:
+                    ok = False
+                if ok and winner is None:
+                    winner = (song, part_path)
+                elif os.path.exists(part_path):
+                    os.remove(part_path)
+            if winner is not None:
+                break
+            if not running and pending:
+                # 所有在跑的源都失败了，回退到下一个候选
+                launch()
+            elif pending and len(running) < HEDGE_MAX_PARALLEL:
+                slow = all(
+                    time.time() - progress.started_at >= grace_seconds and progress.rate() < min_rate
+                    for _, progress, _ in running.values()
+                )
+                if slow:
+                    launch()
+    finally:
+        for _, progress, _ in running.values():
+            progress.cancel()
+        pool.shutdown(wait=False)
+
+    if winner is None:
+        return None, None
+    song, part_path = winner
+    save_path = library_path(save_dir, song)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    os.replace(part_path, save_path)
+    register_library_file(save_path)
+    song.work_dir = os.path.dirname(save_path)
+    song._save_path = save_path
+    return song, save_path
+
+
+# ========== 下载后处理：标签与封面 ==========
+POSTPROCESS_WORKERS = 2
+COVER_FETCH_WORKERS = 4         # 封面与音频同时获取，用单独的线程池，不占下载线程
+COVER_CACHE_DIR = os.path.join(APP_DATA_DIR, "covers")  # 专辑封面的磁盘缓存，下次下载同一专辑时直接使用
+COVER_CACHE_MAX_ENTRIES = 500   # 内存中最多记住的专辑数，最久未用的先淘汰（磁盘缓存不受影响）
+
+
+class AlbumCoverCache:
+    """专辑封面缓存：同一专辑的封面只下载一次，并发请求共享同一次下载；
+    下载过的封面按专辑保存在 cache_dir 中，之后的运行也不再重复请求
+    """
+
+    def __init__(self, cache_dir=None, workers=COVER_FETCH_WORKERS, max_entries=COVER_CACHE_MAX_ENTRIES):
+        self.cache_dir = cache_dir or COVER_CACHE_DIR
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.entries = OrderedDict()  # 专辑 -> Future
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.stats = {'fetched': 0, 'disk_hits': 0}
+
+    @staticmethod
+    def album_key(song):
+        """同一歌手同一专辑视为同一封面；没有专辑信息时按封面地址区分"""
+        album = (song.album or '').strip().lower()
+        if album and album not in ('null', 'none', '未知专辑'):
+            return ((song.singers or '').strip().lower(), album)
+        return ('', song.cover_url)
+
+    def prefetch(self, song):
+        """在后台开始获取封面，立即返回 Future（结果为本地封面路径或 None）；无封面时返回 None"""
+        if not song.cover_url or not str(song.cover_url).startswith('http'):
+            return None
+        key = self.album_key(song)
+        with self.lock:
+            future = self.entries.get(key)
+            if future is not None:
+                self.entries.move_to_end(key)
+                return future
+            # Future 由这里创建并交给 _load：失败时据此确认条目仍属于这次获取
+            future = Future()
+            self.pool.submit(self._load, key, song.cover_url, future)
+            self.entries[key] = future
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return future
+
+    def get(self, song):
+        """返回本地封面文件路径，无封面或下载失败时返回 None"""
+        future = self.prefetch(song)
+        return future.result() if future is not None else None
+
+    def close(self):
+        """关闭下载线程池，尚未开始的封面请求直接取消"""
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            for future in self.entries.values():
+                future.cancel()
+
+    def _load(self, key, cover_url, future):
+        try:
+            path = self._fetch(key, cover_url)
+        except Exception:
+            path = None
+        if path is None:
+            # 获取失败的封面不缓存（在公布结果之前移除），下一首同专辑的歌曲会重新请求；
+            # 这期间条目可能已被淘汰并由新的获取占用，只移除自己的
+            with self.lock:
+                if self.entries.get(key) is future:
+                    del self.entries[key]
+        future.set_result(path)
+
+    def _fetch(self, key, cover_url):
+        base = os.path.join(self.cache_dir, hashlib.md5(repr(key).encode('utf-8')).hexdigest())
+        for ext in ('.jpg', '.png'):
+            if os.path.exists(base + ext):
+                with self.lock:
+                    self.stats['disk_hits'] += 1
+                return base + ext
+        try:
+            data, mime = SongInfoUtils.loadimagebytesandmime(cover_url)
+        except Exception:
+            return None
+        path = base + ('.png' if mime == 'image/png' else '.jpg')
+        with open(path + '.part', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.part', path)
+        with self.lock:
+            self.stats['fetched'] += 1
+        return path
+
+
+def save_cover_sidecar(audio_path, cover_path):
+    """把封面另存为与音频同名的图片（如 歌手 - 歌名.jpg），已存在时不覆盖"""
+    target = Path(audio_path).with_suffix(os.path.splitext(cover_path)[1])
+    if target.exists():
+        return False
+    shutil.copyfile(cover_path, target)
+    return True
+
+
+class PostProcessor:
+    """下载后处理：下载线程把完成的文件放进队列后立即去下载下一首，
+    由独立的线程池写入标题/歌手/专辑/歌词和封面，并在音频旁边保存 .lrc 歌词和封面图片
+    下载开始时调用 prefetch，封面与音频同时获取，音频下完时封面通常已经就绪
+    """
+
+    def __init__(self, workers=POSTPROCESS_WORKERS, cover_cache=None):
+        self.queue = queue.Queue()
+        self.owns_cover_cache = cover_cache is None
+        self.cover_cache = cover_cache or AlbumCoverCache()
+        self.lock = Lock()
+        self.stats = {'processed': 0, 'tagged': 0, 'covers': 0, 'lrc_files': 0, 'cover_files': 0, 'failed': 0}
+        self.threads = [Thread(target=self._worker, daemon=True) for _ in range(workers)]
+        for t in self.threads:
+            t.start()
+
+    def prefetch(self, song):
+        """歌曲开始下载时调用：在后台获取封面（同一专辑只请求一次）"""
+        self.cover_cache.prefetch(song)
+
+    def submit(self, song):
+        """提交一首已下载完成的歌曲（song._save_path 为文件路径）"""
+        self.queue.put(copy.copy(song))
+
+    def join(self):
+        """等待队列中的文件全部处理完"""
+        self.queue.join()
+
+    def close(self):
+        """处理完队列中剩余的文件后停止工作线程，并关闭自己创建的封面缓存线程池"""
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        if self.owns_cover_cache:
+            self.cover_cache.close()
+
+    def _worker(self):
+        while True:
+            song = self.queue.get()
+            if song is None:
+                self.queue.task_done()
+                return
+            try:
+                self.process(song)
+            finally:
+                self.queue.task_done()
+
+    def process(self, song):
+        path = Path(song._save_path)
+        tagged = covered = lrc_saved = cover_saved = False
+        try:
+            title = SongInfoUtils.normalizetext(song.song_name)
+            album = SongInfoUtils.normalizetext(song.album)
+            artists = SongInfoUtils.normalizetext(song.singers)
+            lyrics = SongInfoUtils.normalizetext(song.lyric)
+            if title or album or artists:
+                tagged = SongInfoUtils.safeeditaudio(path, SongInfoUtils.embedbasictags, overwrite=False,
+                                                     title=title, album=album, artists=artists)
+            if lyrics:
+                lrc_saved = SongInfoUtils.savelrctofile(path, lyrics, overwrite=False)
+                SongInfoUtils.safeeditaudio(path, SongInfoUtils.embedlyrics, overwrite=False, lyrics_text=lyrics)
+            cover_path = self.cover_cache.get(song)
+            if cover_path:
+                covered = SongInfoUtils.safeeditaudio(path, SongInfoUtils.embedcover, overwrite=False,
+                                                      cover_source=cover_path)
+                cover_saved = save_cover_sidecar(path, cover_path)
+            failed = False
+        except Exception:
+            failed = True
+        with self.lock:
+            self.stats['processed'] += 1
+            self.stats['tagged'] += int(tagged)
+            self.stats['covers'] += int(covered)
+            self.stats['lrc_files'] += int(lrc_saved)
+            self.stats['cover_files'] += int(cover_saved)
+            self.stats['failed'] += int(failed)
+
+
+def download_single_song(music_client, song, save_dir, completed_count, total_count, download_lock, candidate_pool=None,
+                         post_processor=None, aggregator=None, cancel_token=None):
+    """下载单首歌曲，带进度显示
+    post_processor: 下载完成后把文件交给后处理队列写标签，下载线程不等待
+    aggregator: ByteProgressAggregator，汇报字节进度
+    cancel_token: 取消后不再开始新的下载，正在进行的传输被中止
+    """
+    ok = False
+    try:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        # 设置保存路径（分片曲库时在 首字母/歌手/专辑 目录下）
+        song._save_path = library_path(save_dir, song)
+        song.work_dir = os.path.dirname(song._save_path)
+        filename = os.path.basename(song._save_path)
+        
+        source = song.source
+        callbacks = aggregator.track(id(song), filename) if aggregator else {}
+        
+        # 执行下载
+        with download_lock:
+            current = completed_count[0] + 1
+            print(f"\n[{current}/{total_count}] 📥 正在下载: {filename[:60]}...")
+        
+        candidates = find_song_candidates(song, candidate_pool) if candidate_pool else [song]
+        candidates = [c for c in candidates if c.source in music_client.music_clients]
+        if post_processor:
+            post_processor.prefetch(song)
+        if len(candidates) > 1:
+            # 多源对冲：其他平台有同一首歌时，慢速源会被更快的源替换
+            winner, save_path = hedged_download(lambda s: music_client.music_clients[s], candidates, save_dir,
+                                                progress_callbacks=callbacks, cancel_token=cancel_token)
+            if winner is not None:
+                song._save_path = save_path
+                filename = os.path.basename(save_path)
+                if winner.source != source:
+                    with download_lock:
+                        print(f"\n   ↪ 已切换到 {winner.source}")
+                if post_processor:
+                    post_processor.submit(winner)
+        elif download_song_file(music_client.music_clients[source], song, song._save_path, TransferProgress(**callbacks),
+                                auto_supplement_song=post_processor is None, cancel_token=cancel_token):
+            if post_processor:
+                post_processor.submit(song)
+        
+        with download_lock:
+            completed_count[0] += 1
+            current = completed_count[0]
+            if os.path.exists(song._save_path):
+                ok = True
+                file_size = os.path.getsize(song._save_path)
+                size_mb = file_size / 1024 / 1024
+                print(f"\n   ✓ 完成 ({size_mb:.2f} MB) - {filename[:50]}...")
+            else:
+                print(f"\n   ? 文件未找到 - {filename[:50]}...")
+        
+        return True
+    except OperationCancelled:
+        return False
+    except Exception as e:
+        with download_lock:
+            completed_count[0] += 1
+            print(f"\n   ✗ 失败: {str(e)[:80]}")
+        return False
+    finally:
+        if aggregator:
+            aggregator.finish(id(song), ok)
+
+
+def parallel_download(music_client, songs, save_dir, thread_count, candidate_pool=None, cancel_token=None,
+                      post_processor=None):
+    """并行下载多首歌曲，实时显示进度
+    candidate_pool: 传入全部搜索结果时启用多源对冲下载
+    cancel_token: 被取消（或按下 Ctrl+C）时中止所有传输并抛出 OperationCancelled
+    post_processor: 复用调用方的后处理器（由调用方负责关闭）；不传时本次下载结束后自动关闭
+    """
+    if not songs:
+        return
+    
+    print(f"\n{'=' * 80}")
+    print(f"⬇️  开始并行下载")
+    print(f"   歌曲数: {len(songs)} | 线程数: {thread_count}")
+    print(f"   保存到: {save_dir}")
+    print('=' * 80)
+    
+    os.makedirs(save_dir, exist_ok=True)
+    start_time = time.time()
+    retry_before = retry_stats()
+    audio_before = dict(audio_check_stats)
+    completed_count = [0]
+    total_count = len(songs)
+    download_lock = Lock()
+    owns_post_processor = post_processor is None
+    post_processor = post_processor or PostProcessor()
+    try:
+        def show_transfer(snapshot):
+            # 在同一行刷新总进度：已下载/总量、速度、剩余时间
+            with download_lock:
+                sys.stdout.write(f"\r   📶 {format_transfer_status(snapshot):<70}")
+                sys.stdout.flush()
+    
+        aggregator = ByteProgressAggregator(total_count, on_update=show_transfer)
+        cancel_token = cancel_token or CancelToken()
+    
+        # 使用线程池并行下载
+        executor = ThreadPoolExecutor(max_workers=thread_count)
+        try:
+            futures = [
+                executor.submit(
+                    download_single_song,
+                    music_client,
+                    song,
+                    save_dir,
+                    completed_count,
+                    total_count,
+                    download_lock,
+                    candidate_pool,
+                    post_processor,
+                    aggregator,
+                    cancel_token
+                ) for song in songs
+            ]
+        
+            # 等待所有下载完成
+            for future in iter_completed(futures, cancel_token):
+                future.result()
+        except (KeyboardInterrupt, OperationCancelled):
+            # 中止正在进行的传输，已完成的文件照常写标签
+            cancel_token.cancel()
+            print(f"\n\n⏹  下载已取消，完成 {completed_count[0]}/{total_count} 首")
+            # 等进行中的下载线程退出，它们提交的歌曲也要写完标签再关闭后处理器
+            executor.shutdown(wait=True, cancel_futures=True)
+            post_processor.join()
+            raise OperationCancelled()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+        elapsed = time.time() - start_time
+        transfer = aggregator.snapshot()
+        print(f"\n\n🏷️  正在写入标签和封面...")
+        post_processor.join()
+        stats = post_processor.stats
+        print(f"\n{'=' * 80}")
+        print(f"✅ 下载完成！耗时 {elapsed:.1f} 秒 | 共 {total_count} 首")
+        print(f"   数据: {format_bytes(transfer['bytes_done'])} | 平均速度: "
+              f"{transfer['bytes_done'] / elapsed / 1024 / 1024 if elapsed > 0 else 0:.2f} MB/s")
+        print(f"   标签: {stats['tagged']} 首 | 封面: {stats['covers']} 首 | "
+              f"歌词文件: {stats['lrc_files']} | 封面文件: {stats['cover_files']}")
+        retry_summary = format_retry_summary(retry_before)
+        if retry_summary:
+            print(f"   请求: {retry_summary}")
+        audio_summary = format_audio_check_summary(audio_before)
+        if audio_summary:
+            print(f"   {audio_summary}（已移到 {os.path.join(save_dir, QUARANTINE_DIR)}）")
+        print('=' * 80)
+        memory_profiler.checkpoint(f"下载完成: {total_count} 首")
+    finally:
+        if owns_post_processor:
+            post_processor.close()
+
+
+# ========== 结果集导出 / 载入 ==========
+RESULTS_FORMAT = 'musicdl-results'
+RESULTS_VERSION = 1
+# 稍后下载所需的字段；raw_data 等原始响应不保存，音质和大小单独记录
+RESULT_FIELDS = (
+    'source', 'root_source', 'song_name', 'singers', 'album', 'ext', 'file_size_bytes', 'file_size',
+    'duration_s', 'duration', 'bitrate', 'codec', 'cover_url', 'download_url',
+    'default_download_headers', 'default_download_cookies', 'protocol', 'identifier',
+)
+
+
+def open_result_file(path, mode='rt'):
+    """打开结果集文件，以 .gz 结尾时按 gzip 压缩读写"""
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def song_to_record(song):
+    """SongInfo -> 精简字典（空字段不写）"""
+    record = {}
+    for name in RESULT_FIELDS:
+        value = getattr(song, name, None)
+        if value not in (None, '', {}, []):
+            record[name] = value
+    if not isinstance(record.get('download_url'), str):
+        record.pop('download_url', None)
+    record['ok'] = bool((song.download_url_status or {}).get('ok'))
+    quality, size = get_song_quality(song), get_song_size(song)
+    if quality != '未知音质':
+        record['quality'] = quality
+    if size != '未知大小':
+        record['size'] = size
+    return record
+
+
+def record_to_song(record, exported_at=None):
+    """精简字典 -> SongInfo；音质和大小放回 raw_data，get_song_quality / get_song_size 照常可用"""
+    song = SongInfo.fromdict({k: v for k, v in record.items() if k in RESULT_FIELDS})
+    song.download_url_status = {'ok': bool(record.get('ok'))}
+    data = {k: record[k] for k in ('quality', 'size') if k in record}
+    song.raw_data = {'download': {'data': data}} if data else {}
+    song._source_platform = song.source
+    song._loaded_at = exported_at  # 第一次下载前按需重新验证链接，见 revalidate_loaded_song
+    return song
+
+
+def export_results(path, songs, keyword=None):
+    """把搜索结果写成 JSON Lines（第一行是文件头，之后每行一首），先写临时文件再替换
+    返回: 写入的歌曲数
+    """
+    songs = list(songs)
+    header = {
+        'format': RESULTS_FORMAT, 'version': RESULTS_VERSION, 'keyword': keyword or '',
+        'sources': sorted({song.source for song in songs if song.source}),
+        'count': len(songs), 'exported_at': int(time.time()),
+    }
+    tmp_path = f"{path}.tmp{'.gz' if str(path).endswith('.gz') else ''}"
+    with open_result_file(tmp_path, 'wt') as f:
+        f.write(json.dumps(header, ensure_ascii=False) + '\n')
+        for song in songs:
+            f.write(json.dumps(song_to_record(song), ensure_ascii=False, separators=(',', ':'), default=str) + '\n')
+    os.replace(tmp_path, path)
+    return len(songs)
+
+
+def _read_results_header(f, path):
+    try:
+        header = json.loads(f.readline() or '{}')
+    except ValueError:
+        header = {}
+    if not isinstance(header, dict) or header.get('format') != RESULTS_FORMAT:
+        raise ValueError(f"不是结果集文件: {path}")
+    if header.get('version', 0) > RESULTS_VERSION:
+        raise ValueError(f"结果集版本过新 ({header['version']})，请升级后再载入")
+    return header
+
+
+def read_results_header(path):
+    """只读取结果集的文件头：keyword / sources / count / exported_at"""
+    with open_result_file(path) as f:
+        return _read_results_header(f, path)
+
+
+def iter_result_file(path):
+    """逐行读取结果集并产出 SongInfo，不会把整个文件读进内存；损坏的行跳过"""
+    with open_result_file(path) as f:
+        exported_at = _read_results_header(f, path).get('exported_at') or 0
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get('source'):
+                yield record_to_song(record, exported_at)
+
+
+def refresh_download_url(client, song):
+    """在原平台重新搜索同一首歌，把新的下载链接换到 song 上
+    优先按平台曲目 ID 匹配，没有 ID 时按歌手 + 歌名相似度匹配
+    返回: 是否找到
+    """
+    keyword = f"{song.singers or ''} {song.song_name or ''}".strip()
+    if not keyword:
+        return False
+    results = [s for s in client.search(keyword=keyword, num_threadings=1, main_process_context=TransferProgress())
+               if s.with_valid_download_url]
+    fresh = next((s for s in results if song.identifier and s.identifier == song.identifier), None)
+    if fresh is None:
+        fresh, _ = best_match(results, song.singers, song.song_name or '')
+    if fresh is None:
+        return False
+    for name in ('download_url', 'download_url_status', 'default_download_headers', 'default_download_cookies',
+                 'ext', 'file_size_bytes', 'file_size', 'protocol', 'chunk_size'):
+        setattr(song, name, getattr(fresh, name))
+    if fresh.raw_data:
+        song.raw_data = fresh.raw_data
+    return True
+
+
+def revalidate_loaded_song(client, song):
+    """从结果集载入的歌曲在第一次下载前验证一次链接：
+    签名已过期或链接已失效时重新搜索换链接，暂时无法判断（超时等）时照常下载
+    返回: 是否可以继续下载
+    """
+    song._loaded_at = None
+    url = song.download_url
+    if isinstance(url, str) and url.startswith('http'):
+        expiry = parse_url_expiry(url)
+        if not (expiry and expiry - URL_EXPIRY_MARGIN <= time.time()):
+            if (song.protocol or 'HTTP').upper() != 'HTTP':
+                return True
+            entry = url_resolver.lookup(url) or url_resolver.resolve(client, song)
+            if entry is None or entry['ok']:
+                return True
+    try:
+        return refresh_download_url(client, song)
+    except OperationCancelled:
+        raise
+    except Exception:
+        return False
+
+
+# ========== 订阅监视：定期重搜，只下载新歌 ==========
+WATCH_INTERVAL_MINUTES = 360    # 默认每 6 小时重新搜索一次
+WATCH_SEARCH_SIZE = 10          # 新歌一般排在前面，每平台只看前几条
+WATCH_SEEN_FILE = os.path.join(APP_DATA_DIR, "watch_seen.bin")
+WATCH_PENDING_FILE = os.path.join(APP_DATA_DIR, "watch_pending.jsonl.gz")
+
+
+class SeenSongIndex:
+    """见过的歌曲集合：每首歌按 (平台, 曲目ID) 取 64 位哈希，持久化为紧凑的二进制文件（每首 8 字节）
+    平台没有曲目 ID 时按 (歌手, 歌名) 计算
+    """
+    def __init__(self, path=WATCH_SEEN_FILE):
+        self.path = path
+        self.hashes = set()
+        self.load()
+
+    @staticmethod
+    def _hash(song):
+        key = song.identifier or '\x00'.join(song_key(song))
+        digest = hashlib.blake2b(f"{song.source}\x00{key}".encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+    def __contains__(self, song):
+        return self._hash(song) in self.hashes
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add(self, song):
+        """记录一首歌，返回它之前是否没见过"""
+        h = self._hash(song)
+        if h in self.hashes:
+            return False
+        self.hashes.add(h)
+        return True
+
+    def discard(self, song):
+        self.hashes.discard(self._hash(song))
+
+    def load(self):
+        hashes = array('Q')
+        try:
+            with open(self.path, 'rb') as f:
+                hashes.frombytes(f.read())
+        except (OSError, ValueError):
+            return
+        self.hashes = set(hashes)
+
+    def save(self):
+        """先写临时文件再替换"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            array('Q', sorted(self.hashes)).tofile(f)
+        os.replace(tmp_path, self.path)
+
+
+def read_subscriptions(path):
+    """读取订阅文件：每行一个搜索关键词，# 开头为注释，重复的关键词只保留一个"""
+    keywords = []
+    for line in read_text_file(path).splitlines():
+        line = line.strip()
+        if line and not line.startswith('#') and line not in keywords:
+            keywords.append(line)
+    return keywords
+
+
+def parse_time_window(text):
+    """解析 "01:00-07:00" 形式的时间段，返回 (开始分钟, 结束分钟)；结束早于开始表示跨过午夜"""
+    match = re.fullmatch(r'\s*(\d{1,2})(?::(\d{2}))?\s*-\s*(\d{1,2})(?::(\d{2}))?\s*', text or '')
+    if not match:
+        raise ValueError(f"无法识别的时间段: {text}（格式如 01:00-07:00）")
+    start = int(match.group(1)) * 60 + int(match.group(2) or 0)
+    end = int(match.group(3)) * 60 + int(match.group(4) or 0)
+    if start >= 24 * 60 or end > 24 * 60 or start == end:
+        raise ValueError(f"无效的时间段: {text}")
+    return start, end
+
+
+def seconds_until_window(window, now=None):
+    """距离时间段开始还有多少秒，已在时间段内时返回 0；window 为 None 表示不限时间"""
+    if window is None:
+        return 0
+    now = time.localtime(now)
+    minute = now.tm_hour * 60 + now.tm_min
+    start, end = window
+    inside = start <= minute < end if start < end else (minute >= start or minute < end)
+    if inside:
+        return 0
+    return ((start - minute) % (24 * 60)) * 60 - now.tm_sec
+
+
+def watch_new_songs(music_client, keywords, sources, seen, existing_songs, search_size=WATCH_SEARCH_SIZE,
+                    cancel_token=None):
+    """把每个订阅关键词重新搜索一遍，返回之前没见过、曲库里也没有的歌曲
+    所有结果都会记入 seen，下一轮不会再出现
+    """
+    new_songs = []
+    for keyword in keywords:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        results = parallel_search(music_client, sources, keyword, search_size, cancel_token=cancel_token)
+        for source_name, song_list in results.items():
+            for song in song_list:
+                song._source_platform = source_name
+                if seen.add(song) and not is_song_exists(song, existing_songs):
+                    new_songs.append(song)
+    return new_songs
+
+
+# ========== 分布式下载：共享任务队列 ==========
+JOB_LEASE_SECONDS = 120         # 领取任务的租约时长，节点崩溃后最多这么久任务就会被重新领取
+JOB_HEARTBEAT_SECONDS = 30      # 下载中每隔多久续约一次
+JOB_MAX_ATTEMPTS = 3            # 同一个任务最多领取几次，之后标记为失败
+WORKER_IDLE_POLL = 5            # 队列暂时没有可领取的任务时等待多久再看（秒）
+JOB_QUEUE_BACKENDS = {}         # URL 前缀 -> 任务队列类，见 register_job_queue_backend
+
+
+def register_job_queue_backend(scheme):
+    """登记任务队列后端，open_job_queue 按 URL 前缀（scheme://）选择"""
+    def decorator(cls):
+        JOB_QUEUE_BACKENDS[scheme] = cls
+        return cls
+    return decorator
+
+
+def open_job_queue(url):
+    """打开任务队列：sqlite:///mnt/share/queue.db，不带前缀的路径按 SQLite 文件处理"""
+    scheme, sep, location = url.partition('://')
+    if not sep:
+        scheme, location = 'sqlite', url
+    backend = JOB_QUEUE_BACKENDS.get(scheme)
+    if backend is None:
+        raise ValueError(f"不支持的任务队列: {url}（可用: {', '.join(JOB_QUEUE_BACKENDS)}）")
+    return backend(location)
+
+
+def job_target(save_dir, song):
+    """歌曲在曲库内的相对路径，统一用 / 分隔，与各节点的挂载点和操作系统无关"""
+    return Path(get_library(save_dir).relpath(song)).as_posix()
+
+
+def job_save_path(save_dir, target):
+    """把任务的 target 还原为本节点曲库下的保存路径"""
+    return os.path.join(save_dir, *target.split('/'))
+
+
+class JobQueue:
+    """任务队列接口：任务是 {id, source, record, target, attempts, created_at}
+    record 为 song_to_record 的精简字典，target 为曲库内的相对路径（各节点挂载点可以不同），同一个 target 只排队一次
+    """
+
+    def enqueue(self, songs, save_dir):
+        """把歌曲加入队列，返回新增（或失败后重新排队）的任务数
+        save_dir: 曲库目录，用来确定歌曲在曲库内的相对路径（分片曲库在 首字母/歌手/专辑 目录下）
+        """
+        raise NotImplementedError
+
+    def lease(self, worker, lease_seconds=JOB_LEASE_SECONDS):
+        """领取一个排队中或租约已过期的任务，没有时返回 None"""
+        raise NotImplementedError
+
+    def heartbeat(self, job_id, worker, lease_seconds=JOB_LEASE_SECONDS):
+        """续约；返回 False 表示租约已被收回，任务归其他节点"""
+        raise NotImplementedError
+
+    def complete(self, job_id, worker, ok, error=None):
+        """结束任务；失败且未达 JOB_MAX_ATTEMPTS 时重新排队"""
+        raise NotImplementedError
+
+    def release(self, job_id, worker):
+        """放弃租约（节点退出），任务立即回到队列，不计入尝试次数"""
+        raise NotImplementedError
+
+    def stats(self):
+        """各状态的任务数 {queued, leased, done, failed}"""
+        raise NotImplementedError
+
+    def drained(self):
+        stats = self.stats()
+        return not stats['queued'] and not stats['leased']
+
+
+@register_job_queue_backend('sqlite')
+class SQLiteJobQueue(JobQueue):
+    """共享卷上的 SQLite 文件作为任务队列，多个进程 / 节点靠数据库锁协调
+    使用默认的回滚日志：WAL 依赖共享内存，放在网络文件系统上不可靠
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            target TEXT NOT NULL UNIQUE,
+            source TEXT NOT NULL,
+            record TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            worker TEXT,
+            lease_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # 自己管理事务；同一进程的线程共用一个连接，由锁串行化
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.lock = Lock()
+        with self.lock:
+            self.conn.executescript(self.SCHEMA)
+
+    def _transaction(self, fn):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(self.conn)
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+            return result
+
+    def enqueue(self, songs, save_dir):
+        now = time.time()
+        rows = [(job_target(save_dir, song), song.source, json.dumps(song_to_record(song), ensure_ascii=False), now, now)
+                for song in songs]
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT INTO jobs (target, source, record, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (target) DO UPDATE SET source = excluded.source, record = excluded.record, "
+                "status = 'queued', worker = NULL, lease_until = NULL, attempts = 0, error = NULL, "
+                "created_at = excluded.created_at, updated_at = excluded.updated_at "
+                "WHERE jobs.status = 'failed'",
+                rows
+            )
+            return conn.total_changes - before
+        return self._transaction(insert)
+
+    def lease(self, worker, lease_seconds=JOB_LEASE_SECONDS):
+        def take(conn):
+            now = time.time()
+            # 租约过期次数太多的任务多半会让节点崩溃，不再分发
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = '租约多次过期', updated_at = ? "
+                "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, now, JOB_MAX_ATTEMPTS)
+            )
+            row = conn.execute(
+                "SELECT id, source, record, target, attempts, created_at FROM jobs "
+                "WHERE status = 'leased' AND lease_until < ? ORDER BY id LIMIT 1", (now,)
+            ).fetchone() or conn.execute(
+                "SELECT id, source, record, target, attempts, created_at FROM jobs "
+                "WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ?",
+                (worker, now + lease_seconds, now, row[0])
+            )
+            job_id, source, record, target, attempts, created_at = row
+            return {'id': job_id, 'source': source, 'record': json.loads(record), 'target': target,
+                    'attempts': attempts + 1, 'created_at': created_at}
+        return self._transaction(take)
+
+    def _update_lease(self, sql, params):
+        with self.lock:
+            return self.conn.execute(sql + " AND status = 'leased'", params).rowcount > 0
+
+    def heartbeat(self, job_id, worker, lease_seconds=JOB_LEASE_SECONDS):
+        now = time.time()
+        return self._update_lease("UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND worker = ?",
+                                  (now + lease_seconds, now, job_id, worker))
+
+    def complete(self, job_id, worker, ok, error=None):
+        status = "'done'" if ok else f"CASE WHEN attempts >= {JOB_MAX_ATTEMPTS} THEN 'failed' ELSE 'queued' END"
+        return self._update_lease(
+            f"UPDATE jobs SET status = {status}, worker = NULL, lease_until = NULL, error = ?, updated_at = ? "
+            "WHERE id = ? AND worker = ?",
+            (error, time.time(), job_id, worker)
+        )
+
+    def release(self, job_id, worker):
+        return self._update_lease(
+            "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, attempts = attempts - 1, "
+            "updated_at = ? WHERE id = ? AND worker = ?",
+            (time.time(), job_id, worker)
+        )
+
+    def stats(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict({'queued': 0, 'leased': 0, 'done': 0, 'failed': 0}, **dict(rows))
+
+
+# ========== 内存诊断：tracemalloc 快照 ==========
+MEMPROF_INTERVAL = 600      # 默认每隔多少秒记录一次占用最多的分配点
+MEMPROF_TOP_N = 15          # 每份报告列出的分配点数
+MEMPROF_LOG = os.path.join(APP_DATA_DIR, "memprof.log")
+MEMPROF_IGNORED = ('<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>', '<unknown>', tracemalloc.__file__)
+
+
+def _format_site(frame):
+    """分配点 -> 路径末尾三段:行号"""
+    return f"{os.sep.join(frame.filename.split(os.sep)[-3:])}:{frame.lineno}"
+
+
+def _format_diff(n):
+    return ('+' if n >= 0 else '-') + format_bytes(abs(n))
+
+
+class MemoryProfiler:
+    """长时间运行时的内存诊断
+    在搜索、下载等边界调用 checkpoint(label)，记录各子系统的对象数量，并与上一个快照比较增长最多的分配点；
+    每隔 interval 秒另外记录一次当前占用最多的分配点。拍快照在后台线程进行，不阻塞调用方（包括 Tk 主线程）
+    未启用时 checkpoint 直接返回，watch 只登记计数函数
+    """
+
+    def __init__(self, log_path=MEMPROF_LOG, top_n=MEMPROF_TOP_N):
+        self.log_path = log_path
+        self.top_n = top_n
+        self.enabled = False
+        self.lock = Lock()
+        self.counters = {}          # 子系统名 -> 返回当前对象数量的函数
+        self.pending = queue.Queue()
+        self.thread = None
+        self.last = None            # (标签, 快照)
+        self.checkpoints = 0
+
+    def watch(self, name, counter):
+        """登记一个子系统：counter() 返回它当前持有的对象数量（在后台线程中调用）"""
+        self.counters[name] = counter
+
+    def start(self, interval=MEMPROF_INTERVAL):
+        with self.lock:
+            if self.enabled:
+                return self
+            self.enabled = True
+        tracemalloc.start()
+        self.thread = Thread(target=self._run, args=(interval,), daemon=True)
+        self.thread.start()
+        # 退出时写最后一份报告（命令行各模式有很多提前返回的路径）
+        atexit.register(self._stop_at_exit)
+        self._write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 内存诊断已启动 (pid {os.getpid()})")
+        return self
+
+    def checkpoint(self, label):
+        """在搜索 / 下载等边界记录一次快照"""
+        if self.enabled:
+            self.pending.put(label)
+
+    def stop(self):
+        """写最终报告并停止跟踪，返回一行摘要；未启用时返回 None"""
+        with self.lock:
+            if not self.enabled:
+                return None
+            self.enabled = False
+        self.pending.put(None)
+        self.thread.join()
+        self._write(self._top_report('退出'))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return f"内存诊断: {self.checkpoints} 个快照 | 峰值 {format_bytes(peak)} | 报告: {self.log_path}"
+
+    def _stop_at_exit(self):
+        summary = self.stop()
+        if summary:
+            print(summary)
+
+    def _run(self, interval):
+        next_report = time.monotonic() + interval if interval > 0 else None
+        while True:
+            timeout = None if next_report is None else max(0, next_report - time.monotonic())
+            try:
+                label = self.pending.get(timeout=timeout)
+            except queue.Empty:
+                self._write(self._top_report('定时报告'))
+                next_report = time.monotonic() + interval
+                continue
+            if label is None:
+                return
+            self._write(self._checkpoint_report(label))
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, name) for name in MEMPROF_IGNORED])
+
+    def _header(self, label):
+        current, peak = tracemalloc.get_traced_memory()
+        return f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {label} | 跟踪 {format_bytes(current)}（峰值 {format_bytes(peak)}）"
+
+    def _counts(self):
+        counts = {}
+        for name, counter in list(self.counters.items()):
+            try:
+                counts[name] = counter()
+            except Exception:
+                counts[name] = '?'
+        # 进程中存活的对象，包括已经没有登记处引用、但还没被释放的
+        live = {'SongInfo': 0, '平台客户端': 0, 'HTTP 会话': 0}
+        for obj in gc.get_objects():
+            if isinstance(obj, SongInfo):
+                live['SongInfo'] += 1
+            elif isinstance(obj, BaseMusicClient):
+                live['平台客户端'] += 1
+            elif isinstance(obj, requests.Session):
+                live['HTTP 会话'] += 1
+        counts.update(live)
+        return counts
+
+    def _checkpoint_report(self, label):
+        snapshot = self._snapshot()
+        previous, self.last = self.last, (label, snapshot)
+        self.checkpoints += 1
+        lines = [self._header(label),
+                 "  对象: " + ' | '.join(f"{name} {count}" for name, count in self._counts().items())]
+        if previous is not None:
+            lines.append(f"  与上一个快照（{previous[0]}）相比增长最多:")
+            for stat in snapshot.compare_to(previous[1], 'lineno')[:self.top_n]:
+                if stat.size_diff:
+                    lines.append(f"    {_format_diff(stat.size_diff):>10}  ({stat.count_diff:+} 块)  "
+                                 f"{_format_site(stat.traceback[0])}")
+        return '\n'.join(lines)
+
+    def _top_report(self, label):
+        lines = [self._header(label), "  占用最多的分配点:"]
+        for stat in self._snapshot().statistics('lineno')[:self.top_n]:
+            lines.append(f"    {format_bytes(stat.size):>10}  ({stat.count} 块)  {_format_site(stat.traceback[0])}")
+        return '\n'.join(lines)
+
+    def _write(self, text):
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(text + '\n\n')
+        except OSError:
+            pass
+
+
+# 进程内共享：--memprof 时启用
+memory_profiler = MemoryProfiler()
+
+
+# ========== 守护进程客户端 ==========
+DEFAULT_DAEMON_PORT = 18520
+DEFAULT_DAEMON_URL = f"http://127.0.0.1:{DEFAULT_DAEMON_PORT}"
+
+
+class DaemonClient:
+    """musicdl_daemon.py 的 HTTP 客户端，GUI 和命令行作为瘦前端时使用"""
+
+    def __init__(self, base_url=DEFAULT_DAEMON_URL, timeout=120):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, path, params=None, data=None):
+        url = self.base_url + path
+        if params:
+            url += '?' + urlencode(params)
+        body = json.dumps(data).encode('utf-8') if data is not None else None
+        request = Request(url, data=body, headers={'Content-Type': 'application/json'})
+        with urlopen(request, timeout=self.timeout) as resp:
+            return json.loads(resp.read().decode('utf-8'))
+
+    def status(self):
+        return self._request('/status')
+
+    def search(self, keyword, sources=None, size=5):
+        """远程搜索，返回 {source: [SongInfo]}，SongInfo 上带有 _daemon_id"""
+        params = {'keyword': keyword, 'size': size}
+        if sources:
+            params['sources'] = ','.join(sources)
+        results = {}
+        for source, items in self._request('/search', params).items():
+            results[source] = [self._to_song(item) for item in items]
+        return results
+
+    def enqueue(self, songs, save_dir=None):
+        """把远程搜索结果加入守护进程的下载队列，返回任务列表"""
+        data = {'ids': [song._daemon_id for song in songs]}
+        if save_dir:
+            data['save_dir'] = save_dir
+        return self._request('/enqueue', data=data)
+
+    def jobs(self, job_ids=None):
+        params = {'ids': ','.join(str(j) for j in job_ids)} if job_ids else None
+        return self._request('/jobs', params)
+
+    @staticmethod
+    def _to_song(item):
+        song = SongInfo(
+            source=item['source'], singers=item['singers'], song_name=item['song_name'],
+            album=item['album'], duration=item['duration'], ext=item['ext'], file_size=item['size'],
+            raw_data={'download': {'data': {'quality': item['quality'], 'size': item['size']}}},
+        )
+        song._daemon_id = item['id']
+        return song
+
+
+def wait_for_daemon_jobs(daemon_client, jobs, on_progress=None, interval=0.5, cancel_token=None):
+    """轮询守护进程直到这批任务全部结束，返回最终任务列表
+    cancel_token: 被取消时停止轮询并抛出 OperationCancelled（守护进程中的任务会继续完成）
+    """
+    job_ids = [job['id'] for job in jobs if 'id' in job]
+    while job_ids:
+        jobs = daemon_client.jobs(job_ids)
+        if on_progress:
+            on_progress(jobs)
+        if all(job['status'] in ('done', 'failed') for job in jobs):
+            return jobs
+        if cancel_token is None:
+            time.sleep(interval)
+        elif cancel_token.wait(interval):
+            raise OperationCancelled()
+    return jobs
+
+
+# ========== 歌单批量导入 ==========
+IMPORT_QUEUE_SIZE = 32          # 各阶段之间的队列容量
+IMPORT_MATCH_THRESHOLD = 0.6    # 低于该相似度视为未匹配
+_STOP = object()                # 队列结束标记
+
+
+def read_text_file(path):
+    """读取文本文件，依次尝试 UTF-8 和 GBK 编码"""
+    for encoding in ('utf-8-sig', 'gbk'):
+        try:
+            with open(path, 'r', encoding=encoding) as f:
+                return f.read()
+        except UnicodeDecodeError:
+            continue
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def split_artist_title(text):
+    """把 "歌手 - 歌名" 拆成 (歌手, 歌名)，没有分隔符时歌手为空"""
+    match = re.match(r'^(.+?)\s+-\s+(.+)$', text.strip())
+    if match:
+        return match.group(1).strip(), match.group(2).strip()
+    return '', text.strip()
+
+
+def parse_tracklist(path):
+    """解析 M3U / CSV / 纯文本歌单
+    返回: [dict(line=行号, text=原始内容, singer=歌手, title=歌名)]
+    """
+    ext = os.path.splitext(path)[1].lower()
+    content = read_text_file(path)
+    entries = []
+
+    if ext in ('.m3u', '.m3u8'):
+        extinf = None
+        for line_no, line in enumerate(content.splitlines(), 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.upper().startswith('#EXTINF'):
+                # #EXTINF:时长,歌手 - 歌名
+                extinf = (line_no, line.split(',', 1)[1].strip() if ',' in line else '')
+            elif line.startswith('#'):
+                continue
+            else:
+                if extinf and extinf[1]:
+                    line_no, text = extinf
+                else:
+                    text = os.path.splitext(os.path.basename(line.replace('\\', '/')))[0]
+                    text = re.sub(r'\s*[\(\[].*$', '', text)
+                singer, title = split_artist_title(text)
+                entries.append(dict(line=line_no, text=text, singer=singer, title=title))
+                extinf = None
+
+    elif ext == '.csv':
+        rows = list(csv.reader(content.splitlines()))
+        singer_col, title_col, start = 0, 1, 0
+        if rows:
+            header = [h.strip().lower() for h in rows[0]]
+            singer_names = {'artist', 'singer', 'singers', '歌手'}
+            title_names = {'title', 'name', 'song', 'song_name', '歌名', '歌曲'}
+            if any(h in title_names for h in header):
+                title_col = next(i for i, h in enumerate(header) if h in title_names)
+                singer_col = next((i for i, h in enumerate(header) if h in singer_names), None)
+                start = 1
+        for line_no, row in enumerate(rows[start:], start + 1):
+            row = [c.strip() for c in row]
+            if not any(row):
+                continue
+            if len(row) == 1:
+                singer, title = split_artist_title(row[0])
+            else:
+                singer = row[singer_col] if singer_col is not None and singer_col < len(row) else ''
+                title = row[title_col] if title_col < len(row) else ''
+            entries.append(dict(line=line_no, text=','.join(row), singer=singer, title=title))
+
+    else:
+        for line_no, line in enumerate(content.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            singer, title = split_artist_title(line)
+            entries.append(dict(line=line_no, text=line, singer=singer, title=title))
+
+    return [e for e in entries if e['title']]
+
+
+def match_score(song, singer, title):
+    """歌曲与歌单条目的相似度 (0~1)，歌名权重 0.6，歌手权重 0.4"""
+    song_singer, song_title = song_key(song)
+    title_ratio = SequenceMatcher(None, song_title, title.strip().lower()).ratio()
+    if not singer:
+        return title_ratio
+    singer = singer.strip().lower()
+    singer_ratio = SequenceMatcher(None, song_singer, singer).ratio()
+    # 多歌手时只要包含即可
+    if singer in song_singer or song_singer in singer:
+        singer_ratio = max(singer_ratio, 0.9)
+    return title_ratio * 0.6 + singer_ratio * 0.4
+
+
+def best_match(songs, singer, title):
+    """从搜索结果中选出最匹配的一首，返回 (song, score)，无合适结果时返回 (None, 0)"""
+    best, best_score = None, 0.0
+    for song in songs:
+        score = match_score(song, singer, title)
+        if score > best_score or (score == best_score and best is not None
+                                  and (song.file_size_bytes or 0) > (best.file_size_bytes or 0)):
+            best, best_score = song, score
+    if best_score < IMPORT_MATCH_THRESHOLD:
+        return None, best_score
+    return best, best_score
+
+
+def run_import_pipeline(clients, entries, save_dir, existing_songs=None,
+                        search_workers=4, download_workers=4, on_progress=None, post_processor=None,
+                        cancel_token=None):
+    """歌单导入流水线：搜索 -> 匹配 -> 去重 -> 下载
+    各阶段之间用有界队列连接，搜索和下载同时进行
+    clients: {source: 平台客户端}
+    on_progress(summary): 每处理完一个条目回调一次
+    cancel_token: 取消后各阶段不再处理新条目，正在进行的传输被中止（summary['cancelled'] 为 True）
+    返回: summary 字典（unmatched 为未匹配的 (行号, 内容) 列表）
+    """
+    cancel_token = cancel_token or CancelToken()
+    for client in clients.values():
+        bind_cancel_token(client, cancel_token)
+    os.makedirs(save_dir, exist_ok=True)
+    existing_songs = existing_songs if existing_songs is not None else scan_existing_songs(save_dir)
+    owns_post_processor = post_processor is None
+    post_processor = post_processor or PostProcessor()
+    search_q = queue.Queue(maxsize=IMPORT_QUEUE_SIZE)
+    match_q = queue.Queue(maxsize=IMPORT_QUEUE_SIZE)
+    download_q = queue.Queue(maxsize=IMPORT_QUEUE_SIZE)
+    lock = Lock()
+    queued_keys = set()
+    summary = dict(total=len(entries), searched=0, matched=0, skipped=0,
+                   downloaded=0, failed=0, unmatched=[])
+    retry_before = retry_stats()
+
+    def report(**changes):
+        with lock:
+            for key, value in changes.items():
+                if key == 'unmatched':
+                    summary['unmatched'].append(value)
+                else:
+                    summary[key] += value
+            snapshot = dict(summary, unmatched=list(summary['unmatched']))
+        if on_progress:
+            on_progress(snapshot)
+
+    def producer():
+        for entry in entries:
+            if cancel_token.cancelled:
+                break
+            search_q.put(entry)
+        for _ in range(search_workers):
+            search_q.put(_STOP)
+
+    def search_worker():
+        while True:
+            entry = search_q.get()
+            if entry is _STOP:
+                match_q.put(_STOP)
+                return
+            if cancel_token.cancelled:
+                continue
+            keyword = f"{entry['singer']} {entry['title']}".strip()
+            results = []
+            for source, client in clients.items():
+                if cancel_token.cancelled:
+                    break
+                try:
+                    # 传入静默进度对象，避免每次搜索都刷出 rich 进度条
+                    results.extend(client.search(keyword=keyword, num_threadings=2,
+                                                 main_process_context=TransferProgress()))
+                except Exception:
+                    continue
+            report(searched=1)
+            match_q.put((entry, results))
+
+    def match_stage():
+        stopped = 0
+        while stopped < search_workers:
+            item = match_q.get()
+            if item is _STOP:
+                stopped += 1
+                continue
+            entry, results = item
+            song, _ = best_match(results, entry['singer'], entry['title'])
+            if song is None:
+                report(unmatched=(entry['line'], entry['text']))
+                continue
+            key = song_key(song)
+            if is_song_exists(song, existing_songs) or key in queued_keys:
+                report(matched=1, skipped=1)
+                continue
+            queued_keys.add(key)
+            report(matched=1)
+            download_q.put(song)
+        for _ in range(download_workers):
+            download_q.put(_STOP)
+
+    def download_worker():
+        while True:
+            song = download_q.get()
+            if song is _STOP:
+                return
+            if cancel_token.cancelled:
+                continue
+            save_path = library_path(save_dir, song)
+            post_processor.prefetch(song)
+            try:
+                ok = download_song_file(clients[song.source], song, save_path, auto_supplement_song=False,
+                                        cancel_token=cancel_token)
+            except OperationCancelled:
+                continue
+            except Exception:
+                ok = False
+            if ok:
+                post_processor.submit(song)
+            report(**({'downloaded': 1} if ok else {'failed': 1}))
+
+    threads = [Thread(target=producer, daemon=True), Thread(target=match_stage, daemon=True)]
+    threads += [Thread(target=search_worker, daemon=True) for _ in range(search_workers)]
+    threads += [Thread(target=download_worker, daemon=True) for _ in range(download_workers)]
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            while t.is_alive():
+                t.join(CANCEL_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        # 各阶段在取消后会把队列排空并退出
+        cancel_token.cancel()
+        for t in threads:
+            t.join()
+    finally:
+        # 自己创建的后处理器用完即关闭，调用方传入的只等待处理完成
+        if owns_post_processor:
+            post_processor.close()
+        else:
+            post_processor.join()
+    summary['retry_summary'] = format_retry_summary(retry_before)
+    summary['cancelled'] = cancel_token.cancelled
+    return summary
+
+
+def print_import_summary(summary):
+    """打印歌单导入结果汇总"""
+    print(f"\n{'=' * 80}")
+    print("📊 歌单导入汇总")
+    print('=' * 80)
+    print(f"   条目: {summary['total']} | 匹配: {summary['matched']} | 已存在: {summary['skipped']}")
+    print(f"   下载成功: {summary['downloaded']} | 下载失败: {summary['failed']} | 未匹配: {len(summary['unmatched'])}")
+    if summary.get('retry_summary'):
+        print(f"   请求: {summary['retry_summary']}")
+    if summary['unmatched']:
+        print("\n❓ 未匹配的条目：")
+        for line_no, text in sorted(summary['unmatched']):
+            print(f"   第 {line_no} 行: {text}")
+
+
+def run_import(music_client, import_file, save_dir, download_threads):
+    """命令行歌单导入"""
+    entries = parse_tracklist(import_file)
+    if not entries:
+        print(f"\n⚠️ 歌单中没有可识别的条目: {import_file}")
+        return
+    print(f"\n📄 已读取歌单 {import_file} - {len(entries)} 个条目")
+    start_time = time.time()
+
+    def on_progress(summary):
+        done = summary['downloaded'] + summary['failed'] + summary['skipped'] + len(summary['unmatched'])
+        print_progress_bar(done, summary['total'], prefix='导入进度',
+                           suffix=f"已搜索 {summary['searched']} 已下载 {summary['downloaded']}")
+
+    summary = run_import_pipeline(music_client.music_clients, entries, save_dir,
+                                  download_workers=download_threads, on_progress=on_progress)
+    if summary['cancelled']:
+        print(f"\n⏹  导入已取消！耗时 {time.time() - start_time:.1f} 秒")
+    else:
+        print(f"\n✅ 导入完成！耗时 {time.time() - start_time:.1f} 秒")
+    print_import_summary(summary)
+
+
+def run_watch(args, all_sources):
+    """订阅监视模式：每隔 args.interval 分钟重新搜索订阅的关键词，只把没见过的新歌排队，
+    设置了 --off-hours 时排队的歌曲留到闲时时段再下载；待下载列表和见过的歌曲都会持久化，重启后继续
+    all_sources: {编号: (平台, 名称)}
+    """
+    try:
+        keywords = read_subscriptions(args.watch_file)
+        window = parse_time_window(args.off_hours) if args.off_hours else None
+    except (OSError, ValueError) as e:
+        print(f"无法启动监视: {e}")
+        return
+    if not keywords:
+        print(f"订阅文件中没有关键词: {args.watch_file}")
+        return
+    keys = [k.strip() for k in (args.sources or '').split(',') if k.strip()]
+    sources = [src for key, (src, _) in all_sources.items() if not keys or key in keys]
+    save_dir = args.save_dir or os.path.join(os.path.expanduser("~"), "Music")
+    os.makedirs(save_dir, exist_ok=True)
+
+    # 无人值守运行，使用标准模式（搜索时完整验证链接）
+    music_client = install_retry_policies(musicdl.MusicClient(
+        music_sources=sources,
+        init_music_clients_cfg={
+            source: search_client_cfg(source, WATCH_SEARCH_SIZE, max_retries=1, maintain_session=True, disable_print=True)
+            for source in sources
+        },
+        clients_threadings={source: plan_search_pages(source, WATCH_SEARCH_SIZE)[2] for source in sources}
+    ))
+    cancel_token = CancelToken()
+    for client in music_client.music_clients.values():
+        bind_cancel_token(client, cancel_token)
+
+    seen = SeenSongIndex()
+    pending = []
+    if os.path.exists(WATCH_PENDING_FILE):
+        pending = [song for song in iter_result_file(WATCH_PENDING_FILE) if song.source in music_client.music_clients]
+    interval = max(1, args.interval) * 60
+    print("=" * 80)
+    print(f"👀 订阅监视: {len(keywords)} 个关键词 | {len(sources)} 个平台 | 每 {args.interval} 分钟检查一次")
+    print(f"   保存到: {save_dir} | 下载时段: {args.off_hours or '不限'} | 已记录 {len(seen)} 首 | 待下载 {len(pending)} 首")
+    print("=" * 80)
+
+    memory_profiler.watch('待下载', lambda: len(pending))
+    memory_profiler.watch('已记录', lambda: len(seen))
+    # 各轮下载共用同一个后处理器（和封面缓存），退出监视时再关闭
+    post_processor = PostProcessor()
+    next_check = 0
+    try:
+        while True:
+            if time.time() >= next_check:
+                print(f"\n🔁 [{time.strftime('%m-%d %H:%M')}] 检查订阅...")
+                existing_songs = scan_existing_songs(save_dir)
+                new_songs = watch_new_songs(music_client, keywords, sources, seen, existing_songs,
+                                            cancel_token=cancel_token)
+                # 排队的歌曲可能要等到闲时才下载，届时先重新验证链接
+                for song in new_songs:
+                    song._loaded_at = int(time.time())
+                pending = [song for song in pending if not is_song_exists(song, existing_songs)] + new_songs
+                seen.save()
+                export_results(WATCH_PENDING_FILE, pending, 'watch')
+                print(f"\n   发现新歌 {len(new_songs)} 首 | 待下载 {len(pending)} 首")
+                for song in new_songs:
+                    print(f"   🆕 {song.singers} - {song.song_name} ({song._source_platform})")
+                next_check = time.time() + interval
+                memory_profiler.checkpoint("订阅检查")
+
+            wait_seconds = seconds_until_window(window)
+            if pending and wait_seconds == 0:
+                parallel_download(music_client, pending, save_dir, args.threads, cancel_token=cancel_token,
+                                  post_processor=post_processor)
+                # 失败的歌曲从记录中移除，下一轮搜索时会重新发现并换上新链接
+                failed = [song for song in pending if not (song._save_path and os.path.exists(song._save_path))]
+                for song in failed:
+                    seen.discard(song)
+                pending = []
+                seen.save()
+                export_results(WATCH_PENDING_FILE, pending, 'watch')
+                if failed:
+                    print(f"   {len(failed)} 首下载失败，下一轮检查时重试")
+
+            delay, action = next_check - time.time(), '检查'
+            if pending and wait_seconds < delay:
+                delay, action = wait_seconds, '下载'
+            if delay > 0:
+                print(f"\n💤 下次{action}: {time.strftime('%m-%d %H:%M', time.localtime(time.time() + delay))}（Ctrl+C 退出）")
+                _sleep(delay, cancel_token)
+    except (KeyboardInterrupt, OperationCancelled):
+        cancel_token.cancel()
+        print("\n⏹  监视已停止")
+    finally:
+        post_processor.close()
+        seen.save()
+
+
+def run_worker(args):
+    """下载节点模式：从共享任务队列领取任务，下载到 --save-dir（各节点挂载同一个曲库）
+    领取的任务带租约，后台线程定期续约；节点崩溃后租约过期，任务由其他节点重新领取
+    队列中没有排队和进行中的任务时退出
+    """
+    try:
+        job_queue = open_job_queue(args.worker)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"无法打开任务队列: {e}")
+        return
+    save_dir = args.save_dir or os.path.join(os.path.expanduser("~"), "Music")
+    os.makedirs(save_dir, exist_ok=True)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    existing_songs = scan_existing_songs(save_dir)
+    cancel_token = CancelToken()
+    clients = {}
+    clients_lock = Lock()
+    active = {}     # 任务 id -> TransferProgress，租约被收回时中止传输
+    post_processor = PostProcessor()
+    counts = {'done': 0, 'failed': 0, 'skipped': 0}
+    counts_lock = Lock()
+
+    def get_client(source):
+        with clients_lock:
+            if source not in clients:
+                clients[source] = bind_cancel_token(
+                    build_music_client(source, max_retries=1, maintain_session=True, disable_print=True), cancel_token)
+            return clients[source]
+
+    def heartbeat():
+        while not cancel_token.wait(JOB_HEARTBEAT_SECONDS):
+            for job_id, progress in list(active.items()):
+                try:
+                    alive = job_queue.heartbeat(job_id, worker_id)
+                except Exception:
+                    continue  # 共享卷暂时不可用，下次再续
+                if not alive:
+                    progress.cancel()
+
+    def count(key, line):
+        with counts_lock:
+            counts[key] += 1
+            print(line)
+
+    def run_job(job):
+        # 队列中的链接可能已经过期，下载前按载入的结果集处理（先重新验证）
+        song = record_to_song(job['record'], job['created_at'])
+        save_path = job_save_path(save_dir, job['target'])
+        if os.path.exists(save_path) or is_song_exists(song, existing_songs):
+            job_queue.complete(job['id'], worker_id, True, '已存在')
+            count('skipped', f"  ⏭️  已存在: {job['target']}")
+            return
+        progress = TransferProgress()
+        active[job['id']] = progress
+        post_processor.prefetch(song)
+        try:
+            ok = download_song_file(get_client(song.source), song, save_path, progress,
+                                    auto_supplement_song=False, cancel_token=cancel_token)
+            error = None if ok else '下载失败'
+        except OperationCancelled:
+            if cancel_token.cancelled:
+                job_queue.release(job['id'], worker_id)
+            return  # 否则租约已被收回，任务归其他节点
+        except Exception as e:
+            ok, error = False, str(e)[:200]
+        finally:
+            active.pop(job['id'], None)
+        job_queue.complete(job['id'], worker_id, ok, error)
+        if ok:
+            post_processor.submit(song)
+            count('done', f"  ✓ {job['target']}")
+        else:
+            count('failed', f"  ✗ {job['target']} (第 {job['attempts']} 次): {error}")
+
+    def work():
+        try:
+            while not cancel_token.cancelled:
+                job = job_queue.lease(worker_id)
+                if job is not None:
+                    run_job(job)
+                elif job_queue.drained():
+                    return
+                else:
+                    _sleep(WORKER_IDLE_POLL, cancel_token)
+        except OperationCancelled:
+            pass
+
+    stats = job_queue.stats()
+    print("=" * 80)
+    print(f"🛠️  下载节点 {worker_id}: {args.worker} | 线程 {args.threads}")
+    print(f"   曲库: {save_dir} | 排队 {stats['queued']} | 进行中 {stats['leased']} | "
+          f"已完成 {stats['done']} | 失败 {stats['failed']}")
+    print("=" * 80)
+    Thread(target=heartbeat, daemon=True).start()
+    threads = [Thread(target=work, daemon=True) for _ in range(max(1, args.threads))]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(CANCEL_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        print("\n⏹  正在停止，进行中的任务交还队列...")
+        cancel_token.cancel()
+        for thread in threads:
+            thread.join(5)
+    finally:
+        cancel_token.cancel()
+        post_processor.close()
+    stats = job_queue.stats()
+    print(f"\n本节点: 下载 {counts['done']} | 失败 {counts['failed']} | 已存在 {counts['skipped']}")
+    print(f"队列: 排队 {stats['queued']} | 进行中 {stats['leased']} | 已完成 {stats['done']} | 失败 {stats['failed']}")
+
+
+def run_migrate_library(directory, threads):
+    """迁移曲库为分片布局并显示进度"""
+    if not os.path.isdir(directory):
+        print(f"曲库目录不存在: {directory}")
+        return
+    print(f"📦 正在迁移曲库: {directory}（{max(threads, LIBRARY_MIGRATE_WORKERS)} 线程）")
+    start_time = time.time()
+    summary = migrate_library(directory, max(threads, LIBRARY_MIGRATE_WORKERS),
+                              on_progress=lambda done, total: print_progress_bar(done, total, prefix='   移动'))
+    print(f"✅ 迁移完成！耗时 {time.time() - start_time:.1f} 秒 | 移动 {summary['moved']} 首 | "
+          f"目标已存在 {summary['skipped']} | 失败 {summary['failed']} | 索引 {summary['indexed']} 首")
+
+
+def print_search_results(all_songs, start=0):
+    """打印搜索结果列表，start 为第一首的编号（加载更多时接着已有结果编号）"""
+    print(f"\n{'=' * 80}")
+    print("📋 搜索结果详情")
+    print("=" * 80)
+    
+    for idx, song in enumerate(all_songs, start):
+        singer = song.singers or '未知歌手'
+        songname = song.song_name or '未知歌曲'
+        album = song.album or '未知专辑'
+        duration = song.duration or '未知时长'
+        ext = song.ext or 'mp3'
+        quality = get_song_quality(song)
+        size = get_song_size(song)
+        
+        print(f"\n[{idx:2d}] 🎵 {singer} - {songname}")
+        print(f"     💿 {album} | ⏱️ {duration} | 🎧 {quality} | 💾 {size} | 📦 {ext.upper()}")
+        print(f"     🌐 {song._source_platform}")
+
+    print(f"\n{'=' * 80}")
+    print(f"📊 总计 {start + len(all_songs)} 首歌曲")
+    print("=" * 80)
+
+
+def print_local_results(local_songs):
+    """打印本地曲库中匹配的歌曲（不编号，不参与下载）"""
+    print(f"\n{'=' * 80}")
+    print(f"📁 本地曲库（{len(local_songs)} 首匹配）")
+    print("=" * 80)
+    for song in local_songs:
+        print(f"  🎵 {song.singers or '未知歌手'} - {song.song_name or '未知歌曲'}"
+              f" | 💿 {song.album or '未知专辑'} | 💾 {song.file_size}")
+        print(f"     📄 {os.path.basename(song._save_path)}")
+
+
+def run_daemon_frontend(daemon_client):
+    """瘦前端模式：搜索和下载都交给守护进程"""
+    try:
+        status = daemon_client.status()
+    except Exception as e:
+        print(f"无法连接守护进程 {daemon_client.base_url}: {e}")
+        print("请先运行: python musicdl_daemon.py")
+        return
+    
+    sources = status['sources']
+    print("=" * 80)
+    print(f"🎵 音乐下载器 (守护进程模式) - {daemon_client.base_url}")
+    print(f"   曲库: {status['save_dir']} ({status['library_size']} 首)")
+    print("=" * 80)
+    
+    print("\n可用音乐平台：")
+    for idx, source in enumerate(sources, 1):
+        print(f"  [{idx}] {source}")
+    platform_input = input("\n请选择平台编号（多个用逗号分隔，直接回车使用全部）：").strip()
+    selected_sources = [sources[int(k) - 1] for k in platform_input.split(',')
+                        if k.strip().isdigit() and 0 < int(k) <= len(sources)] or sources
+    
+    search_size = input("每平台搜索结果数（默认5）：").strip()
+    search_size = int(search_size) if search_size.isdigit() else 5
+    
+    keyword = input("\n请输入要搜索的歌曲名称：").strip()
+    if not keyword:
+        print("搜索词不能为空")
+        return
+    
+    start_time = time.time()
+    results = daemon_client.search(keyword, selected_sources, search_size)
+    all_songs = []
+    for source_name, song_list in results.items():
+        for song in song_list:
+            song._source_platform = source_name
+            all_songs.append(song)
+    print(f"\n✅ 搜索完成！耗时 {time.time() - start_time:.1f} 秒 | 共找到 {len(all_songs)} 首新歌曲")
+    
+    if not all_songs:
+        print("\n⚠️ 未找到任何新歌曲（所有结果都已在曲库中）")
+        return
+    
+    print_search_results(all_songs)
+    user_input = input("\n请输入要下载的歌曲编号（多个用逗号分隔，如 0,2,3，输入 'all' 下载全部）：").strip()
+    try:
+        if user_input.lower() == 'all':
+            selected_songs = all_songs
+        else:
+            selected_songs = [all_songs[int(x.strip())] for x in user_input.split(',')]
+    except (ValueError, IndexError) as e:
+        print(f"输入错误: {e}")
+        return
+    
+    jobs = daemon_client.enqueue(selected_songs)
+    print(f"\n已加入守护进程下载队列: {len(jobs)} 首")
+    
+    def on_progress(jobs):
+        finished = sum(1 for job in jobs if job['status'] in ('done', 'failed'))
+        print_progress_bar(finished, len(jobs), prefix='下载进度', suffix=f"{finished}/{len(jobs)}")
+    
+    jobs = wait_for_daemon_jobs(daemon_client, jobs, on_progress)
+    print("\n📁 下载结果：")
+    for job in jobs:
+        mark = '✓' if job['status'] == 'done' else '✗'
+        print(f"  {mark} {os.path.basename(job['path']) if job.get('path') else job.get('result_id')}")
+    print(f"\n成功: {sum(1 for job in jobs if job['status'] == 'done')}/{len(jobs)} 首")
+
+
+def ask_save_dir():
+    """询问保存目录，返回已创建好的目录路径"""
+    user_music_dir = os.path.join(os.path.expanduser("~"), "Music")
+    if not os.path.exists(user_music_dir):
+        user_music_dir = os.getcwd()
+    
+    print(f"\n默认保存位置: {user_music_dir}")
+    save_dir_input = input(f"请输入保存目录（直接回车使用默认，或输入 . 使用当前目录）：").strip()
+    
+    if save_dir_input == '.':
+        save_dir = os.getcwd()
+    elif save_dir_input:
+        save_dir = save_dir_input
+    else:
+        save_dir = user_music_dir
+    
+    os.makedirs(save_dir, exist_ok=True)
+    return save_dir
+
+
+def parse_args(argv=None):
+    """解析命令行参数（不带参数时为交互模式）"""
+    parser = argparse.ArgumentParser(description="🎵 音乐下载器 (命令行版)")
+    parser.add_argument('--import', dest='import_file', metavar='FILE',
+                        help='批量导入歌单文件（M3U / CSV / TXT），自动搜索、匹配并下载')
+    parser.add_argument('--load', dest='load_file', metavar='FILE',
+                        help='载入之前导出的结果集（.jsonl / .jsonl.gz），跳过搜索直接挑选下载')
+    parser.add_argument('--export', dest='export_file', metavar='FILE',
+                        help='把搜索结果（含加载更多的）导出到 FILE，以 .gz 结尾时压缩保存')
+    parser.add_argument('--watch', dest='watch_file', metavar='FILE',
+                        help='订阅监视：定期重新搜索 FILE 中的关键词（每行一个），只下载新出现的歌曲')
+    parser.add_argument('--interval', type=int, default=WATCH_INTERVAL_MINUTES, metavar='MIN',
+                        help=f'监视模式的检查间隔（分钟，默认 {WATCH_INTERVAL_MINUTES}）')
+    parser.add_argument('--off-hours', metavar='HH:MM-HH:MM',
+                        help='监视模式只在该时段下载，如 01:00-07:00（默认发现即下载）')
+    parser.add_argument('--sources', metavar='1,2,3', help='监视模式使用的平台编号（默认全部）')
+    parser.add_argument('--worker', metavar='QUEUE',
+                        help='下载节点模式：从共享任务队列（如 sqlite:///mnt/share/queue.db）领取任务下载到 --save-dir')
+    parser.add_argument('--enqueue', metavar='QUEUE', help='选中的歌曲不在本机下载，加入共享任务队列由下载节点处理')
+    parser.add_argument('--save-dir', metavar='DIR', help='监视 / 下载节点模式的保存目录（默认 ~/Music）')
+    parser.add_argument('--threads', type=int, default=5, help='监视 / 下载节点模式的并行下载线程数')
+    parser.add_argument('--migrate-library', metavar='DIR',
+                        help='把平铺的曲库迁移为 首字母/歌手/专辑 的分片目录（使用 --threads 个线程并行移动）')
+    parser.add_argument('--daemon', nargs='?', const=DEFAULT_DAEMON_URL, metavar='URL',
+                        help=f'作为瘦前端连接守护进程（默认 {DEFAULT_DAEMON_URL}）')
+    parser.add_argument('--proxy', action='append', metavar='URL',
+                        help='出口代理（可重复，如 --proxy 127.0.0.1:8001 --proxy direct），请求在各出口间轮询，被限流的出口暂停使用')
+    parser.add_argument('--memprof', nargs='?', type=int, const=MEMPROF_INTERVAL, metavar='SEC',
+                        help=f'内存诊断：在搜索 / 下载边界拍 tracemalloc 快照，并每 SEC 秒（默认 {MEMPROF_INTERVAL}）'
+                             f'记录占用最多的分配点，写入 {MEMPROF_LOG}')
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    if args.memprof is not None:
+        memory_profiler.start(args.memprof)
+        memory_profiler.watch('链接缓存', lambda: len(url_resolver.entries))
+        print(f"🔬 内存诊断已开启，报告写入 {MEMPROF_LOG}")
+    if configure_egress(args.proxy):
+        print(f"🌐 出口会话池: 每个平台 {len(args.proxy)} 个出口")
+    if args.daemon:
+        run_daemon_frontend(DaemonClient(args.daemon))
+        return
+    if args.migrate_library:
+        run_migrate_library(args.migrate_library, args.threads)
+        return
+    
     # 定义所有可用平台
     all_sources = {
         '1': ('KugouMusicClient', '酷狗音乐'),
@@ -354,149 +4086,233 @@ def main():
         '6': ('QianqianMusicClient', '千千音乐'),
     }
 
+    if args.watch_file:
+        run_watch(args, all_sources)
+        return
+    if args.worker:
+        run_worker(args)
+        return
+
     # 显示平台选项
     print("=" * 80)
     print("🎵 音乐下载器 (真·并行版)")
     print("=" * 80)
     
-    # 选择搜索模式
+    # 选择链接验证模式
     print("\n⚡ 搜索模式：")
-    print("  [1] 极速模式 - 跳过链接验证，搜索快3-5倍（推荐）")
+    print(f"  [1] 抽样模式 - 每个平台每 {LINK_SAMPLE_EVERY} 个链接验证 1 个，失效多的平台自动改为全部验证（推荐）")
     print("  [2] 标准模式 - 完整验证，搜索慢但更稳定")
+    print("  [3] 极速模式 - 跳过链接验证，搜索快3-5倍")
     mode_input = input("请选择模式（默认1）：").strip()
+    link_check = {'2': 'full', '3': 'none'}.get(mode_input, 'sampled')
+    print(f"已选择：{LINK_CHECK_NAMES[link_check]}模式")
     
-    if mode_input == '2':
-        print("已选择：标准模式")
+    if args.load_file:
+        # 载入结果集：平台取自文件头，不需要选择
+        try:
+            load_header = read_results_header(args.load_file)
+        except (OSError, ValueError) as e:
+            print(f"\n无法载入结果集: {e}")
+            return
+        selected_sources = [src for src, _ in all_sources.values() if src in load_header.get('sources', [])]
+        exported_at = time.strftime('%Y-%m-%d %H:%M', time.localtime(load_header.get('exported_at') or 0))
+        print(f"\n📄 结果集 {args.load_file}: '{load_header.get('keyword') or ''}' - "
+              f"{load_header.get('count', 0)} 首，导出于 {exported_at}")
     else:
-        enable_fast_mode()
-        print("已选择：⚡ 极速模式（跳过链接预验证）")
-    
-    print("\n可用音乐平台：")
-    for key, (_, name) in all_sources.items():
-        print(f"  [{key}] {name}")
-    print("  [0] 使用全部平台")
+        print("\n可用音乐平台：")
+        for key, (_, name) in all_sources.items():
+            print(f"  [{key}] {name}")
+        print("  [0] 使用全部平台")
 
-    # 选择平台
-    platform_input = input("\n请选择平台编号（多个用逗号分隔，如 1,2,3）：").strip()
+        # 选择平台
+        platform_input = input("\n请选择平台编号（多个用逗号分隔，如 1,2,3）：").strip()
 
-    if platform_input == '0':
-        selected_sources = [src for src, _ in all_sources.values()]
-        print(f"已选择: 全部 {len(selected_sources)} 个平台")
-    else:
-        selected_keys = [x.strip() for x in platform_input.split(',')]
-        selected_sources = [all_sources[k][0] for k in selected_keys if k in all_sources]
-        selected_names = [all_sources[k][1] for k in selected_keys if k in all_sources]
-        print(f"已选择: {', '.join(selected_names)} ({len(selected_sources)} 个平台)")
+        if platform_input == '0':
+            selected_sources = [src for src, _ in all_sources.values()]
+            print(f"已选择: 全部 {len(selected_sources)} 个平台")
+        else:
+            selected_keys = [x.strip() for x in platform_input.split(',')]
+            selected_sources = [all_sources[k][0] for k in selected_keys if k in all_sources]
+            selected_names = [all_sources[k][1] for k in selected_keys if k in all_sources]
+            print(f"已选择: {', '.join(selected_names)} ({len(selected_sources)} 个平台)")
 
     if not selected_sources:
         print("未选择有效平台")
         return
 
-    # 配置参数
-    search_size = input("\n每平台搜索结果数（默认5）：").strip()
+    # 配置参数（载入结果集时不搜索，每页条数只用于重新验证时的补搜）
+    search_size = '' if args.load_file else input("\n每平台每页结果数（默认5，结果不够时可以加载更多）：").strip()
     search_size = int(search_size) if search_size.isdigit() else 5
     
     download_threads = input("并行下载线程数（默认5）：").strip()
     download_threads = int(download_threads) if download_threads.isdigit() else 5
     
+    hedge_input = input("多源对冲下载？慢速源自动切换到其他平台的同一首歌 (y/n，默认n)：").strip().lower()
+    hedge_enabled = hedge_input == 'y'
+    
     # 初始化客户端配置
     print(f"\n正在初始化 {len(selected_sources)} 个平台...")
     init_clients_cfg = {
-        source: {
-            'search_size_per_source': search_size,
-            'search_size_per_page': min(search_size, 20),
-            'max_retries': 2,
-            'maintain_session': True,
-            'disable_print': True,
-        }
+        source: search_client_cfg(
+            source, search_size,
+            max_retries=1,  # 重试由 PlatformRetryPolicy 统一处理
+            maintain_session=True,
+            disable_print=True,
+        )
         for source in selected_sources
     }
     
-    # 每个平台的线程配置（搜索用）
-    clients_threadings = {source: 3 for source in selected_sources}
+    # 每个平台同时请求的页数（搜索用）
+    clients_threadings = {source: plan_search_pages(source, search_size)[2] for source in selected_sources}
     
-    music_client = musicdl.MusicClient(
+    music_client = install_retry_policies(musicdl.MusicClient(
         music_sources=selected_sources,
         init_music_clients_cfg=init_clients_cfg,
         clients_threadings=clients_threadings
-    )
+    ))
+    install_link_validations(music_client, link_check)
+    # Ctrl+C 时通过同一个令牌中止所有平台上正在进行的请求
+    cancel_token = CancelToken()
+    for client in music_client.music_clients.values():
+        bind_cancel_token(client, cancel_token)
 
-    # 输入搜索关键词
-    keyword = input("\n请输入要搜索的歌曲名称：").strip()
-    if not keyword:
-        print("搜索词不能为空")
+    # 歌单导入模式：不需要输入关键词
+    if args.import_file:
+        run_import(music_client, args.import_file, ask_save_dir(), download_threads)
         return
 
-    # 选择保存目录（提前询问，用于重复检测）
-    user_music_dir = os.path.join(os.path.expanduser("~"), "Music")
-    if not os.path.exists(user_music_dir):
-        user_music_dir = os.getcwd()
-    
-    print(f"\n默认保存位置: {user_music_dir}")
-    save_dir_input = input(f"请输入保存目录（直接回车使用默认，或输入 . 使用当前目录）：").strip()
-    
-    if save_dir_input == '.':
-        save_dir = os.getcwd()
-    elif save_dir_input:
-        save_dir = save_dir_input
+    get_client = lambda source: music_client.music_clients[source]
+
+    def save_results():
+        if args.export_file:
+            count = export_results(args.export_file, all_songs, keyword)
+            print(f"\n💾 已导出 {count} 首到 {args.export_file}（之后用 --load 载入即可直接下载）")
+
+    if args.load_file:
+        # 载入之前导出的结果集：不再搜索，链接在下载前按需重新验证
+        keyword = load_header.get('keyword') or ''
+        save_dir = ask_save_dir()
+        existing_songs = scan_existing_songs(save_dir)
+        all_songs = []
+        skipped_count = 0
+        for song in iter_result_file(args.load_file):
+            if song.source not in music_client.music_clients:
+                continue
+            if is_song_exists(song, existing_songs):
+                skipped_count += 1
+            else:
+                all_songs.append(song)
+        if skipped_count > 0:
+            print(f"   已跳过 {skipped_count} 首已存在的歌曲")
+        if not all_songs:
+            print("\n⚠️ 结果集中没有需要下载的新歌曲")
+            return
+        print_search_results(all_songs)
+        url_resolver.prefetch(get_client, all_songs[:URL_RESOLVE_TOP_N])
+        pagers = {}
+        ranker = None  # 保持结果集中的顺序
     else:
-        save_dir = user_music_dir
-    
-    os.makedirs(save_dir, exist_ok=True)
+        # 输入搜索关键词（Tab 补全历史关键词，并在后台预取第一个候选的结果）
+        search_history = SearchHistory()
+        search_cache = SearchResultCache()
+        prefetch_pool = ThreadPoolExecutor(max_workers=len(selected_sources))
+        prefetcher = SearchPrefetcher(lambda kw: prefetch_platforms(
+            search_cache,
+            # 预取在用户输入时进行，用静默的进度对象，避免客户端的进度条覆盖输入提示
+            lambda source, kw: music_client.music_clients[source].search(
+                keyword=kw, num_threadings=clients_threadings[source], main_process_context=TransferProgress()),
+            selected_sources, kw, search_size, link_check, prefetch_pool
+        ), delay=0)
+        if enable_history_completion(search_history, on_complete=prefetcher.schedule):
+            print("\n💡 按 Tab 补全历史搜索，↑/↓ 翻阅最近的搜索")
+        keyword = input("\n请输入要搜索的歌曲名称：").strip()
+        disable_history_completion()
+        if not keyword:
+            print("搜索词不能为空")
+            return
+        search_history.add(keyword)
+        search_history.save()
+
+        # 选择保存目录（提前询问，用于重复检测）
+        save_dir = ask_save_dir()
+
+        # 先在本地曲库中查找，需要更多结果时再搜索网络平台
+        local_songs = LibraryIndex(save_dir).search(keyword)
+        if local_songs:
+            print_local_results(local_songs)
+            if input("\n本地曲库中已有匹配的歌曲，继续在网络平台上搜索？(y/n，默认n)：").strip().lower() != 'y':
+                prefetch_pool.shutdown(wait=False, cancel_futures=True)
+                return
     
-    # 扫描已存在的歌曲
-    print(f"\n📂 正在扫描目录: {save_dir}")
-    existing_songs = scan_existing_songs(save_dir)
-    if existing_songs:
-        print(f"   发现 {len(existing_songs)} 首已存在的歌曲")
-    else:
-        print(f"   目录为空或无音频文件")
+        # 扫描已存在的歌曲
+        print(f"\n📂 正在扫描目录: {save_dir}")
+        existing_songs = scan_existing_songs(save_dir)
+        if existing_songs:
+            print(f"   发现 {len(existing_songs)} 首已存在的歌曲")
+        else:
+            print(f"   目录为空或无音频文件")
     
-    # 执行并行搜索
-    search_results = parallel_search(music_client, selected_sources, keyword, search_size)
+        # 执行并行搜索
+        search_results = parallel_search(music_client, selected_sources, keyword, search_size, search_cache, cancel_token,
+                                         link_check)
+        prefetch_pool.shutdown(wait=False, cancel_futures=True)
 
-    # 收集所有歌曲
-    all_songs = []
-    for source_name, song_list in search_results.items():
-        for song in song_list:
-            song._source_platform = source_name
-            all_songs.append(song)
+        # 收集所有歌曲，按相关度、音质和大小排序
+        ranker = RelevanceRanker(keyword)
+        for source_name, song_list in search_results.items():
+            for song in song_list:
+                song._source_platform = source_name
+            ranker.add(song_list)
+        all_songs = ranker.ranked()
     
-    # 过滤重复歌曲
-    if existing_songs:
-        print(f"\n🔄 正在过滤重复歌曲...")
-        all_songs, skipped_count = filter_duplicate_songs(all_songs, existing_songs)
-        if skipped_count > 0:
-            print(f"   已跳过 {skipped_count} 首重复歌曲")
+        # 过滤重复歌曲
+        if existing_songs:
+            print(f"\n🔄 正在过滤重复歌曲...")
+            all_songs, skipped_count = filter_duplicate_songs(all_songs, existing_songs)
+            if skipped_count > 0:
+                print(f"   已跳过 {skipped_count} 首重复歌曲")
 
-    if not all_songs:
-        print("\n⚠️ 未找到任何新歌曲（所有结果都已存在）")
-        return
+        if not all_songs:
+            print("\n⚠️ 未找到任何新歌曲（所有结果都已存在）")
+            return
 
-    # 显示结果
-    print(f"\n{'=' * 80}")
-    print("📋 搜索结果详情")
-    print("=" * 80)
-    
-    for idx, song in enumerate(all_songs):
-        singer = song.singers or '未知歌手'
-        songname = song.song_name or '未知歌曲'
-        album = song.album or '未知专辑'
-        duration = song.duration or '未知时长'
-        ext = song.ext or 'mp3'
-        quality = get_song_quality(song)
-        size = get_song_size(song)
-        
-        print(f"\n[{idx:2d}] 🎵 {singer} - {songname}")
-        print(f"     💿 {album} | ⏱️ {duration} | 🎧 {quality} | 💾 {size} | 📦 {ext.upper()}")
-        print(f"     🌐 {song._source_platform}")
+        # 显示结果，并在用户选择期间预解析前几首的下载链接
+        print_search_results(all_songs)
+        save_results()
+        url_resolver.prefetch(get_client, all_songs[:URL_RESOLVE_TOP_N])
 
-    # 选择下载
-    print(f"\n{'=' * 80}")
-    print(f"📊 总计 {len(all_songs)} 首歌曲")
-    print("=" * 80)
+        # 每个平台一个分页游标，输入 m 时只请求下一页
+        pagers = {
+            source: PlatformPager(music_client.music_clients[source], keyword, search_results.get(source, []))
+            for source in selected_sources
+        }
 
-    user_input = input("\n请输入要下载的歌曲编号（多个用逗号分隔，如 0,2,3，输入 'all' 下载全部）：").strip()
+    memory_profiler.watch('搜索结果', lambda: len(all_songs))
+    source_keys = {src: key for key, (src, _) in all_sources.items()}
+    while True:
+        user_input = input("\n请输入要下载的歌曲编号（多个用逗号分隔，如 0,2,3，输入 'all' 下载全部；"
+                           "输入 m 加载更多，m1,3 只加载指定平台）：").strip()
+        if not user_input.lower().startswith('m'):
+            break
+        keys = [x.strip() for x in user_input[1:].split(',') if x.strip()]
+        sources = [src for src in selected_sources if not keys or source_keys[src] in keys]
+        more_songs = []
+        for source_name, song_list in load_more_pages(pagers, sources, cancel_token).items():
+            for song in song_list:
+                song._source_platform = source_name
+                more_songs.append(song)
+        more_songs, skipped_count = filter_duplicate_songs(more_songs, existing_songs)
+        if skipped_count > 0:
+            print(f"   已跳过 {skipped_count} 首重复歌曲")
+        if ranker is not None:
+            # 已显示的编号保持不变，新加载的一批在自己内部排序
+            ranker.add(more_songs)
+            more_songs.sort(key=lambda song: song._relevance, reverse=True)
+        if more_songs:
+            print_search_results(more_songs, start=len(all_songs))
+            all_songs.extend(more_songs)
+            save_results()
+            url_resolver.prefetch(get_client, more_songs[:URL_RESOLVE_TOP_N])
 
     try:
         if user_input.lower() == 'all':
@@ -526,12 +4342,21 @@ def main():
             return
         
         selected_songs = new_songs
+        if args.enqueue:
+            # 交给下载节点：任务里记录曲库内的相对路径，各节点按自己的挂载点保存
+            added = open_job_queue(args.enqueue).enqueue(selected_songs, save_dir)
+            print(f"\n📮 已加入任务队列 {args.enqueue}: 新增 {added} 首" +
+                  (f"，{len(selected_songs) - added} 首已在队列中" if added < len(selected_songs) else ""))
+            print(f"   在各节点运行: python musicdl_cmd.py --worker {args.enqueue} --save-dir <曲库目录>")
+            return
+        url_resolver.prefetch(get_client, selected_songs)
 
         confirm = input(f"\n准备下载 {len(selected_songs)} 首歌曲到 {save_dir}，确认？(y/n): ").strip().lower()
         
         if confirm == 'y':
             # 执行并行下载
-            parallel_download(music_client, selected_songs, save_dir, download_threads)
+            parallel_download(music_client, selected_songs, save_dir, download_threads,
+                              candidate_pool=all_songs if hedge_enabled else None, cancel_token=cancel_token)
             
             # 显示最终文件列表
             print("\n📁 已下载文件：")
@@ -550,6 +4375,8 @@ def main():
 
     except (ValueError, IndexError) as e:
         print(f"输入错误: {e}")
+    except OperationCancelled:
+        raise
     except Exception as e:
         print(f"发生错误: {e}")
         import traceback
@@ -557,4 +4384,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    except (KeyboardInterrupt, OperationCancelled):
+        print("\n已取消")
@@ -0,0 +1,347 @@
+"""
+音乐下载器 守护进程版
+常驻后台，保持各平台客户端、曲库索引和下载队列常热，
+通过本机 HTTP 接口为 GUI / 命令行提供搜索、下载排队和状态查询
+"""
+import os
+import json
+import time
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock
+from urllib.parse import urlparse, parse_qs
+from musicdl import musicdl
+from musicdl_cmd import (
+    DEFAULT_DAEMON_PORT, LINK_CHECK_MODES, URL_RESOLVE_TOP_N, FairWorkerPool, PostProcessor, SingleFlight,
+    TransferProgress, audio_check_stats, configure_egress, download_flights, download_song_file, egress_stats,
+    get_song_quality, get_song_size, install_link_validations, install_retry_policies, is_song_exists, library_path,
+    link_check_stats, normalize_keyword, plan_search_pages, retry_stats, scan_existing_songs, song_key, url_resolver,
+)
+
+
+ALL_SOURCES = [
+    'KugouMusicClient', 'NeteaseMusicClient', 'QQMusicClient',
+    'KuwoMusicClient', 'MiguMusicClient', 'QianqianMusicClient',
+]
+MAX_CACHED_RESULTS = 5000   # 保留的搜索结果条数，超出后丢弃最早的
+MAX_SEARCH_SIZE = 50
+
+
+def resolve_save_dir(library_dir, save_dir=None):
+    """前端指定的保存目录：只能是曲库目录或其中的子目录，不指定时为曲库目录"""
+    if not save_dir:
+        return library_dir
+    root = os.path.realpath(library_dir)
+    path = os.path.realpath(save_dir)
+    if path != root and not path.startswith(root + os.sep):
+        raise ValueError(f"保存目录必须在曲库 {library_dir} 内: {save_dir}")
+    return path
+
+
+class MusicDaemon:
+    """守护进程核心：常驻客户端 + 曲库索引 + 下载调度"""
+
+    def __init__(self, save_dir, sources=None, thread_count=5, link_check='sampled'):
+        self.save_dir = save_dir
+        self.sources = list(sources or ALL_SOURCES)
+        self.started_at = time.time()
+        self.lock = Lock()
+        os.makedirs(save_dir, exist_ok=True)
+
+        # 常驻的平台客户端（保持会话）
+        init_clients_cfg = {
+            source: {
+                'search_size_per_source': 5,
+                'search_size_per_page': 5,
+                'max_retries': 1,  # 重试由 PlatformRetryPolicy 统一处理
+                'maintain_session': True,
+                'disable_print': True,
+            }
+            for source in self.sources
+        }
+        self.music_client = install_retry_policies(musicdl.MusicClient(
+            music_sources=self.sources,
+            init_music_clients_cfg=init_clients_cfg,
+            clients_threadings={source: 3 for source in self.sources}
+        ))
+        install_link_validations(self.music_client, link_check)
+        self.source_locks = {source: Lock() for source in self.sources}
+        # 各前端的搜索请求轮流占用线程，大请求不会让后来的请求一直排队
+        self.search_pool = FairWorkerPool(len(self.sources) * 2)
+        # 多个前端同时搜索同一个关键词时共用一次平台请求
+        self.search_flights = SingleFlight()
+        self.download_pool = ThreadPoolExecutor(max_workers=thread_count)
+        self.post_processor = PostProcessor()
+
+        # 曲库索引
+        self.existing_songs = scan_existing_songs(save_dir)
+
+        # 搜索结果缓存与下载任务
+        self.results = OrderedDict()
+        self.next_result_id = 1
+        self.jobs = OrderedDict()
+        self.next_job_id = 1
+        self.active_keys = {}
+
+    # ---------- 搜索 ----------
+    def _search_one(self, source, keyword, size):
+        songs, _ = self.search_flights.do((source, normalize_keyword(keyword), size),
+                                          lambda: self._run_search(source, keyword, size))
+        return songs
+
+    def _run_search(self, source, keyword, size):
+        client = self.music_client.music_clients[source]
+        # 同一个客户端被多个请求共用，搜索条数是客户端属性，同平台的搜索依次进行
+        with self.source_locks[source]:
+            page_size, _, concurrency = plan_search_pages(source, size)
+            client.search_size_per_source = size
+            client.search_size_per_page = page_size
+            try:
+                return client.search(keyword=keyword, num_threadings=concurrency, main_process_context=TransferProgress())
+            except Exception:
+                return []
+
+    def search(self, keyword, sources=None, size=5):
+        """并行搜索，返回 {source: [结果字典]}，已在曲库中的歌曲会被过滤掉"""
+        sources = [s for s in (sources or self.sources) if s in self.music_client.music_clients]
+        size = max(1, min(int(size), MAX_SEARCH_SIZE))
+        request = object()  # 本次请求在公平线程池中的会话标识
+        futures = {source: self.search_pool.submit(request, self._search_one, source, keyword, size) for source in sources}
+        response = {}
+        found = []
+        for source, future in futures.items():
+            songs = [song for song in future.result() if not is_song_exists(song, self.existing_songs)]
+            response[source] = [self._remember(song) for song in songs]
+            found.extend(songs)
+        # 前端挑选期间预解析下载链接
+        url_resolver.prefetch(lambda source: self.music_client.music_clients[source], found[:URL_RESOLVE_TOP_N])
+        return response
+
+    def _remember(self, song):
+        with self.lock:
+            result_id = self.next_result_id
+            self.next_result_id += 1
+            self.results[result_id] = song
+            while len(self.results) > MAX_CACHED_RESULTS:
+                self.results.popitem(last=False)
+        return {
+            'id': result_id,
+            'source': song.source,
+            'singers': song.singers,
+            'song_name': song.song_name,
+            'album': song.album,
+            'duration': song.duration,
+            'ext': song.ext,
+            'quality': get_song_quality(song),
+            'size': get_song_size(song),
+        }
+
+    # ---------- 下载 ----------
+    def enqueue(self, result_ids, save_dir=None):
+        """把搜索结果加入下载队列，返回任务列表；同一首歌正在下载时复用已有任务
+        save_dir: 曲库目录下的子目录，曲库以外的路径抛出 ValueError
+        """
+        save_dir = resolve_save_dir(self.save_dir, save_dir)
+        os.makedirs(save_dir, exist_ok=True)
+        jobs = []
+        for result_id in result_ids:
+            song = self.results.get(int(result_id))
+            if song is None:
+                jobs.append({'result_id': result_id, 'status': 'unknown'})
+                continue
+            save_path = library_path(save_dir, song)
+            with self.lock:
+                active = self.active_keys.get(save_path)
+                if active is not None:
+                    jobs.append(self._job_view(active))
+                    continue
+                job = {
+                    'id': self.next_job_id, 'result_id': int(result_id), 'status': 'queued',
+                    'title': f"{song.singers} - {song.song_name}", 'path': save_path,
+                    'bytes': 0, 'total': None, 'error': None, 'created_at': time.time(),
+                }
+                self.next_job_id += 1
+                self.jobs[job['id']] = job
+                self.active_keys[save_path] = job
+            self.download_pool.submit(self._run_job, job, song)
+            jobs.append(self._job_view(job))
+        return jobs
+
+    def _run_job(self, job, song):
+        def on_bytes(n):
+            job['bytes'] += n
+            job['total'] = progress.total
+
+        progress = TransferProgress(on_bytes=on_bytes)
+        job['status'] = 'downloading'
+        self.post_processor.prefetch(song)
+        try:
+            client = self.music_client.music_clients[song.source]
+            ok = download_song_file(client, song, job['path'], progress, auto_supplement_song=False)
+            job['status'] = 'done' if ok else 'failed'
+            if ok:
+                self.post_processor.submit(song)
+                with self.lock:
+                    self.existing_songs.add(song_key(song))
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)[:200]
+        finally:
+            with self.lock:
+                self.active_keys.pop(job['path'], None)
+
+    def _job_view(self, job):
+        return dict(job)
+
+    def list_jobs(self, job_ids=None):
+        with self.lock:
+            if job_ids:
+                return [self._job_view(self.jobs[j]) for j in job_ids if j in self.jobs]
+            return [self._job_view(job) for job in self.jobs.values()]
+
+    # ---------- 状态 ----------
+    def close(self):
+        """退出前调用：放弃还在排队的任务，等进行中的下载完成，再把已下载歌曲的标签和封面写完"""
+        self.download_pool.shutdown(wait=True, cancel_futures=True)
+        self.post_processor.close()
+
+    def refresh_library(self):
+        existing = scan_existing_songs(self.save_dir)
+        with self.lock:
+            self.existing_songs = existing
+        return len(existing)
+
+    def status(self):
+        with self.lock:
+            counts = {'queued': 0, 'downloading': 0, 'done': 0, 'failed': 0}
+            for job in self.jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return {
+                'sources': self.sources,
+                'save_dir': self.save_dir,
+                'library_size': len(self.existing_songs),
+                'cached_results': len(self.results),
+                'jobs': counts,
+                'postprocess': dict(self.post_processor.stats, pending=self.post_processor.queue.qsize()),
+                'url_cache': dict(url_resolver.stats, cached=len(url_resolver.entries)),
+                'retries': retry_stats(),
+                'link_check': link_check_stats(),
+                'coalesced': {'searches': self.search_flights.stats['shared'], 'downloads': download_flights.stats['shared']},
+                'egress': egress_stats(),
+                'audio_check': dict(audio_check_stats),
+                'uptime': round(time.time() - self.started_at, 1),
+            }
+
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """HTTP 接口
+    GET  /status                          守护进程状态
+    GET  /search?keyword=&sources=&size=  搜索（sources 用逗号分隔）
+    POST /enqueue {"ids": [...], "save_dir": 可选}
+    GET  /jobs?ids=1,2                    下载任务状态
+    POST /refresh                         重新扫描曲库
+    """
+    music_daemon = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path == '/status':
+                self._send_json(self.music_daemon.status())
+            elif url.path == '/search':
+                keyword = params.get('keyword', '').strip()
+                if not keyword:
+                    self._send_json({'error': 'keyword 不能为空'}, 400)
+                    return
+                sources = [s for s in params.get('sources', '').split(',') if s]
+                self._send_json(self.music_daemon.search(keyword, sources, params.get('size', 5)))
+            elif url.path == '/jobs':
+                ids = [int(i) for i in params.get('ids', '').split(',') if i.strip().isdigit()]
+                self._send_json(self.music_daemon.list_jobs(ids))
+            else:
+                self._send_json({'error': 'not found'}, 404)
+        except Exception as e:
+            self._send_json({'error': str(e)}, 500)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        # 只接受 JSON：浏览器中的网页不经预检就能发出 text/plain 等"简单请求"，带 JSON 类型则需要预检，本服务不响应预检
+        ctype = (self.headers.get('Content-Type') or '').split(';', 1)[0].strip().lower()
+        if ctype != 'application/json':
+            self._send_json({'error': '只接受 Content-Type: application/json 的请求'}, 415)
+            return
+        try:
+            if url.path == '/enqueue':
+                data = self._read_json()
+                self._send_json(self.music_daemon.enqueue(data.get('ids', []), data.get('save_dir')))
+            elif url.path == '/refresh':
+                self._send_json({'library_size': self.music_daemon.refresh_library()})
+            else:
+                self._send_json({'error': 'not found'}, 404)
+        except ValueError as e:
+            self._send_json({'error': str(e)}, 400)
+        except Exception as e:
+            self._send_json({'error': str(e)}, 500)
+
+
+def serve(daemon, port=DEFAULT_DAEMON_PORT):
+    """创建只监听 127.0.0.1 的 HTTP 服务，调用 serve_forever() 开始处理请求"""
+    handler = type('BoundDaemonRequestHandler', (DaemonRequestHandler,), {'music_daemon': daemon})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    default_dir = os.path.join(os.path.expanduser("~"), "Music")
+    parser = argparse.ArgumentParser(description="🎵 音乐下载器 守护进程")
+    parser.add_argument('--port', type=int, default=DEFAULT_DAEMON_PORT, help='监听端口（只监听 127.0.0.1）')
+    parser.add_argument('--save-dir', default=default_dir, help='共享曲库目录')
+    parser.add_argument('--threads', type=int, default=5, help='并行下载线程数')
+    parser.add_argument('--sources', default=','.join(ALL_SOURCES), help='启用的平台，逗号分隔')
+    parser.add_argument('--link-check', choices=LINK_CHECK_MODES, default='sampled',
+                        help='链接验证模式：sampled 每个平台抽样验证（默认），full 全部验证，none 跳过验证')
+    parser.add_argument('--normal', action='store_true', help='标准模式，等同于 --link-check full')
+    parser.add_argument('--proxy', action='append', metavar='URL',
+                        help='出口代理（可重复，如 --proxy 127.0.0.1:8001 --proxy direct），请求在各出口间轮询，被限流的出口暂停使用')
+    args = parser.parse_args()
+    configure_egress(args.proxy)
+
+    print(f"正在初始化平台客户端...")
+    daemon = MusicDaemon(args.save_dir, [s for s in args.sources.split(',') if s], args.threads,
+                         'full' if args.normal else args.link_check)
+    server = serve(daemon, args.port)
+    print(f"🎵 守护进程已启动: http://127.0.0.1:{args.port}")
+    print(f"   曲库: {args.save_dir} ({len(daemon.existing_songs)} 首) | 下载线程: {args.threads}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在退出...")
+    finally:
+        server.server_close()
+        print("正在等待进行中的下载和标签写入完成...")
+        daemon.close()
+
+
+if __name__ == "__main__":
+    main()
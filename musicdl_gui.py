@@ -5,48 +5,138 @@
 """
 import os
 import sys
+import time
+import argparse
+import traceback
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from threading import Thread, Lock
+from threading import Thread, Lock, Event, get_ident
 import queue
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from musicdl import musicdl
-from musicdl.modules.utils.misc import AudioLinkTester
+from musicdl_cmd import (
+    APP_DATA_DIR, DEFAULT_DAEMON_URL, LOCAL_SOURCE, MEMPROF_INTERVAL, MEMPROF_LOG, SEARCH_POOL_WORKERS, URL_RESOLVE_TOP_N,
+    ByteProgressAggregator, CancelToken, DaemonClient, FairWorkerPool, LibraryIndex, OperationCancelled, PlatformPager,
+    PostProcessor, RelevanceRanker,
+    SearchHistory, SearchPrefetcher, SearchResultCache, TransferProgress,
+    audio_check_stats, bind_cancel_token, build_music_client, configure_egress, download_song_file, export_results,
+    find_song_candidates, format_audio_check_summary, format_link_check_summary, format_retry_summary,
+    format_transfer_status, get_library,
+    hedged_download, iter_completed, iter_result_file, library_path, memory_profiler, parse_tracklist, plan_search_pages,
+    link_check_stats, prefetch_platforms, read_results_header, retry_stats, run_import_pipeline, search_client_cfg, url_resolver, wait_for_daemon_jobs,
+)
 
 
-# ========== Monkey Patch: 禁用链接验证加速搜索 ==========
-_original_test = None
-_original_probe = None
+# ========== 主线程卡顿检测 ==========
+UI_STALL_THRESHOLD_MS = 250     # 事件循环超过这么久没有响应即记为一次卡顿
+UI_HEARTBEAT_MS = 50            # 心跳间隔
+UI_STALL_LOG = os.path.join(APP_DATA_DIR, "ui_stalls.log")
 
-def fast_test(self, url, request_overrides=None):
-    """快速验证，不发送HTTP请求"""
-    return dict(ok=True, status=200, method="HEAD", final_url=url,
-                ctype="audio/mpeg", clen=None, range=True, fmt=None, reason="fast mode")
 
-def fast_probe(self, url, request_overrides=None):
-    """快速探测，不发送实际请求"""
-    ext = url.split('?')[0].split('.')[-1] if '?' in url or '.' in url else 'mp3'
-    return dict(file_size='NULL', ctype='audio/mpeg', ext=ext, download_url=url, final_url=url)
+class MainThreadWatchdog:
+    """Tk 事件循环卡顿检测
+    主线程通过 root.after 定时打心跳，超出预定间隔的部分即事件循环延迟；
+    监视线程发现心跳超过阈值没有更新时，抓取主线程此刻的调用栈（也就是卡住主线程的代码），
+    卡顿结束后连同时长一起写入 UI_STALL_LOG
+    """
+    def __init__(self, root, threshold_ms=UI_STALL_THRESHOLD_MS, heartbeat_ms=UI_HEARTBEAT_MS, log_path=UI_STALL_LOG):
+        self.root = root
+        self.threshold = threshold_ms / 1000
+        self.heartbeat_ms = heartbeat_ms
+        self.log_path = log_path
+        self.main_thread_id = get_ident()   # 必须在 Tk 主线程中创建
+        self.lock = Lock()
+        self.last_beat = time.monotonic()
+        self.stats = {'beats': 0, 'stalls': 0, 'max_latency': 0.0, 'stalled_seconds': 0.0}
+        self._stack = None                  # 当前这次卡顿中抓到的主线程调用栈
+        self._stopped = Event()
+
+    def start(self):
+        self.last_beat = time.monotonic()
+        self.root.after(self.heartbeat_ms, self._beat)
+        Thread(target=self._monitor, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _beat(self):
+        if self._stopped.is_set():
+            return
+        now = time.monotonic()
+        with self.lock:
+            latency = max(0.0, now - self.last_beat - self.heartbeat_ms / 1000)
+            self.last_beat = now
+            stack, self._stack = self._stack, None
+            self.stats['beats'] += 1
+            self.stats['max_latency'] = max(self.stats['max_latency'], latency)
+            if latency >= self.threshold:
+                self.stats['stalls'] += 1
+                self.stats['stalled_seconds'] += latency
+        if latency >= self.threshold:
+            self._report(latency, stack)
+        self.root.after(self.heartbeat_ms, self._beat)
+
+    def _monitor(self):
+        # 每半个阈值检查一次，卡顿期间只抓一次调用栈
+        while not self._stopped.wait(self.threshold / 2):
+            with self.lock:
+                overdue = time.monotonic() - self.last_beat - self.heartbeat_ms / 1000
+                if self._stack is not None or overdue < self.threshold:
+                    continue
+                frame = sys._current_frames().get(self.main_thread_id)
+                if frame is not None:
+                    self._stack = ''.join(traceback.format_stack(frame))
 
-def enable_fast_mode():
-    global _original_test, _original_probe
-    if _original_test is None:
-        _original_test = AudioLinkTester.test
-        _original_probe = AudioLinkTester.probe
-    AudioLinkTester.test = fast_test
-    AudioLinkTester.probe = fast_probe
+    def _report(self, latency, stack):
+        header = f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 主线程卡顿 {latency * 1000:.0f} ms"
+        print(header)
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(header + '\n' + (stack or '  （卡顿期间未抓到调用栈）\n') + '\n')
+        except OSError:
+            pass
+
+    def summary(self):
+        stats = self.stats
+        return (f"界面心跳 {stats['beats']} 次 | 卡顿 {stats['stalls']} 次，共 {stats['stalled_seconds']:.1f} 秒 | "
+                f"最长延迟 {stats['max_latency'] * 1000:.0f} ms")
+
+
+LOAD_RESULTS_BATCH = 200        # 载入结果集时每批交给界面显示的歌曲数
+
+
+class SearchSession:
+    """一个搜索标签页：各自的结果列表、分页游标、取消令牌和进度"""
+    def __init__(self, session_id, frame, tree):
+        self.id = session_id
+        self.frame = frame
+        self.tree = tree
+        self.keyword = ''
+        self.all_songs = []
+        self.local_songs = []       # 本地曲库中匹配的歌曲，只显示不下载
+        self.network_pending = None # 本地已有匹配时暂不搜索的平台，"加载更多"中可以继续搜索网络
+        self.pagers = {}            # 平台 -> PlatformPager，"加载更多"只请求下一页
+        self.ranker = None          # 搜索结果按相关度插入列表；载入的结果集保持原顺序
+        self.link_check = None      # 本次搜索的链接验证模式，搜索客户端和分页游标都按它验证
+        self.search_size = None     # 本次搜索每个平台的条数，开始搜索时在界面线程读取
+        self.token = None           # 当前搜索的取消令牌，旧搜索的消息会被丢弃
+        self.searching = False
+        self.progress = 0.0
+        self.status = "就绪"
 
-def disable_fast_mode():
-    global _original_test, _original_probe
-    if _original_test is not None and _original_probe is not None:
-        AudioLinkTester.test = _original_test
-        AudioLinkTester.probe = _original_probe
-# =========================================================
+    def title(self):
+        if not self.keyword:
+            return "新搜索"
+        name = self.keyword if len(self.keyword) <= 12 else self.keyword[:11] + '…'
+        return f"{'⏳ ' if self.searching else ''}{name} ({len(self.all_songs)})"
 
 
 class MusicDownloaderGUI:
-    def __init__(self, root):
+    def __init__(self, root, daemon_client=None):
         self.root = root
+        self.daemon_client = daemon_client  # 不为空时作为守护进程的瘦前端
         self.root.title("🎵 音乐下载器 - 并行实时版")
         self.root.geometry("1100x750")
         self.root.minsize(1000, 650)
@@ -59,11 +149,23 @@ class MusicDownloaderGUI:
         
         # 初始化变量
         self.music_client = None
-        self.all_songs = []
         self.search_queue = queue.Queue()
         self.download_queue = queue.Queue()
-        self.searching = False
         self.downloading = False
+        self.download_token = None
+        
+        # 搜索会话：每个标签页一个，所有会话的平台搜索共用一个公平调度的线程池
+        self.sessions = {}
+        self.next_session_id = 1
+        self.search_pool = FairWorkerPool(SEARCH_POOL_WORKERS)
+        
+        # 搜索历史补全与预取
+        self.search_history = SearchHistory()
+        self.search_cache = SearchResultCache()
+        self.prefetcher = SearchPrefetcher(self.prefetch_search)
+        self.resolve_clients = {}
+        self.library_index = None   # 当前保存目录的曲库索引，搜索时先查本地
+        self.watch_memory()
         
         # 平台配置 - 所有平台
         self.all_sources = {
@@ -76,6 +178,7 @@ class MusicDownloaderGUI:
         }
         
         self.setup_ui()
+        self.connect_daemon()
         self.update_ui()
         
     def setup_ui(self):
@@ -132,31 +235,55 @@ class MusicDownloaderGUI:
         ttk.Label(search_frame, text="歌曲名称：").grid(row=0, column=0, sticky=tk.W, pady=5)
         self.search_entry = ttk.Entry(search_frame, font=("Microsoft YaHei", 10))
         self.search_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
-        self.search_entry.bind('<Return>', lambda e: self.start_search())
+        self.search_entry.bind('<Return>', self.on_search_return)
+        self.search_entry.bind('<KeyRelease>', self.on_search_typed)
+        self.search_entry.bind('<Down>', self.focus_suggestions)
+        self.search_entry.bind('<Escape>', lambda e: self.hide_suggestions())
+        self.search_entry.bind('<FocusOut>', lambda e: self.root.after(150, self.hide_suggestions_unless_focused))
+        
+        # 历史补全下拉列表（叠放在输入框下方，有候选时才显示）
+        self.suggest_list = tk.Listbox(main_frame, height=6, font=("Microsoft YaHei", 10), activestyle='dotbox')
+        self.suggest_list.bind('<Return>', self.apply_suggestion)
+        self.suggest_list.bind('<Double-Button-1>', self.apply_suggestion)
+        self.suggest_list.bind('<Escape>', lambda e: (self.hide_suggestions(), self.search_entry.focus_set()))
+        self.suggest_list.bind('<FocusOut>', lambda e: self.root.after(150, self.hide_suggestions_unless_focused))
         
         # 搜索按钮
         self.search_btn = ttk.Button(search_frame, text="🔍 开始搜索", command=self.start_search, width=12)
         self.search_btn.grid(row=0, column=2, padx=5, pady=5)
         
+        # 停止搜索按钮
+        self.stop_search_btn = ttk.Button(search_frame, text="⏹ 停止", command=self.stop_search, width=8, state='disabled')
+        self.stop_search_btn.grid(row=0, column=3, padx=5, pady=5)
+        
+        # 歌单导入按钮
+        self.import_btn = ttk.Button(search_frame, text="📄 导入歌单", command=self.start_import, width=12)
+        self.import_btn.grid(row=0, column=4, padx=5, pady=5)
+        
         # 配置选项
         config_frame = ttk.Frame(search_frame)
-        config_frame.grid(row=1, column=0, columnspan=3, pady=5, sticky=tk.W)
+        config_frame.grid(row=1, column=0, columnspan=5, pady=5, sticky=tk.W)
         
-        ttk.Label(config_frame, text="每平台结果数：").pack(side=tk.LEFT)
+        ttk.Label(config_frame, text="每平台每页：").pack(side=tk.LEFT)
         self.search_size_var = tk.StringVar(value="5")
         search_size_spin = ttk.Spinbox(config_frame, from_=1, to=20, textvariable=self.search_size_var, width=5)
         search_size_spin.pack(side=tk.LEFT, padx=5)
         
         ttk.Label(config_frame, text="搜索模式：").pack(side=tk.LEFT, padx=(20, 0))
-        self.search_mode_var = tk.StringVar(value="fast")
-        ttk.Radiobutton(config_frame, text="⚡ 极速", variable=self.search_mode_var, value="fast").pack(side=tk.LEFT)
-        ttk.Radiobutton(config_frame, text="标准", variable=self.search_mode_var, value="normal").pack(side=tk.LEFT, padx=5)
+        # 链接验证模式：每次搜索 / 导入创建的客户端各自带上，不同模式的任务可以同时进行
+        self.search_mode_var = tk.StringVar(value="sampled")
+        ttk.Radiobutton(config_frame, text="⚡ 抽样", variable=self.search_mode_var, value="sampled").pack(side=tk.LEFT)
+        ttk.Radiobutton(config_frame, text="标准", variable=self.search_mode_var, value="full").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(config_frame, text="极速", variable=self.search_mode_var, value="none").pack(side=tk.LEFT)
         
         ttk.Label(config_frame, text="下载线程数：").pack(side=tk.LEFT, padx=(20, 0))
         self.thread_count_var = tk.StringVar(value="5")
         thread_count_spin = ttk.Spinbox(config_frame, from_=1, to=20, textvariable=self.thread_count_var, width=5)
         thread_count_spin.pack(side=tk.LEFT, padx=5)
         
+        self.hedge_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(config_frame, text="多源对冲下载", variable=self.hedge_var).pack(side=tk.LEFT, padx=(20, 0))
+        
         # ===== 搜索进度区 =====
         progress_frame = ttk.LabelFrame(main_frame, text="搜索进度", padding="10")
         progress_frame.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
@@ -171,49 +298,36 @@ class MusicDownloaderGUI:
         self.search_status_var = tk.StringVar(value="就绪")
         ttk.Label(progress_frame, textvariable=self.search_status_var).grid(row=1, column=0, sticky=tk.W)
         
-        # ===== 结果显示区 =====
+        # ===== 结果显示区（每个搜索一个标签页）=====
         result_frame = ttk.LabelFrame(main_frame, text="搜索结果 (实时更新)", padding="10")
         result_frame.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
         result_frame.columnconfigure(0, weight=1)
         result_frame.rowconfigure(0, weight=1)
         
-        # 创建Treeview
-        columns = ('序号', '歌手', '歌曲', '专辑', '时长', '音质', '大小', '格式', '来源')
-        self.tree = ttk.Treeview(result_frame, columns=columns, show='headings', height=12)
-        
-        # 设置列宽
-        self.tree.column('序号', width=40, anchor='center')
-        self.tree.column('歌手', width=120)
-        self.tree.column('歌曲', width=150)
-        self.tree.column('专辑', width=120)
-        self.tree.column('时长', width=60, anchor='center')
-        self.tree.column('音质', width=80, anchor='center')
-        self.tree.column('大小', width=60, anchor='center')
-        self.tree.column('格式', width=50, anchor='center')
-        self.tree.column('来源', width=80, anchor='center')
-        
-        # 设置表头
-        for col in columns:
-            self.tree.heading(col, text=col)
-        
-        # 滚动条
-        scrollbar_y = ttk.Scrollbar(result_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        scrollbar_x = ttk.Scrollbar(result_frame, orient=tk.HORIZONTAL, command=self.tree.xview)
-        self.tree.configure(yscrollcommand=scrollbar_y.set, xscrollcommand=scrollbar_x.set)
-        
-        self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        scrollbar_y.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        scrollbar_x.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        self.notebook = ttk.Notebook(result_frame)
+        self.notebook.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.notebook.bind('<<NotebookTabChanged>>', lambda e: self.refresh_session_controls())
         
         # 结果操作按钮
         result_btn_frame = ttk.Frame(result_frame)
-        result_btn_frame.grid(row=2, column=0, columnspan=2, pady=(5, 0))
+        result_btn_frame.grid(row=1, column=0, pady=(5, 0))
         
         ttk.Button(result_btn_frame, text="全选", command=self.select_all_songs, width=10).pack(side=tk.LEFT, padx=5)
         ttk.Button(result_btn_frame, text="取消选择", command=self.deselect_all_songs, width=10).pack(side=tk.LEFT, padx=5)
         ttk.Button(result_btn_frame, text="反选", command=self.invert_selection, width=10).pack(side=tk.LEFT, padx=5)
         ttk.Button(result_btn_frame, text="清空结果", command=self.clear_results, width=10).pack(side=tk.LEFT, padx=5)
         
+        # 加载更多：每个平台单独加载下一页
+        self.load_more_btn = ttk.Menubutton(result_btn_frame, text="➕ 加载更多", width=12, state='disabled')
+        self.load_more_menu = tk.Menu(self.load_more_btn, tearoff=0)
+        self.load_more_btn['menu'] = self.load_more_menu
+        self.load_more_btn.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(result_btn_frame, text="＋ 新标签", command=self.new_session, width=10).pack(side=tk.LEFT, padx=5)
+        ttk.Button(result_btn_frame, text="✖ 关闭标签", command=self.close_session, width=10).pack(side=tk.LEFT, padx=5)
+        ttk.Button(result_btn_frame, text="💾 导出结果", command=self.export_session, width=10).pack(side=tk.LEFT, padx=5)
+        ttk.Button(result_btn_frame, text="📂 载入结果", command=self.start_load_results, width=10).pack(side=tk.LEFT, padx=5)
+        
         # ===== 下载控制区 =====
         download_frame = ttk.LabelFrame(main_frame, text="下载设置", padding="10")
         download_frame.grid(row=5, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
@@ -236,13 +350,23 @@ class MusicDownloaderGUI:
         self.download_progress_bar.grid(row=1, column=0, sticky=(tk.W, tk.E), pady=5)
         
         # 下载按钮
+        download_btn_frame = ttk.Frame(download_frame)
+        download_btn_frame.grid(row=2, column=0, pady=(5, 0))
         self.download_btn = ttk.Button(
-            download_frame, 
+            download_btn_frame, 
             text="⬇️ 开始下载", 
             command=self.start_download,
             width=20
         )
-        self.download_btn.grid(row=2, column=0, pady=(5, 0))
+        self.download_btn.pack(side=tk.LEFT, padx=5)
+        self.stop_download_btn = ttk.Button(
+            download_btn_frame,
+            text="⏹ 停止下载",
+            command=self.stop_download,
+            width=12,
+            state='disabled'
+        )
+        self.stop_download_btn.pack(side=tk.LEFT, padx=5)
         
         # ===== 状态栏 =====
         status_frame = ttk.Frame(main_frame, relief=tk.SUNKEN)
@@ -256,6 +380,188 @@ class MusicDownloaderGUI:
         self.count_label = ttk.Label(status_frame, text="找到 0 首歌曲", padding=(5, 2))
         self.count_label.grid(row=0, column=2)
         
+        self.new_session()
+        
+    # ===== 搜索会话（标签页）=====
+    @property
+    def session(self):
+        """当前标签页的搜索会话"""
+        return self.sessions[str(self.notebook.select())]
+    
+    @property
+    def tree(self):
+        return self.session.tree
+    
+    @property
+    def all_songs(self):
+        return self.session.all_songs
+    
+    def new_session(self):
+        """新建一个搜索标签页并切换过去"""
+        frame = ttk.Frame(self.notebook, padding=(0, 5, 0, 0))
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(0, weight=1)
+        
+        # 创建Treeview
+        columns = ('序号', '歌手', '歌曲', '专辑', '时长', '音质', '大小', '格式', '来源')
+        tree = ttk.Treeview(frame, columns=columns, show='headings', height=12)
+        
+        # 设置列宽
+        tree.column('序号', width=40, anchor='center')
+        tree.column('歌手', width=120)
+        tree.column('歌曲', width=150)
+        tree.column('专辑', width=120)
+        tree.column('时长', width=60, anchor='center')
+        tree.column('音质', width=80, anchor='center')
+        tree.column('大小', width=60, anchor='center')
+        tree.column('格式', width=50, anchor='center')
+        tree.column('来源', width=80, anchor='center')
+        
+        # 设置表头
+        for col in columns:
+            tree.heading(col, text=col)
+        
+        # 滚动条
+        scrollbar_y = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        scrollbar_x = ttk.Scrollbar(frame, orient=tk.HORIZONTAL, command=tree.xview)
+        tree.configure(yscrollcommand=scrollbar_y.set, xscrollcommand=scrollbar_x.set)
+        
+        tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        tree.bind('<<TreeviewSelect>>', lambda e: self.prefetch_download_urls(self.get_tree_selected_songs()))
+        scrollbar_y.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        scrollbar_x.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        
+        session = SearchSession(self.next_session_id, frame, tree)
+        self.next_session_id += 1
+        self.sessions[str(frame)] = session
+        self.notebook.add(frame, text=session.title())
+        self.notebook.select(frame)
+        self.refresh_session_controls()
+        return session
+    
+    def close_session(self):
+        """关闭当前标签页，其中正在进行的搜索会被停止"""
+        session = self.session
+        if session.token is not None:
+            session.token.cancel()
+        del self.sessions[str(session.frame)]
+        self.notebook.forget(session.frame)
+        session.frame.destroy()
+        if not self.sessions:
+            self.new_session()
+        else:
+            self.refresh_session_controls()
+    
+    def refresh_session_controls(self):
+        """切换标签页或会话状态变化后，让进度区、计数和按钮显示当前会话"""
+        if not self.notebook.select():
+            return
+        session = self.session
+        self.search_progress_var.set(session.progress)
+        self.search_status_var.set(session.status)
+        self.count_label.config(text=f"找到 {len(session.all_songs)} 首歌曲")
+        self.stop_search_btn.config(state='normal' if session.searching else 'disabled')
+        self.update_load_more_menu()
+    
+    def set_session_status(self, session, status, progress=None):
+        """记录会话的搜索状态，会话在当前标签页时同步到进度区"""
+        session.status = status
+        if progress is not None:
+            session.progress = progress
+        if session is self.session:
+            self.search_status_var.set(status)
+            self.search_progress_var.set(session.progress)
+    
+    def update_session_tab(self, session):
+        self.notebook.tab(session.frame, text=session.title())
+        
+    def connect_daemon(self):
+        """守护进程模式：使用守护进程的共享曲库目录"""
+        if not self.daemon_client:
+            return
+        try:
+            status = self.daemon_client.status()
+        except Exception as e:
+            messagebox.showwarning("警告", f"无法连接守护进程 {self.daemon_client.base_url}\n{e}\n将使用本地模式")
+            self.daemon_client = None
+            return
+        self.save_path_var.set(status['save_dir'])
+        self.root.title(f"🎵 音乐下载器 - 守护进程模式 ({self.daemon_client.base_url})")
+        self.status_var.set(f"已连接守护进程 - 曲库 {status['library_size']} 首")
+        
+    # ===== 搜索历史补全 =====
+    def on_search_typed(self, event):
+        """输入变化时刷新补全列表，并在停顿后预取排名第一的候选"""
+        if event.keysym in ('Return', 'Escape', 'Down', 'Up', 'Left', 'Right', 'Tab'):
+            return
+        text = self.search_entry.get()
+        suggestions = self.search_history.complete(text)
+        if not suggestions or (len(suggestions) == 1 and suggestions[0] == text.strip()):
+            self.hide_suggestions()
+        else:
+            self.show_suggestions(suggestions)
+        if suggestions and not self.daemon_client and not self.session.searching:
+            try:
+                search_size = int(self.search_size_var.get())
+            except ValueError:
+                return
+            # 验证模式在界面线程读取，预取线程不访问 tk 变量
+            self.prefetcher.schedule(suggestions[0], self.get_selected_platforms(), search_size,
+                                     self.search_mode_var.get())
+        else:
+            self.prefetcher.cancel()
+    
+    def show_suggestions(self, suggestions):
+        """在输入框下方显示补全候选"""
+        self.suggest_list.delete(0, tk.END)
+        for keyword in suggestions:
+            self.suggest_list.insert(tk.END, keyword)
+        self.suggest_list.config(height=min(len(suggestions), 6))
+        self.suggest_list.place(in_=self.search_entry, x=0, rely=1.0, relwidth=1.0)
+        self.suggest_list.lift()
+    
+    def hide_suggestions(self):
+        self.suggest_list.place_forget()
+    
+    def hide_suggestions_unless_focused(self):
+        if self.root.focus_get() not in (self.search_entry, self.suggest_list):
+            self.hide_suggestions()
+    
+    def focus_suggestions(self, event=None):
+        """按 ↓ 进入候选列表"""
+        if self.suggest_list.winfo_ismapped() and self.suggest_list.size():
+            self.suggest_list.focus_set()
+            self.suggest_list.selection_clear(0, tk.END)
+            self.suggest_list.selection_set(0)
+            self.suggest_list.activate(0)
+        return 'break'
+    
+    def apply_suggestion(self, event=None):
+        """把选中的候选填入输入框"""
+        selection = self.suggest_list.curselection()
+        if selection:
+            self.search_entry.delete(0, tk.END)
+            self.search_entry.insert(0, self.suggest_list.get(selection[0]))
+        self.hide_suggestions()
+        self.search_entry.focus_set()
+        self.search_entry.icursor(tk.END)
+        return 'break'
+    
+    def on_search_return(self, event=None):
+        self.hide_suggestions()
+        self.start_search()
+    
+    def prefetch_search(self, keyword, platforms, search_size, link_check):
+        """后台预取（在 SearchPrefetcher 的定时线程中运行），结果进入 search_cache
+        link_check: 调度预取时界面上选择的链接验证模式
+        """
+        prefetch_platforms(
+            self.search_cache,
+            lambda source, kw: self.run_platform_search(
+                self.create_search_client(source, search_size, link_check), source, kw, search_size),
+            platforms, keyword, search_size, link_check, self.search_pool.executor('prefetch')
+        )
+    
     def select_all_platforms(self):
         """全选平台"""
         for source_info in self.all_sources.values():
@@ -287,11 +593,17 @@ class MusicDownloaderGUI:
                 self.tree.selection_add(item)
     
     def clear_results(self):
-        """清空结果"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        self.all_songs.clear()
-        self.count_label.config(text="找到 0 首歌曲")
+        """清空当前标签页的结果"""
+        session = self.session
+        for item in session.tree.get_children():
+            session.tree.delete(item)
+        session.all_songs.clear()
+        session.local_songs.clear()
+        session.network_pending = None
+        session.pagers.clear()
+        session.ranker = None
+        self.update_session_tab(session)
+        self.refresh_session_controls()
                 
     def browse_folder(self):
         """浏览文件夹"""
@@ -307,6 +619,17 @@ class MusicDownloaderGUI:
                 selected.append(source_id)
         return selected
     
+    def read_count(self, var, label):
+        """在界面线程读取数量输入框（后台线程不访问 tk 变量），不是正整数时提示并返回 None"""
+        try:
+            value = int(var.get())
+        except ValueError:
+            value = 0
+        if value < 1:
+            messagebox.showwarning("警告", f"{label}必须是正整数")
+            return None
+        return value
+    
     def get_song_quality(self, song):
         """获取歌曲音质"""
         if hasattr(song, 'raw_data') and song.raw_data:
@@ -378,6 +701,10 @@ class MusicDownloaderGUI:
         if not os.path.exists(directory):
             return existing_songs
         
+        library = get_library(directory)
+        if library.sharded:
+            return library.song_keys()
+        
         audio_extensions = {'.mp3', '.flac', '.wav', '.m4a', '.aac', '.ogg', '.wma', '.ape'}
         
         try:
@@ -399,12 +726,12 @@ class MusicDownloaderGUI:
         
         return (singer, songname) in existing_songs
     
-    def filter_duplicate_songs(self, songs, save_dir):
-        """过滤掉已存在的歌曲，返回新歌曲列表和跳过的数量"""
-        existing_songs = self.scan_existing_songs(save_dir)
-        
+    def filter_duplicate_songs(self, songs, existing_songs):
+        """过滤掉已存在的歌曲（existing_songs 由 scan_existing_songs 得到），返回新歌曲列表和跳过的数量
+        在搜索线程中调用，避免在 Tk 主线程里扫描磁盘
+        """
         if not existing_songs:
-            return songs, 0, 0
+            return songs, 0
         
         new_songs = []
         skipped = 0
@@ -415,13 +742,10 @@ class MusicDownloaderGUI:
             else:
                 new_songs.append(song)
         
-        return new_songs, skipped, len(existing_songs)
+        return new_songs, skipped
         
     def start_search(self):
-        """开始搜索"""
-        if self.searching:
-            return
-            
+        """开始搜索；当前标签页正在搜索或已有结果时，新查询在新标签页中进行"""
         keyword = self.search_entry.get().strip()
         if not keyword:
             messagebox.showwarning("警告", "请输入歌曲名称")
@@ -431,139 +755,440 @@ class MusicDownloaderGUI:
         if not selected_platforms:
             messagebox.showwarning("警告", "请至少选择一个平台")
             return
+        search_size = self.read_count(self.search_size_var, "每平台条数")
+        if search_size is None:
+            return
         
-        # 检查是否极速模式
-        if self.search_mode_var.get() == "fast":
-            enable_fast_mode()
-        else:
-            disable_fast_mode()
+        self.prefetcher.cancel()
+        self.search_history.add(keyword)
+        self.search_history.save()
             
-        # 清空之前的结果
-        self.clear_results()
+        session = self.session
+        if session.searching or session.all_songs or session.local_songs:
+            session = self.new_session()
+        session.pagers.clear()
+        session.ranker = RelevanceRanker(keyword)
+        session.link_check = self.search_mode_var.get()
+        session.search_size = search_size
         
         # 设置搜索状态
-        self.searching = True
-        self.search_btn.config(state='disabled')
-        self.search_progress_var.set(0)
-        self.search_status_var.set(f"准备搜索: {keyword}")
+        session.keyword = keyword
+        session.searching = True
+        session.token = CancelToken()
+        self.set_session_status(session, f"准备搜索: {keyword}", 0)
+        self.update_session_tab(session)
+        self.refresh_session_controls()
         
         # 在新线程中执行搜索
-        Thread(target=self.search_thread, args=(keyword, selected_platforms), daemon=True).start()
+        Thread(target=self.search_thread,
+               args=(session, keyword, selected_platforms, self.save_path_var.get(), session.token),
+               daemon=True).start()
+    
+    def stop_search(self):
+        """停止当前标签页的搜索：中止各平台正在进行的请求，已显示的结果保留"""
+        session = self.session
+        if not session.searching:
+            return
+        session.token.cancel()
+        session.searching = False
+        self.set_session_status(session, f"⏹ 搜索已停止 - 已找到 {len(session.all_songs)} 首歌曲")
+        self.update_session_tab(session)
+        self.refresh_session_controls()
     
-    def search_single_platform(self, source_name, keyword, search_size, progress_lock, completed_count, total_count):
-        """搜索单个平台"""
+    def search_single_platform(self, session, source_name, keyword, search_size, progress_lock, completed_count, total_count,
+                               cancel_token, existing_songs):
+        """搜索单个平台，过滤掉曲库中已有的歌曲后交给UI"""
         try:
-            # 初始化单个客户端
-            init_cfg = {
-                'search_size_per_source': search_size,
-                'search_size_per_page': min(search_size, 20),
-                'max_retries': 2,
-                'maintain_session': True,
-                'disable_print': True,
-            }
+            cancel_token.raise_if_cancelled()
+            if self.daemon_client:
+                # 守护进程模式：由守护进程的常驻客户端搜索
+                results = self.daemon_client.search(keyword, [source_name], search_size).get(source_name, [])
+                filtered, skipped = self.filter_duplicate_songs(results, existing_songs)
+                with progress_lock:
+                    completed_count[0] += 1
+                    progress = (completed_count[0] / total_count) * 100
+                    self.search_queue.put((session, cancel_token, ('platform_done', source_name, filtered, skipped, progress, completed_count[0], total_count)))
+                return source_name, results
             
-            # 创建独立客户端
-            from musicdl.modules.sources import BuildMusicClient
-            client = BuildMusicClient(module_cfg={'type': source_name, **init_cfg})
-            
-            # 执行搜索
-            results = client.search(keyword=keyword, num_threadings=3)
+            # 执行搜索（预取过的关键词直接使用缓存，正在预取的等待其完成）
+            client = self.create_search_client(source_name, search_size, session.link_check)
+            results, _ = self.search_cache.fetch(
+                source_name, keyword, search_size, session.link_check,
+                lambda: self.run_platform_search(client, source_name, keyword, search_size, cancel_token)
+            )
+            # 同一个客户端留作分页游标，加载更多时接着请求下一页
+            self.search_queue.put((session, cancel_token, ('pager', source_name, PlatformPager(client, keyword, results))))
             
             # 更新进度并通知UI
+            filtered, skipped = self.filter_duplicate_songs(results, existing_songs)
             with progress_lock:
                 completed_count[0] += 1
                 progress = (completed_count[0] / total_count) * 100
-                self.search_queue.put(('platform_done', source_name, results, progress, completed_count[0], total_count))
+                self.search_queue.put((session, cancel_token, ('platform_done', source_name, filtered, skipped, progress, completed_count[0], total_count)))
             
             return source_name, results
+        except OperationCancelled:
+            return source_name, []
         except Exception as e:
             with progress_lock:
                 completed_count[0] += 1
                 progress = (completed_count[0] / total_count) * 100
-                self.search_queue.put(('platform_error', source_name, str(e), progress, completed_count[0], total_count))
+                self.search_queue.put((session, cancel_token, ('platform_error', source_name, str(e), progress, completed_count[0], total_count)))
             return source_name, []
     
-    def search_thread(self, keyword, selected_platforms):
-        """搜索线程 - 真正的并行搜索"""
+    def watch_memory(self):
+        """登记内存诊断中按子系统统计的对象数量（--memprof 时才会被读取）"""
+        sessions = lambda: list(self.sessions.values())
+        memory_profiler.watch('搜索会话', lambda: len(self.sessions))
+        memory_profiler.watch('搜索结果', lambda: sum(len(s.all_songs) for s in sessions()))
+        memory_profiler.watch('raw_data', lambda: sum(1 for s in sessions() for song in s.all_songs if song.raw_data))
+        memory_profiler.watch('搜索缓存', lambda: len(self.search_cache.entries))
+        memory_profiler.watch('链接缓存', lambda: len(url_resolver.entries))
+        memory_profiler.watch('解析客户端', lambda: len(self.resolve_clients))
+        memory_profiler.watch('搜索消息', self.search_queue.qsize)
+        memory_profiler.watch('下载消息', self.download_queue.qsize)
+    
+    def create_search_client(self, source_name, search_size, link_check):
+        """创建搜索用的独立客户端；link_check 为链接验证模式（由调用方在界面线程读取）"""
+        init_cfg = search_client_cfg(
+            source_name, search_size,
+            max_retries=1,  # 重试由平台共享的 PlatformRetryPolicy 处理
+            maintain_session=True,
+            disable_print=True,
+        )
+        return build_music_client(source_name, link_check=link_check, **init_cfg)
+    
+    def run_platform_search(self, client, source_name, keyword, search_size, cancel_token=None):
+        """用 create_search_client 创建的独立客户端搜索单个平台；cancel_token 被取消时中止该客户端的请求"""
+        client = bind_cancel_token(client, cancel_token)
+        
+        # 执行搜索（大搜索量时各页并行请求）
+        results = client.search(keyword=keyword, num_threadings=plan_search_pages(source_name, search_size)[2])
+        # 客户端内部会吞掉请求异常，取消后返回的残缺结果不能进缓存
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        return results
+    
+    def get_library_index(self, directory):
+        """保存目录的曲库索引，换了目录时重建"""
+        index = self.library_index
+        if index is None or index.directory != directory:
+            index = self.library_index = LibraryIndex(directory)
+        return index
+    
+    def start_network_search(self):
+        """本地曲库已有匹配时，按需在网络平台上继续搜索同一个关键词"""
+        session = self.session
+        if session.searching or not session.network_pending:
+            return
+        platforms, session.network_pending = session.network_pending, None
+        session.searching = True
+        session.token = CancelToken()
+        self.set_session_status(session, f"准备搜索网络平台: {session.keyword}", 0)
+        self.update_session_tab(session)
+        self.refresh_session_controls()
+        Thread(target=self.search_thread,
+               args=(session, session.keyword, platforms, self.save_path_var.get(), session.token, False),
+               daemon=True).start()
+    
+    def update_load_more_menu(self):
+        """按当前标签页各平台的分页状态重建"加载更多"菜单"""
+        session = self.session
+        self.load_more_menu.delete(0, tk.END)
+        if session.network_pending:
+            self.load_more_menu.add_command(label=f"🌐 搜索网络平台（{len(session.network_pending)} 个）",
+                                            command=self.start_network_search)
+        available = [source for source, pager in session.pagers.items() if not pager.exhausted]
+        if available:
+            self.load_more_menu.add_command(label="全部平台", command=lambda: self.start_load_more(available))
+            self.load_more_menu.add_separator()
+        for source, pager in session.pagers.items():
+            name = self.all_sources[source]['name']
+            if pager.exhausted:
+                self.load_more_menu.add_command(label=f"{name}（没有更多了）", state='disabled')
+            else:
+                self.load_more_menu.add_command(label=f"{name}（第 {pager.pages + 1} 页）",
+                                                command=lambda s=source: self.start_load_more([s]))
+        self.load_more_btn.config(state='normal' if (available or session.network_pending) and not session.searching
+                                  else 'disabled')
+    
+    def start_load_more(self, sources):
+        """为当前标签页的指定平台加载下一页，结果追加到列表末尾"""
+        session = self.session
+        if session.searching:
+            return
+        session.searching = True
+        session.token = CancelToken()
+        self.set_session_status(session, f"正在加载更多: {len(sources)} 个平台", 0)
+        self.update_session_tab(session)
+        self.refresh_session_controls()
+        Thread(target=self.load_more_thread, args=(session, sources, self.save_path_var.get(), session.token),
+               daemon=True).start()
+    
+    def load_more_thread(self, session, sources, save_dir, cancel_token):
+        """加载更多线程 - 各平台的下一页在共享线程池中并行请求"""
+        futures = []
+        try:
+            retry_before = retry_stats()
+            existing_songs = self.scan_existing_songs(save_dir)
+            total_count = len(sources)
+            progress_lock = Lock()
+            completed_count = [0]
+            added = [0]
+            
+            def load_page(source_name):
+                pager = session.pagers[source_name]
+                try:
+                    # 分页客户端可能被上一次停止关闭了会话，换绑到本次的令牌
+                    bind_cancel_token(pager.client, cancel_token)
+                    songs, skipped = self.filter_duplicate_songs(pager.next_page(cancel_token), existing_songs)
+                    with progress_lock:
+                        completed_count[0] += 1
+                        added[0] += len(songs)
+                        progress = (completed_count[0] / total_count) * 100
+                        self.search_queue.put((session, cancel_token, ('platform_done', source_name, songs, skipped, progress, completed_count[0], total_count)))
+                except OperationCancelled:
+                    pass
+                except Exception as e:
+                    with progress_lock:
+                        completed_count[0] += 1
+                        progress = (completed_count[0] / total_count) * 100
+                        self.search_queue.put((session, cancel_token, ('platform_error', source_name, str(e), progress, completed_count[0], total_count)))
+            
+            futures = [self.search_pool.submit(session.id, load_page, source) for source in sources]
+            for future in iter_completed(futures, cancel_token):
+                future.result()
+            
+            self.search_queue.put((session, cancel_token, ('more_complete', added[0], format_retry_summary(retry_before))))
+            
+        except OperationCancelled:
+            pass
+        except Exception as e:
+            self.search_queue.put((session, cancel_token, ('error', str(e))))
+        finally:
+            # 撤销还在排队的任务，不占用其他会话的线程
+            for future in futures:
+                future.cancel()
+            self.search_queue.put((session, cancel_token, ('done', None)))
+    
+    def export_session(self):
+        """把当前标签页的结果导出为结果集文件，之后可以载入直接下载"""
+        session = self.session
+        if not session.all_songs:
+            messagebox.showwarning("警告", "当前标签页没有可导出的结果")
+            return
+        path = filedialog.asksaveasfilename(
+            title="导出结果集",
+            defaultextension=".jsonl",
+            initialfile=f"{session.keyword or 'results'}.jsonl",
+            filetypes=[("结果集", "*.jsonl *.jsonl.gz"), ("所有文件", "*.*")]
+        )
+        if not path:
+            return
         try:
-            search_size = int(self.search_size_var.get())
+            count = export_results(path, session.all_songs, session.keyword)
+        except Exception as e:
+            messagebox.showerror("错误", f"导出失败: {e}")
+            return
+        self.status_var.set(f"💾 已导出 {count} 首到 {os.path.basename(path)}")
+    
+    def start_load_results(self):
+        """载入之前导出的结果集到新标签页，不重新搜索；链接在下载前按需重新验证"""
+        path = filedialog.askopenfilename(
+            title="载入结果集",
+            filetypes=[("结果集", "*.jsonl *.jsonl.gz"), ("所有文件", "*.*")]
+        )
+        if not path:
+            return
+        try:
+            header = read_results_header(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("错误", f"无法载入结果集: {e}")
+            return
+        
+        session = self.session
+        if session.searching or session.all_songs or session.local_songs:
+            session = self.new_session()
+        session.pagers.clear()
+        session.ranker = None
+        session.keyword = header.get('keyword') or os.path.basename(path)
+        session.searching = True
+        session.token = CancelToken()
+        self.set_session_status(session, f"正在载入结果集: {os.path.basename(path)}", 0)
+        self.update_session_tab(session)
+        self.refresh_session_controls()
+        Thread(target=self.load_results_thread,
+               args=(session, path, header.get('count') or 0, self.save_path_var.get(), session.token),
+               daemon=True).start()
+    
+    def load_results_thread(self, session, path, total_count, save_dir, cancel_token):
+        """载入线程 - 逐行读取结果集，过滤曲库中已有的歌曲，分批交给界面显示"""
+        try:
+            existing_songs = self.scan_existing_songs(save_dir)
+            batch = []
+            loaded = [0]
+            skipped = [0]
+            
+            def flush():
+                progress = (loaded[0] / total_count) * 100 if total_count > 0 else 0
+                self.search_queue.put((session, cancel_token, ('loaded', list(batch), progress)))
+                batch.clear()
+            
+            for song in iter_result_file(path):
+                cancel_token.raise_if_cancelled()
+                loaded[0] += 1
+                if song.source not in self.all_sources or self.is_song_exists(song, existing_songs):
+                    skipped[0] += 1
+                    continue
+                batch.append(song)
+                if len(batch) >= LOAD_RESULTS_BATCH:
+                    flush()
+            flush()
+            self.search_queue.put((session, cancel_token, ('load_complete', loaded[0], skipped[0])))
+            
+        except OperationCancelled:
+            pass
+        except Exception as e:
+            self.search_queue.put((session, cancel_token, ('error', str(e))))
+        finally:
+            self.search_queue.put((session, cancel_token, ('done', None)))
+    
+    def search_thread(self, session, keyword, selected_platforms, save_dir, cancel_token, local_first=True):
+        """搜索线程 - 各平台的搜索在共享线程池中并行进行，cancel_token 被取消后立即返回，不再等待各平台
+        local_first 时先查本地曲库，有匹配就只显示本地结果，网络平台等用户在"加载更多"中选择后再搜索
+        """
+        futures = {}
+        try:
+            if local_first:
+                local_songs = self.get_library_index(save_dir).search(keyword)
+                if local_songs:
+                    self.search_queue.put((session, cancel_token, ('local_done', local_songs, selected_platforms)))
+                    return
+            
+            search_size = session.search_size
             total_count = len(selected_platforms)
+            retry_before = retry_stats()
+            link_before = link_check_stats()
+            # 曲库只扫描一次，各平台线程共用
+            existing_songs = self.scan_existing_songs(save_dir)
             
-            self.search_queue.put(('status', f"开始并行搜索 '{keyword}' - {total_count} 个平台"))
+            self.search_queue.put((session, cancel_token, ('status', f"开始并行搜索 '{keyword}' - {total_count} 个平台")))
             
-            # 使用线程池并行搜索所有平台
+            # 在共享线程池中并行搜索所有平台（与其他标签页的搜索轮流占用线程）
             progress_lock = Lock()
             completed_count = [0]
             
-            with ThreadPoolExecutor(max_workers=min(total_count, 6)) as executor:
-                futures = {
-                    executor.submit(
-                        self.search_single_platform,
-                        source,
-                        keyword,
-                        search_size,
-                        progress_lock,
-                        completed_count,
-                        total_count
-                    ): source for source in selected_platforms
-                }
-                
-                # 等待所有搜索完成
-                for future in as_completed(futures):
-                    future.result()
+            futures = {
+                self.search_pool.submit(
+                    session.id,
+                    self.search_single_platform,
+                    session,
+                    source,
+                    keyword,
+                    search_size,
+                    progress_lock,
+                    completed_count,
+                    total_count,
+                    cancel_token,
+                    existing_songs
+                ): source for source in selected_platforms
+            }
             
-            self.search_queue.put(('complete', len(self.all_songs)))
+            # 等待所有搜索完成
+            for future in iter_completed(futures, cancel_token):
+                future.result()
             
+            summary = ' | '.join(filter(None, [format_retry_summary(retry_before), format_link_check_summary(link_before)]))
+            self.search_queue.put((session, cancel_token, ('complete', len(futures), summary)))
+            
+        except OperationCancelled:
+            pass
         except Exception as e:
-            self.search_queue.put(('error', str(e)))
+            self.search_queue.put((session, cancel_token, ('error', str(e))))
         finally:
-            self.searching = False
-            self.search_queue.put(('done', None))
+            # 撤销还在排队的任务，不占用其他会话的线程
+            for future in futures:
+                future.cancel()
+            self.search_queue.put((session, cancel_token, ('done', None)))
     
     def update_ui(self):
         """更新UI（主线程）"""
         try:
             while not self.search_queue.empty():
-                msg = self.search_queue.get_nowait()
+                session, token, msg = self.search_queue.get_nowait()
+                if token is not session.token or token.cancelled:
+                    continue  # 已停止、被新搜索取代或标签页已关闭的搜索
                 msg_type = msg[0]
                 
                 if msg_type == 'status':
-                    self.search_status_var.set(msg[1])
+                    self.set_session_status(session, msg[1])
                     
-                elif msg_type == 'platform_done':
-                    # 单个平台搜索完成，过滤重复后显示
-                    _, source_name, results, progress, completed, total = msg
+                elif msg_type == 'pager':
+                    _, source_name, pager = msg
+                    session.pagers[source_name] = pager
                     
-                    # 过滤已存在的歌曲
-                    save_dir = self.save_path_var.get()
-                    filtered_results, skipped, existing_count = self.filter_duplicate_songs(results, save_dir)
+                elif msg_type == 'platform_done':
+                    # 单个平台搜索完成（搜索线程已过滤掉重复的歌曲）
+                    _, source_name, results, skipped, progress, completed, total = msg
                     
-                    self.search_progress_var.set(progress)
                     if skipped > 0:
-                        self.search_status_var.set(f"[{completed}/{total}] {source_name} 完成 - {len(results)} 首 (跳过 {skipped} 首重复)")
+                        self.set_session_status(session, f"[{completed}/{total}] {source_name} 完成 - {len(results) + skipped} 首 (跳过 {skipped} 首重复)", progress)
                     else:
-                        self.search_status_var.set(f"[{completed}/{total}] {source_name} 完成 - 找到 {len(results)} 首")
+                        self.set_session_status(session, f"[{completed}/{total}] {source_name} 完成 - 找到 {len(results)} 首", progress)
                     
-                    self.add_platform_results(source_name, filtered_results)
+                    self.add_platform_results(session, source_name, results)
+                    
+                elif msg_type == 'local_done':
+                    # 本地曲库中已有匹配，网络平台暂不搜索
+                    _, local_songs, platforms = msg
+                    self.add_platform_results(session, LOCAL_SOURCE, local_songs)
+                    session.network_pending = platforms
+                    self.set_session_status(session, f"📁 本地曲库中已有 {len(local_songs)} 首匹配 - "
+                                                     f"需要更多结果时点击\"加载更多\"搜索网络平台", 100)
                     
                 elif msg_type == 'platform_error':
                     # 平台搜索失败
                     _, source_name, error, progress, completed, total = msg
-                    self.search_progress_var.set(progress)
-                    self.search_status_var.set(f"[{completed}/{total}] {source_name} 失败: {error[:30]}")
+                    self.set_session_status(session, f"[{completed}/{total}] {source_name} 失败: {error[:30]}", progress)
                     
                 elif msg_type == 'complete':
-                    _, total_songs = msg
-                    self.search_status_var.set(f"✅ 搜索完成！共找到 {total_songs} 首歌曲")
-                    messagebox.showinfo("搜索完成", f"共找到 {total_songs} 首歌曲")
+                    _, _, retry_summary = msg
+                    total_songs = len(session.all_songs)
+                    self.prefetch_download_urls(session.all_songs[:URL_RESOLVE_TOP_N])
+                    self.set_session_status(session, f"✅ 搜索完成！共找到 {total_songs} 首歌曲" +
+                                            (f" | {retry_summary}" if retry_summary else ""))
+                    memory_profiler.checkpoint(f"搜索完成: {session.keyword}")
+                    # 后台标签页完成时只更新标签标题，不弹窗打断当前操作
+                    if session is self.session:
+                        messagebox.showinfo("搜索完成", f"共找到 {total_songs} 首歌曲")
+                    
+                elif msg_type == 'more_complete':
+                    _, added, retry_summary = msg
+                    self.set_session_status(session, f"✅ 加载完成！新增 {added} 首，共 {len(session.all_songs)} 首" +
+                                            (f" | {retry_summary}" if retry_summary else ""), 100)
+                    memory_profiler.checkpoint(f"加载更多: {session.keyword}")
+                    
+                elif msg_type == 'loaded':
+                    # 结果集中的一批歌曲（载入线程已过滤掉曲库中已有的）
+                    _, songs, progress = msg
+                    self.set_session_status(session, f"正在载入结果集 - 已载入 {len(session.all_songs) + len(songs)} 首", progress)
+                    self.add_platform_results(session, None, songs)
+                    
+                elif msg_type == 'load_complete':
+                    _, loaded, skipped = msg
+                    self.prefetch_download_urls(session.all_songs[:URL_RESOLVE_TOP_N])
+                    self.set_session_status(session, f"✅ 载入完成！共 {len(session.all_songs)} 首" +
+                                            (f" (跳过 {skipped} 首已存在或平台不可用)" if skipped else ""), 100)
                     
                 elif msg_type == 'error':
                     _, error = msg
                     messagebox.showerror("错误", f"搜索失败: {error}")
                     
                 elif msg_type == 'done':
-                    self.search_btn.config(state='normal')
-                    self.searching = False
+                    session.searching = False
+                    self.update_session_tab(session)
+                    if session is self.session:
+                        self.refresh_session_controls()
                     
         except queue.Empty:
             pass
@@ -574,44 +1199,125 @@ class MusicDownloaderGUI:
                 msg = self.download_queue.get_nowait()
                 msg_type = msg[0]
                 
-                if msg_type == 'progress':
+                if msg_type == 'status':
+                    self.status_var.set(msg[1])
+                    
+                elif msg_type == 'progress':
                     _, current, total, filename = msg
                     progress = (current / total) * 100 if total > 0 else 0
                     self.download_progress_var.set(progress)
                     self.status_var.set(f"下载中 [{current}/{total}]: {filename[:40]}...")
                     
+                elif msg_type == 'transfer':
+                    _, snapshot = msg
+                    self.download_progress_var.set(snapshot['percent'])
+                    current = snapshot['active'][0][0] if snapshot['active'] else ''
+                    self.status_var.set(f"下载中 {format_transfer_status(snapshot)}  {current[:30]}")
+                    
                 elif msg_type == 'complete':
+                    _, success_count, total, retry_summary = msg
+                    self.download_progress_var.set(100)
+                    self.status_var.set(f"✅ 下载完成！成功 {success_count}/{total}" +
+                                        (f" | {retry_summary}" if retry_summary else ""))
+                    memory_profiler.checkpoint(f"下载完成: {success_count}/{total} 首")
+                    messagebox.showinfo("下载完成", f"成功下载 {success_count}/{total} 首歌曲" +
+                                        (f"\n\n{retry_summary}" if retry_summary else ""))
+                    self.finish_download()
+                    
+                elif msg_type == 'download_cancelled':
                     _, success_count, total = msg
+                    self.status_var.set(f"⏹ 下载已停止 - 已完成 {success_count}/{total}")
+                    self.finish_download()
+                    
+                elif msg_type == 'import_progress':
+                    _, summary = msg
+                    done = summary['downloaded'] + summary['failed'] + summary['skipped'] + len(summary['unmatched'])
+                    progress = (done / summary['total']) * 100 if summary['total'] > 0 else 0
+                    self.download_progress_var.set(progress)
+                    self.status_var.set(
+                        f"导入歌单 [{done}/{summary['total']}] 已搜索 {summary['searched']} | "
+                        f"已下载 {summary['downloaded']} | 未匹配 {len(summary['unmatched'])}"
+                    )
+                    
+                elif msg_type == 'import_done':
+                    _, summary = msg
+                    if summary.get('cancelled'):
+                        self.status_var.set(f"⏹ 歌单导入已停止 - 已下载 {summary['downloaded']}/{summary['total']}")
+                        self.finish_download()
+                        continue
                     self.download_progress_var.set(100)
-                    self.status_var.set(f"✅ 下载完成！成功 {success_count}/{total}")
-                    messagebox.showinfo("下载完成", f"成功下载 {success_count}/{total} 首歌曲")
-                    self.download_btn.config(state='normal')
-                    self.downloading = False
+                    self.status_var.set(f"✅ 歌单导入完成！下载 {summary['downloaded']}/{summary['total']}")
+                    text = (f"条目: {summary['total']}  匹配: {summary['matched']}  已存在: {summary['skipped']}\n"
+                            f"下载成功: {summary['downloaded']}  下载失败: {summary['failed']}  未匹配: {len(summary['unmatched'])}")
+                    if summary.get('retry_summary'):
+                        text += f"\n请求: {summary['retry_summary']}"
+                    if summary['unmatched']:
+                        lines = [f"第 {line_no} 行: {line_text}" for line_no, line_text in sorted(summary['unmatched'])]
+                        if len(lines) > 20:
+                            lines = lines[:20] + [f"... 另有 {len(lines) - 20} 条"]
+                        text += "\n\n未匹配的条目：\n" + "\n".join(lines)
+                    messagebox.showinfo("歌单导入完成", text)
+                    self.finish_download()
                     
                 elif msg_type == 'error':
                     _, error = msg
                     messagebox.showerror("错误", error)
-                    self.download_btn.config(state='normal')
-                    self.downloading = False
+                    self.finish_download()
                     
         except queue.Empty:
             pass
             
         self.root.after(100, self.update_ui)
     
-    def add_platform_results(self, source_name, songs):
-        """添加单个平台的结果到列表（实时显示）"""
+    def finish_download(self):
+        """下载/导入结束（完成、出错或被停止）后恢复按钮状态"""
+        self.download_btn.config(state='normal')
+        self.import_btn.config(state='normal')
+        self.stop_download_btn.config(state='disabled')
+        self.downloading = False
+        self.download_token = None
+    
+    def stop_download(self):
+        """停止下载：正在传输的文件在下一个数据块处中止并删除，未开始的歌曲不再下载"""
+        if not self.downloading or self.download_token is None:
+            return
+        self.download_token.cancel()
+        self.stop_download_btn.config(state='disabled')
+        self.status_var.set("正在停止下载...")
+    
+    def add_platform_results(self, session, source_name, songs):
+        """添加单个平台的结果到会话的列表（实时显示）；source_name 为 None 时沿用歌曲自带的来源（载入的结果集）
+        本地曲库的结果（LOCAL_SOURCE）显示为"本地"分组，不编号，不参与下载和导出
+        会话有排序器时，每首歌直接插到按相关度排好的位置（本地分组之后），列表始终有序
+        """
         for song in songs:
-            song._source_platform = source_name
-            idx = len(self.all_songs)
+            song._source_platform = source_name or song._source_platform
+            if song._source_platform == LOCAL_SOURCE:
+                session.tree.insert('', tk.END, values=(
+                    '本地',
+                    song.singers or '未知歌手',
+                    song.song_name or '未知歌曲',
+                    song.album or '未知专辑',
+                    song.duration or '-',
+                    self.get_song_quality(song),
+                    song.file_size,
+                    (song.ext or 'mp3').upper(),
+                    LOCAL_SOURCE
+                ))
+                session.local_songs.append(song)
+                continue
+            idx = len(session.all_songs)
             song._global_idx = idx
             
             # 获取详细信息
             quality = self.get_song_quality(song)
             size = self.get_song_size(song)
             
-            # 插入到Treeview
-            self.tree.insert('', tk.END, values=(
+            # 插入到Treeview（序号是 all_songs 中的下标，不随排名变化）
+            position = tk.END
+            if session.ranker is not None:
+                position = len(session.local_songs) + session.ranker.add([song])[0]
+            session.tree.insert('', position, values=(
                 idx,
                 song.singers or '未知歌手',
                 song.song_name or '未知歌曲',
@@ -620,17 +1326,43 @@ class MusicDownloaderGUI:
                 quality,
                 size,
                 (song.ext or 'mp3').upper(),
-                source_name.replace('MusicClient', '')
+                song._source_platform.replace('MusicClient', '')
             ))
             
-            self.all_songs.append(song)
+            session.all_songs.append(song)
         
         # 更新计数
-        self.count_label.config(text=f"找到 {len(self.all_songs)} 首歌曲")
+        self.update_session_tab(session)
+        if session is self.session:
+            self.count_label.config(text=f"找到 {len(session.all_songs)} 首歌曲")
         
-        # 自动滚动到最新结果
-        if songs:
-            self.tree.see(self.tree.get_children()[-1])
+        # 自动滚动到最新结果；排序的列表停在最前面
+        if songs and session.ranker is None:
+            session.tree.see(session.tree.get_children()[-1])
+    
+    def get_tree_selected_songs(self):
+        """结果列表中选中的歌曲"""
+        selected_songs = []
+        for item in self.tree.selection():
+            values = self.tree.item(item, 'values')
+            if not str(values[0]).isdigit():
+                continue  # 本地曲库的结果
+            idx = int(values[0])
+            if 0 <= idx < len(self.all_songs):
+                selected_songs.append(self.all_songs[idx])
+        return selected_songs
+    
+    def prefetch_download_urls(self, songs):
+        """后台预解析下载链接，点击下载时直接请求最终链接"""
+        if self.daemon_client or not songs:
+            return
+        url_resolver.prefetch(self.get_resolve_client, songs)
+    
+    def get_resolve_client(self, source):
+        # 预解析只需要平台的下载请求头，每个平台建一个客户端复用
+        if source not in self.resolve_clients:
+            self.resolve_clients[source] = build_music_client(source, disable_print=True)
+        return self.resolve_clients[source]
     
     def start_download(self):
         """开始下载"""
@@ -650,13 +1382,12 @@ class MusicDownloaderGUI:
                 messagebox.showerror("错误", f"无法创建保存目录: {e}")
                 return
         
+        thread_count = self.read_count(self.thread_count_var, "下载线程数")
+        if thread_count is None:
+            return
+        
         # 获取选中的歌曲
-        selected_songs = []
-        for item in selected_items:
-            values = self.tree.item(item, 'values')
-            idx = int(values[0])
-            if 0 <= idx < len(self.all_songs):
-                selected_songs.append(self.all_songs[idx])
+        selected_songs = self.get_tree_selected_songs()
         
         if not selected_songs:
             messagebox.showwarning("警告", "未找到选中的歌曲")
@@ -688,67 +1419,215 @@ class MusicDownloaderGUI:
         
         # 设置下载状态
         self.downloading = True
+        self.download_token = CancelToken()
         self.download_btn.config(state='disabled')
+        self.stop_download_btn.config(state='normal')
         self.download_progress_var.set(0)
         
         # 在新线程中执行下载
-        Thread(target=self.download_thread, args=(selected_songs, save_dir), daemon=True).start()
+        Thread(target=self.download_thread,
+               args=(selected_songs, save_dir, list(self.all_songs), thread_count, self.hedge_var.get(), self.download_token),
+               daemon=True).start()
     
-    def download_thread(self, songs, save_dir):
-        """下载线程 - 并行下载"""
+    def start_import(self):
+        """导入歌单文件并批量下载"""
+        if self.downloading:
+            return
+        
+        selected_platforms = self.get_selected_platforms()
+        if not selected_platforms:
+            messagebox.showwarning("警告", "请至少选择一个平台")
+            return
+        
+        path = filedialog.askopenfilename(
+            title="选择歌单文件",
+            filetypes=[("歌单文件", "*.m3u *.m3u8 *.csv *.txt"), ("所有文件", "*.*")]
+        )
+        if not path:
+            return
+        
+        thread_count = self.read_count(self.thread_count_var, "下载线程数")
+        if thread_count is None:
+            return
+        
+        entries = parse_tracklist(path)
+        if not entries:
+            messagebox.showwarning("警告", "歌单中没有可识别的条目")
+            return
+        
+        save_dir = self.save_path_var.get()
+        try:
+            os.makedirs(save_dir, exist_ok=True)
+        except Exception as e:
+            messagebox.showerror("错误", f"无法创建保存目录: {e}")
+            return
+        
+        self.downloading = True
+        self.download_token = CancelToken()
+        self.download_btn.config(state='disabled')
+        self.import_btn.config(state='disabled')
+        self.stop_download_btn.config(state='normal')
+        self.download_progress_var.set(0)
+        self.status_var.set(f"正在导入歌单: {len(entries)} 个条目")
+        
+        Thread(target=self.import_thread,
+               args=(entries, selected_platforms, save_dir, thread_count, self.download_token, self.search_mode_var.get()),
+               daemon=True).start()
+    
+    def import_thread(self, entries, selected_platforms, save_dir, thread_count, cancel_token, link_check=None):
+        """歌单导入线程 - 搜索/匹配/下载流水线；thread_count 和 link_check 在界面线程读取"""
+        try:
+            init_cfg = {
+                'search_size_per_source': 3,
+                'search_size_per_page': 3,
+                'max_retries': 1,
+                'maintain_session': True,
+                'disable_print': True,
+            }
+            clients = {source: build_music_client(source, link_check=link_check, **init_cfg) for source in selected_platforms}
+            summary = run_import_pipeline(
+                clients, entries, save_dir,
+                download_workers=thread_count,
+                on_progress=lambda snapshot: self.download_queue.put(('import_progress', snapshot)),
+                cancel_token=cancel_token
+            )
+            self.download_queue.put(('import_done', summary))
+        except Exception as e:
+            self.download_queue.put(('error', f"歌单导入失败: {str(e)}"))
+    
+    def download_thread(self, songs, save_dir, candidate_pool, thread_count, hedge_enabled, cancel_token):
+        """下载线程 - 并行下载，cancel_token 被取消后中止传输中的文件并放弃未开始的歌曲
+        candidate_pool: 多源对冲时查找同一首歌其他平台副本的搜索结果
+        thread_count / hedge_enabled: 开始下载时在界面线程读取的设置
+        """
+        success_count = [0]
+        total = len(songs)
         try:
-            thread_count = int(self.thread_count_var.get())
-            total = len(songs)
-            completed = [0]
-            success_count = [0]
+            if self.daemon_client:
+                self.daemon_download(songs, save_dir, cancel_token)
+                return
+            retry_before = retry_stats()
+            audio_before = dict(audio_check_stats)
             download_lock = Lock()
+            post_processor = PostProcessor()
+            # 字节级进度：各下载线程的回调被汇总并节流后才发给UI
+            aggregator = ByteProgressAggregator(total, on_update=lambda snapshot: self.download_queue.put(('transfer', snapshot)))
             
             def download_single(song):
+                ok = False
                 try:
-                    # 设置保存路径
-                    filename = self.format_filename(song)
-                    song.work_dir = save_dir
-                    song._save_path = os.path.join(save_dir, filename)
-                    
-                    # 通知UI开始下载
-                    with download_lock:
-                        completed[0] += 1
-                        current = completed[0]
-                    self.download_queue.put(('progress', current, total, filename))
+                    cancel_token.raise_if_cancelled()
+                    # 设置保存路径（分片曲库时在 首字母/歌手/专辑 目录下）
+                    song._save_path = library_path(save_dir, song)
+                    song.work_dir = os.path.dirname(song._save_path)
+                    filename = os.path.basename(song._save_path)
+                    callbacks = aggregator.track(id(song), filename)
+                    # 封面与音频同时获取
+                    post_processor.prefetch(song)
                     
                     # 获取平台客户端
                     source = song.source
-                    if source in self.all_sources:
-                        from musicdl.modules.sources import BuildMusicClient
-                        client = BuildMusicClient(module_cfg={'type': source, 'disable_print': True})
-                        client.download(song_infos=[song], num_threadings=1)
+                    candidates = find_song_candidates(song, candidate_pool) if hedge_enabled else [song]
+                    candidates = [c for c in candidates if c.source in self.all_sources]
+                    if len(candidates) > 1:
+                        # 多源对冲：慢速源会被其他平台的同一首歌替换
+                        clients = {}
+                        def get_client(src):
+                            if src not in clients:
+                                clients[src] = bind_cancel_token(build_music_client(src, disable_print=True), cancel_token)
+                            return clients[src]
+                        winner, save_path = hedged_download(get_client, candidates, save_dir, progress_callbacks=callbacks,
+                                                            cancel_token=cancel_token)
+                        if winner is not None:
+                            song._save_path = save_path
+                            post_processor.submit(winner)
+                    elif source in self.all_sources:
+                        client = bind_cancel_token(build_music_client(source, disable_print=True), cancel_token)
+                        if download_song_file(client, song, song._save_path, TransferProgress(**callbacks),
+                                              auto_supplement_song=False, cancel_token=cancel_token):
+                            # 标签和封面交给后处理线程，下载线程立即开始下一首
+                            post_processor.submit(song)
                     
                     # 检查是否成功
                     if os.path.exists(song._save_path):
+                        ok = True
                         with download_lock:
                             success_count[0] += 1
                     
                     return True
+                except OperationCancelled:
+                    return False
                 except Exception as e:
                     print(f"下载失败 {song.song_name}: {e}")
                     return False
+                finally:
+                    aggregator.finish(id(song), ok)
             
             # 使用线程池并行下载
-            with ThreadPoolExecutor(max_workers=thread_count) as executor:
-                futures = [executor.submit(download_single, song) for song in songs]
-                for future in as_completed(futures):
+            executor = ThreadPoolExecutor(max_workers=thread_count)
+            futures = [executor.submit(download_single, song) for song in songs]
+            try:
+                for future in iter_completed(futures, cancel_token):
                     future.result()
+            finally:
+                # 已下载完成的歌曲照常写入标签：先等进行中的下载线程退出（取消后很快中止），
+                # 它们提交的歌曲都进入队列后再关闭后处理器
+                executor.shutdown(wait=True, cancel_futures=True)
+                self.download_queue.put(('status', "🏷️ 正在写入标签和封面..."))
+                post_processor.close()
+            summary = " | ".join(filter(None, [format_retry_summary(retry_before), format_audio_check_summary(audio_before)]))
+            self.download_queue.put(('complete', success_count[0], total, summary))
             
-            self.download_queue.put(('complete', success_count[0], total))
-            
+        except OperationCancelled:
+            self.download_queue.put(('download_cancelled', success_count[0], total))
         except Exception as e:
             self.download_queue.put(('error', f"下载失败: {str(e)}"))
 
 
+    def daemon_download(self, songs, save_dir, cancel_token):
+        """守护进程模式：把选中的歌曲交给守护进程下载并轮询进度"""
+        jobs = self.daemon_client.enqueue(songs, save_dir)
+        
+        def on_progress(jobs):
+            finished = [job for job in jobs if job['status'] in ('done', 'failed')]
+            running = [job for job in jobs if job['status'] == 'downloading']
+            title = running[0]['title'] if running else (finished[-1]['title'] if finished else '')
+            self.download_queue.put(('progress', len(finished), len(jobs), title))
+        
+        # 停止时只是不再等待，已交给守护进程的任务会继续完成
+        jobs = wait_for_daemon_jobs(self.daemon_client, jobs, on_progress, cancel_token=cancel_token)
+        success_count = sum(1 for job in jobs if job['status'] == 'done')
+        self.download_queue.put(('complete', success_count, len(songs), ''))
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="🎵 音乐下载器 (GUI 版)")
+    parser.add_argument('--daemon', nargs='?', const=DEFAULT_DAEMON_URL, metavar='URL',
+                        help=f'作为瘦前端连接守护进程（默认 {DEFAULT_DAEMON_URL}）')
+    parser.add_argument('--stall-threshold', type=int, default=UI_STALL_THRESHOLD_MS, metavar='MS',
+                        help=f'界面卡顿超过该毫秒数时记录调用栈到 {UI_STALL_LOG}（0 关闭检测）')
+    parser.add_argument('--memprof', nargs='?', type=int, const=MEMPROF_INTERVAL, metavar='SEC',
+                        help=f'内存诊断：在搜索 / 下载边界拍 tracemalloc 快照，并每 SEC 秒（默认 {MEMPROF_INTERVAL}）'
+                             f'记录占用最多的分配点，写入 {MEMPROF_LOG}')
+    parser.add_argument('--proxy', action='append', metavar='URL',
+                        help='出口代理（可重复，如 --proxy 127.0.0.1:8001 --proxy direct），请求在各出口间轮询，被限流的出口暂停使用')
+    return parser.parse_args(argv)
+
+
 def main():
+    args = parse_args()
+    configure_egress(args.proxy)
+    if args.memprof is not None:
+        memory_profiler.start(args.memprof)
+        print(f"🔬 内存诊断已开启，报告写入 {MEMPROF_LOG}")
     root = tk.Tk()
-    app = MusicDownloaderGUI(root)
+    app = MusicDownloaderGUI(root, daemon_client=DaemonClient(args.daemon) if args.daemon else None)
+    watchdog = MainThreadWatchdog(root, args.stall_threshold).start() if args.stall_threshold > 0 else None
     root.mainloop()
+    if watchdog is not None:
+        watchdog.stop()
+        print(watchdog.summary())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from musicdl.modules.utils import SongInfo  # noqa: E402
+
+
+@pytest.fixture
+def make_song():
+    """构造测试用的 SongInfo，未给出的字段用占位值"""
+    def make(song_name='晴天', singers='周杰伦', source='QQMusicClient', **fields):
+        fields.setdefault('identifier', f"{singers}-{song_name}")
+        fields.setdefault('ext', 'mp3')
+        return SongInfo(source=source, song_name=song_name, singers=singers, **fields)
+    return make
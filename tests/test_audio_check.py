@@ -0,0 +1,69 @@
+import pytest
+
+from musicdl_cmd import AUDIO_HEAD_BYTES, read_audio_head, sniff_audio_format, validate_audio_file
+
+MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + b'\x00' * 412
+
+
+def id3v2_tag(body_size, footer=False):
+    """ID3v2.4 标签：10 字节头，长度为 4 个 7 位的 syncsafe 字节"""
+    size = bytes([(body_size >> shift) & 0x7F for shift in (21, 14, 7, 0)])
+    flags = 0x10 if footer else 0
+    return b'ID3\x04\x00' + bytes([flags]) + size + b'\x00' * body_size + (b'3DI' + b'\x00' * 7 if footer else b'')
+
+
+@pytest.mark.parametrize('head, expected', [
+    (b'fLaC' + b'\x00' * 32, 'flac'),
+    (b'\x00\x00\x00\x20ftypM4A ' + b'\x00' * 16, 'm4a'),
+    (b'OggS' + b'\x00' * 32, 'ogg'),
+    (b'RIFF\x24\x00\x00\x00WAVEfmt ', 'wav'),
+    (b'MAC ' + b'\x00' * 32, 'ape'),
+    (bytes.fromhex('3026b2758e66cf11a6d900aa0062ce6c') + b'\x00' * 16, 'wma'),
+    (bytes([0xFF, 0xF1, 0x50, 0x80]) + b'\x00' * 16, 'aac'),
+    (MP3_FRAME, 'mp3'),
+    (b'\x00\x00junk' + MP3_FRAME, 'mp3'),
+    (b'<!DOCTYPE html><html>403 Forbidden</html>', None),
+    (b'{"code": 404}', None),
+    (b'', None),
+])
+def test_sniff_audio_format(head, expected):
+    assert sniff_audio_format(head) == expected
+
+
+def test_sniff_rejects_reserved_mpeg_header():
+    # 码率索引为 15 的帧头不是有效的同步字，文本里的 0xFF 也不会被当成 MP3
+    assert sniff_audio_format(bytes([0xFF, 0xFB, 0xF0, 0x00])) is None
+    assert sniff_audio_format(b'text \xff\x00 more text') is None
+
+
+@pytest.mark.parametrize('footer', [False, True])
+def test_read_audio_head_skips_large_id3v2_tag(tmp_path, footer):
+    # 内嵌封面让标签远大于一次读取的字节数
+    path = tmp_path / 'song.mp3'
+    path.write_bytes(id3v2_tag(AUDIO_HEAD_BYTES * 3, footer) + MP3_FRAME)
+    head = read_audio_head(str(path))
+    assert head.startswith(MP3_FRAME[:4])
+    assert sniff_audio_format(head) == 'mp3'
+
+
+def test_read_audio_head_without_tag(tmp_path):
+    path = tmp_path / 'song.flac'
+    path.write_bytes(b'fLaC' + b'\x00' * (AUDIO_HEAD_BYTES * 2))
+    assert read_audio_head(str(path)) == (b'fLaC' + b'\x00' * (AUDIO_HEAD_BYTES * 2))[:AUDIO_HEAD_BYTES]
+
+
+def test_validate_audio_file(tmp_path):
+    good = tmp_path / 'good.flac'
+    good.write_bytes(b'fLaC' + b'\x00' * 5000)
+    assert validate_audio_file(str(good)) is None
+    assert validate_audio_file(str(good), expected_size=5004) is None
+    assert '不完整' in validate_audio_file(str(good), expected_size=10000)
+
+    page = tmp_path / 'page.mp3'
+    page.write_bytes(b'  <html><body>error</body></html>')
+    assert '网页' in validate_audio_file(str(page))
+
+    empty = tmp_path / 'empty.mp3'
+    empty.write_bytes(b'')
+    assert validate_audio_file(str(empty)) == '文件为空'
+    assert '无法读取' in validate_audio_file(str(tmp_path / 'missing.mp3'))
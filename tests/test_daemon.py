@@ -0,0 +1,71 @@
+import json
+import os
+from threading import Thread
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from musicdl_daemon import resolve_save_dir, serve
+
+
+def test_resolve_save_dir_stays_inside_library(tmp_path):
+    library = str(tmp_path / 'Music')
+    assert resolve_save_dir(library) == library
+    assert resolve_save_dir(library, '') == library
+    assert resolve_save_dir(library, os.path.join(library, '周杰伦')) == os.path.realpath(os.path.join(library, '周杰伦'))
+    for outside in (str(tmp_path), str(tmp_path / 'Music2'), os.path.join(library, '..', 'elsewhere'), '/etc'):
+        with pytest.raises(ValueError):
+            resolve_save_dir(library, outside)
+
+
+class FakeDaemon:
+    def __init__(self, library):
+        self.library = library
+        self.enqueued = []
+
+    def enqueue(self, result_ids, save_dir=None):
+        resolve_save_dir(self.library, save_dir)
+        self.enqueued.append(result_ids)
+        return [{'result_id': i, 'status': 'queued'} for i in result_ids]
+
+
+@pytest.fixture
+def daemon_server(tmp_path):
+    daemon = FakeDaemon(str(tmp_path / 'Music'))
+    server = serve(daemon, port=0)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield daemon, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def post(url, data, content_type):
+    request = Request(url, data=json.dumps(data).encode('utf-8'), headers={'Content-Type': content_type})
+    try:
+        with urlopen(request, timeout=5) as resp:
+            return resp.status, json.loads(resp.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_enqueue_accepts_json(daemon_server):
+    daemon, base_url = daemon_server
+    status, body = post(base_url + '/enqueue', {'ids': [1]}, 'application/json; charset=utf-8')
+    assert status == 200 and body == [{'result_id': 1, 'status': 'queued'}]
+    assert daemon.enqueued == [[1]]
+
+
+@pytest.mark.parametrize('content_type', ['text/plain', 'application/x-www-form-urlencoded', ''])
+def test_enqueue_rejects_simple_cross_site_requests(daemon_server, content_type):
+    daemon, base_url = daemon_server
+    status, _ = post(base_url + '/enqueue', {'ids': [1]}, content_type)
+    assert status == 415
+    assert daemon.enqueued == []
+
+
+def test_enqueue_rejects_save_dir_outside_library(daemon_server, tmp_path):
+    daemon, base_url = daemon_server
+    status, body = post(base_url + '/enqueue', {'ids': [1], 'save_dir': str(tmp_path / 'elsewhere')}, 'application/json')
+    assert status == 400 and '曲库' in body['error']
+    assert daemon.enqueued == []
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from musicdl_cmd import (
+    JOB_MAX_ATTEMPTS, SQLiteJobQueue, job_save_path, job_target, migrate_library, open_job_queue, record_to_song,
+    shard_dirs,
+)
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / 'Music'
+    root.mkdir()
+    return str(root)
+
+
+@pytest.fixture
+def job_queue(tmp_path):
+    return open_job_queue(f"sqlite://{tmp_path / 'share' / 'queue.db'}")
+
+
+def test_open_job_queue(tmp_path):
+    assert isinstance(open_job_queue(str(tmp_path / 'queue.db')), SQLiteJobQueue)
+    with pytest.raises(ValueError):
+        open_job_queue('redis://localhost/0')
+
+
+def test_enqueue_deduplicates_by_target(job_queue, library, make_song):
+    songs = [make_song(song_name='晴天'), make_song(song_name='七里香')]
+    assert job_queue.enqueue(songs, library) == 2
+    assert job_queue.enqueue(songs + [make_song(song_name='晴天')], library) == 0
+    assert job_queue.stats() == {'queued': 2, 'leased': 0, 'done': 0, 'failed': 0}
+
+
+def test_lease_in_order_and_round_trip_record(job_queue, library, make_song):
+    job_queue.enqueue([make_song(song_name='晴天', album='叶惠美'), make_song(song_name='七里香')], library)
+    first = job_queue.lease('node-a')
+    second = job_queue.lease('node-b')
+    assert job_queue.lease('node-c') is None
+    assert first['attempts'] == 1
+    song = record_to_song(first['record'], first['created_at'])
+    assert (song.song_name, song.album) == ('晴天', '叶惠美')
+    assert record_to_song(second['record'], second['created_at']).song_name == '七里香'
+    assert job_queue.stats()['leased'] == 2
+    assert not job_queue.drained()
+
+
+def test_heartbeat_and_complete_need_the_lease_owner(job_queue, library, make_song):
+    job_queue.enqueue([make_song()], library)
+    job = job_queue.lease('node-a')
+    assert job_queue.heartbeat(job['id'], 'node-a')
+    assert not job_queue.heartbeat(job['id'], 'node-b')
+    assert not job_queue.complete(job['id'], 'node-b', True)
+    assert job_queue.complete(job['id'], 'node-a', True)
+    # 已完成的任务不能再续约
+    assert not job_queue.heartbeat(job['id'], 'node-a')
+    assert job_queue.drained()
+
+
+def test_failed_download_is_requeued_until_max_attempts(job_queue, library, make_song):
+    job_queue.enqueue([make_song()], library)
+    for attempt in range(1, JOB_MAX_ATTEMPTS + 1):
+        job = job_queue.lease('node-a')
+        assert job['attempts'] == attempt
+        job_queue.complete(job['id'], 'node-a', False, '下载失败')
+    assert job_queue.lease('node-a') is None
+    assert job_queue.stats()['failed'] == 1
+    # 失败的任务重新加入时才会再次排队
+    assert job_queue.enqueue([make_song()], library) == 1
+    assert job_queue.lease('node-a')['attempts'] == 1
+
+
+def test_release_does_not_count_an_attempt(job_queue, library, make_song):
+    job_queue.enqueue([make_song()], library)
+    job = job_queue.lease('node-a')
+    assert job_queue.release(job['id'], 'node-a')
+    assert job_queue.lease('node-b')['attempts'] == 1
+
+
+def test_expired_lease_is_taken_over(job_queue, library, make_song):
+    job_queue.enqueue([make_song()], library)
+    job = job_queue.lease('node-a', lease_seconds=-1)
+    taken = job_queue.lease('node-b')
+    assert taken['id'] == job['id'] and taken['attempts'] == 2
+    # 原节点的租约已被收回
+    assert not job_queue.heartbeat(job['id'], 'node-a')
+    assert not job_queue.complete(job['id'], 'node-a', True)
+    assert job_queue.complete(taken['id'], 'node-b', True)
+
+
+def test_repeatedly_expired_job_is_failed(job_queue, library, make_song):
+    job_queue.enqueue([make_song()], library)
+    for _ in range(JOB_MAX_ATTEMPTS):
+        assert job_queue.lease('node-a', lease_seconds=-1) is not None
+    assert job_queue.lease('node-b') is None
+    assert job_queue.stats() == {'queued': 0, 'leased': 0, 'done': 0, 'failed': 1}
+
+
+def test_target_is_library_relative_path(job_queue, library, make_song):
+    song = make_song(song_name='晴天', singers='周杰伦', album='叶惠美')
+    flat_target = job_target(library, song)
+    assert '/' not in flat_target
+
+    migrate_library(library)
+    target = job_target(library, song)
+    assert target == '/'.join(shard_dirs('周杰伦', '叶惠美') + (flat_target,))
+    job_queue.enqueue([song], library)
+    job = job_queue.lease('node-a')
+    assert job['target'] == target
+    # 各节点在自己的挂载点下还原路径
+    mount = os.path.join(os.sep, 'mnt', 'nas')
+    assert job_save_path(mount, job['target']) == os.path.join(mount, *target.split('/'))
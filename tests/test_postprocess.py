@@ -0,0 +1,178 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import musicdl_cmd
+from musicdl_cmd import AlbumCoverCache, PostProcessor
+
+
+class RecordingPostProcessor(PostProcessor):
+    def __init__(self, *args, **kwargs):
+        self.processed = []
+        super().__init__(*args, **kwargs)
+
+    def process(self, song):
+        self.processed.append(song.song_name)
+
+
+@pytest.fixture(autouse=True)
+def cover_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(musicdl_cmd, 'COVER_CACHE_DIR', str(tmp_path / 'covers'))
+
+
+def test_close_drains_queue_and_stops_workers(make_song):
+    before = threading.active_count()
+    processor = RecordingPostProcessor(workers=3)
+    for name in ('a', 'b', 'c', 'd'):
+        processor.submit(make_song(song_name=name))
+    processor.close()
+    assert sorted(processor.processed) == ['a', 'b', 'c', 'd']
+    assert not any(t.is_alive() for t in processor.threads)
+    assert threading.active_count() == before
+
+
+def test_close_shuts_down_own_cover_cache_only(tmp_path):
+    owned = PostProcessor(workers=1)
+    owned.close()
+    with pytest.raises(RuntimeError):
+        owned.cover_cache.pool.submit(int)
+
+    shared_cache = AlbumCoverCache(cache_dir=str(tmp_path / 'shared'))
+    borrowed = PostProcessor(workers=1, cover_cache=shared_cache)
+    borrowed.close()
+    # 调用方传入的封面缓存仍可继续使用
+    assert shared_cache.pool.submit(int).result() == 0
+    shared_cache.close()
+
+
+@pytest.fixture
+def fake_covers(monkeypatch):
+    """替换封面下载：地址中带 fail 的请求失败，记录每次请求的地址"""
+    requested = []
+
+    def load(url):
+        requested.append(url)
+        if 'fail' in url:
+            raise OSError('connection refused')
+        return b'\xff\xd8cover', 'image/jpeg'
+
+    monkeypatch.setattr(musicdl_cmd.SongInfoUtils, 'loadimagebytesandmime', staticmethod(load))
+    return requested
+
+
+def test_cover_cache_shares_one_fetch_per_album(tmp_path, make_song, fake_covers):
+    cache = AlbumCoverCache(cache_dir=str(tmp_path))
+    first = cache.get(make_song(song_name='晴天', album='叶惠美', cover_url='http://img/1.jpg'))
+    second = cache.get(make_song(song_name='以父之名', album='叶惠美', cover_url='http://img/2.jpg'))
+    assert first == second and first.endswith('.jpg')
+    assert fake_covers == ['http://img/1.jpg']
+    # 新的缓存实例直接使用磁盘上的封面
+    again = AlbumCoverCache(cache_dir=str(tmp_path))
+    assert again.get(make_song(album='叶惠美', cover_url='http://img/1.jpg')) == first
+    assert again.stats == {'fetched': 0, 'disk_hits': 1}
+    cache.close()
+    again.close()
+
+
+def test_cover_cache_retries_failed_fetch(tmp_path, make_song, fake_covers):
+    cache = AlbumCoverCache(cache_dir=str(tmp_path))
+    assert cache.get(make_song(album='叶惠美', cover_url='http://img/fail.jpg')) is None
+    assert not cache.entries
+    assert cache.get(make_song(album='叶惠美', cover_url='http://img/ok.jpg')) is not None
+    assert fake_covers == ['http://img/fail.jpg', 'http://img/ok.jpg']
+    cache.close()
+
+
+def test_cover_cache_is_bounded(tmp_path, make_song, fake_covers):
+    cache = AlbumCoverCache(cache_dir=str(tmp_path), max_entries=2)
+    songs = [make_song(album=album, cover_url=f'http://img/{album}.jpg') for album in ('A', 'B', 'C')]
+    cache.get(songs[0])
+    cache.get(songs[1])
+    cache.get(songs[0])     # A 变为最近使用
+    cache.get(songs[2])
+    assert list(cache.entries) == [('周杰伦', 'a'), ('周杰伦', 'c')]
+    cache.close()
+
+
+def test_cover_cache_skips_songs_without_cover(tmp_path, make_song):
+    cache = AlbumCoverCache(cache_dir=str(tmp_path))
+    assert cache.prefetch(make_song(cover_url=None)) is None
+    assert cache.get(make_song(cover_url='data:image/png;base64,')) is None
+    cache.close()
+
+
+def test_parallel_download_closes_only_its_own_processor(tmp_path, make_song, monkeypatch):
+    """监视模式把同一个后处理器传给每一轮下载，由监视循环退出时关闭"""
+    created = []
+
+    class TrackingPostProcessor(RecordingPostProcessor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self)
+
+    monkeypatch.setattr(musicdl_cmd, 'PostProcessor', TrackingPostProcessor)
+    client = SimpleNamespace(music_clients={})     # 没有可用的平台：下载直接失败
+    songs = [make_song(song_name='晴天')]
+
+    shared = TrackingPostProcessor(workers=1)
+    for _ in range(2):
+        musicdl_cmd.parallel_download(client, songs, str(tmp_path), 1, post_processor=shared)
+    assert all(t.is_alive() for t in shared.threads)
+    shared.close()
+
+    musicdl_cmd.parallel_download(client, songs, str(tmp_path), 1)
+    assert len(created) == 2
+    assert not any(t.is_alive() for t in created[1].threads)
+
+
+def test_failed_fetch_keeps_newer_entry_for_same_album(tmp_path, make_song, monkeypatch):
+    """条目被淘汰后同一专辑又开始了新的获取，旧的失败结果不能把新的移除"""
+    release = threading.Event()
+    requested = []
+
+    def load(url):
+        requested.append(url)
+        if 'slow-fail' in url:
+            release.wait(5)
+            raise OSError('timeout')
+        return b'\xff\xd8cover', 'image/jpeg'
+
+    monkeypatch.setattr(musicdl_cmd.SongInfoUtils, 'loadimagebytesandmime', staticmethod(load))
+    cache = AlbumCoverCache(cache_dir=str(tmp_path), max_entries=1)
+    failing = cache.prefetch(make_song(album='A', cover_url='http://img/slow-fail.jpg'))
+    cache.prefetch(make_song(album='B', cover_url='http://img/b.jpg')).result()     # 淘汰 A
+    newer = cache.prefetch(make_song(album='A', cover_url='http://img/a.jpg'))
+    newer.result()
+    release.set()
+    assert failing.result() is None
+    assert cache.entries[('周杰伦', 'a')] is newer
+    cache.get(make_song(album='A', cover_url='http://img/a.jpg'))
+    assert requested.count('http://img/a.jpg') == 1
+    cache.close()
+
+
+def test_cancelled_download_still_tags_songs_finishing_after_cancel(tmp_path, make_song, monkeypatch):
+    """取消后仍在收尾的下载线程提交的歌曲，也要在关闭后处理器之前写完标签"""
+    created = []
+
+    class TrackingPostProcessor(RecordingPostProcessor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self)
+
+    def slow_download(client, song, save_path, progress=None, auto_supplement_song=True, cancel_token=None):
+        cancel_token.wait(5)
+        time.sleep(0.2)
+        return True
+
+    monkeypatch.setattr(musicdl_cmd, 'PostProcessor', TrackingPostProcessor)
+    monkeypatch.setattr(musicdl_cmd, 'download_song_file', slow_download)
+    client = SimpleNamespace(music_clients={'QQMusicClient': object()})
+    songs = [make_song(song_name=f"s{i}", identifier=str(i)) for i in range(3)]
+    token = musicdl_cmd.CancelToken()
+    threading.Timer(0.1, token.cancel).start()
+    with pytest.raises(musicdl_cmd.OperationCancelled):
+        musicdl_cmd.parallel_download(client, songs, str(tmp_path), 3, cancel_token=token)
+    assert sorted(created[0].processed) == ['s0', 's1', 's2']
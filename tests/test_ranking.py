@@ -0,0 +1,59 @@
+import random
+
+from musicdl_cmd import RelevanceRanker
+
+
+def names(songs):
+    return [song.song_name for song in songs]
+
+
+def test_exact_match_ranks_first(make_song):
+    ranker = RelevanceRanker('周杰伦 晴天')
+    ranker.add([
+        make_song(song_name='晴天娃娃', singers='群星'),
+        make_song(song_name='晴天', singers='周杰伦'),
+        make_song(song_name='雨天', singers='孙燕姿'),
+    ])
+    assert names(ranker.ranked()) == ['晴天', '晴天娃娃', '雨天']
+
+
+def test_quality_then_size_break_equal_matches(make_song):
+    ranker = RelevanceRanker('晴天')
+    mp3 = make_song(song_name='晴天', identifier='mp3', ext='mp3', file_size_bytes=4 * 1024 * 1024)
+    flac = make_song(song_name='晴天', identifier='flac', ext='flac', file_size_bytes=30 * 1024 * 1024)
+    large_mp3 = make_song(song_name='晴天', identifier='mp3-large', ext='mp3', file_size_bytes=10 * 1024 * 1024)
+    ranker.add([mp3, flac, large_mp3])
+    assert [song.identifier for song in ranker.ranked()] == ['flac', 'mp3-large', 'mp3']
+    assert flac._relevance > large_mp3._relevance > mp3._relevance
+
+
+def test_equal_scores_keep_arrival_order(make_song):
+    ranker = RelevanceRanker('晴天')
+    first = [make_song(song_name='晴天', identifier=str(i)) for i in range(3)]
+    later = [make_song(song_name='晴天', identifier=str(i)) for i in range(3, 5)]
+    assert ranker.add(first) == [0, 1, 2]
+    assert ranker.add(later) == [3, 4]
+    assert [song.identifier for song in ranker.ranked()] == ['0', '1', '2', '3', '4']
+
+
+def test_positions_replay_into_current_ranking(make_song):
+    """界面按 add 返回的位置逐个插入，得到的顺序与 ranked() 一致"""
+    rng = random.Random(7)
+    words = ['晴天', '七里香', '稻香', '晴天 live', '告白气球', '夜曲']
+    ranker = RelevanceRanker('晴天')
+    view = []
+    for batch in range(5):
+        songs = [make_song(song_name=rng.choice(words), singers=rng.choice(['周杰伦', '群星']),
+                           identifier=f"{batch}-{i}", file_size_bytes=rng.randint(1, 50) * 1024 * 1024)
+                 for i in range(rng.randint(1, 6))]
+        for song, position in zip(songs, ranker.add(songs)):
+            view.insert(position, song)
+        assert view == ranker.ranked()
+    scores = [song._relevance for song in view]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_empty_keyword_ranks_by_quality_only(make_song):
+    ranker = RelevanceRanker('')
+    ranker.add([make_song(song_name='a', ext='mp3'), make_song(song_name='b', ext='flac')])
+    assert names(ranker.ranked()) == ['b', 'a']
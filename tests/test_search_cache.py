@@ -0,0 +1,150 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from musicdl_cmd import OperationCancelled, SearchHistory, SearchResultCache, prefetch_platforms
+
+
+@pytest.fixture
+def history(tmp_path):
+    return SearchHistory(path=str(tmp_path / 'history.json'))
+
+
+def test_history_completes_any_word_prefix(history):
+    history.add('周杰伦 晴天')
+    history.add('陈奕迅 十年')
+    assert history.complete('周') == ['周杰伦 晴天']
+    assert history.complete('晴') == ['周杰伦 晴天']
+    assert history.complete('  十年 ') == ['陈奕迅 十年']
+    assert history.complete('五月天') == []
+    assert history.complete('   ') == []
+
+
+def test_history_ranks_frequent_keywords_first(history):
+    history.add('晴天')
+    for _ in range(3):
+        history.add('晴天娃娃')
+    assert history.complete('晴天') == ['晴天娃娃', '晴天']
+    assert history.complete('晴天', limit=1) == ['晴天娃娃']
+
+
+def test_history_keeps_latest_spelling_and_survives_reload(history):
+    history.add('Jay Chou')
+    history.add('jay   chou')
+    history.save()
+    reloaded = SearchHistory(path=history.path)
+    assert reloaded.complete('ja') == ['jay   chou']
+
+
+def test_cache_hit_normalizes_keyword():
+    cache = SearchResultCache()
+    calls = []
+    search = lambda: calls.append(1) or ['a']
+    assert cache.fetch('QQ', '周杰伦  晴天', 10, 'sampled', search) == (['a'], False)
+    assert cache.fetch('QQ', '周杰伦 晴天', 10, 'sampled', search) == (['a'], True)
+    assert cache.contains('QQ', '周杰伦 晴天', 10, 'sampled')
+    assert len(calls) == 1
+
+
+def test_cache_coalesces_in_flight_search():
+    cache = SearchResultCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def search():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ['a']
+
+    owner = threading.Thread(target=cache.fetch, args=('QQ', 'k', 10, 'sampled', search))
+    owner.start()
+    started.wait(5)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.fetch('QQ', 'k', 10, 'sampled', search)))
+    waiter.start()
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+    assert results == [(['a'], True)]
+    assert len(calls) == 1
+
+
+def test_cache_waiter_retries_when_owner_is_cancelled():
+    cache = SearchResultCache()
+    started, release = threading.Event(), threading.Event()
+
+    def cancelled_search():
+        started.set()
+        release.wait(5)
+        raise OperationCancelled()
+
+    def owner():
+        with pytest.raises(OperationCancelled):
+            cache.fetch('QQ', 'k', 10, 'sampled', cancelled_search)
+
+    owner_thread = threading.Thread(target=owner)
+    owner_thread.start()
+    started.wait(5)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.fetch('QQ', 'k', 10, 'sampled', lambda: ['b'])))
+    waiter.start()
+    time.sleep(0.05)
+    release.set()
+    owner_thread.join(5)
+    waiter.join(5)
+    # 被取消的搜索不缓存，等待方自己重新搜索
+    assert results == [(['b'], False)]
+    assert cache.fetch('QQ', 'k', 10, 'sampled', lambda: ['c']) == (['b'], True)
+
+
+def test_cache_does_not_keep_failures():
+    cache = SearchResultCache()
+
+    def broken():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        cache.fetch('QQ', 'k', 10, 'sampled', broken)
+    assert not cache.contains('QQ', 'k', 10, 'sampled')
+    assert cache.fetch('QQ', 'k', 10, 'sampled', lambda: ['a']) == (['a'], False)
+
+
+def test_cache_expires_and_evicts_least_recent():
+    cache = SearchResultCache(ttl=0, max_entries=2)
+    cache.fetch('QQ', 'k', 10, 'sampled', lambda: ['a'])
+    assert not cache.contains('QQ', 'k', 10, 'sampled')
+
+    cache = SearchResultCache(max_entries=2)
+    for keyword in ('a', 'b'):
+        cache.fetch('QQ', keyword, 10, 'sampled', lambda: [])
+    cache.fetch('QQ', 'a', 10, 'sampled', lambda: [])   # a 变为最近使用
+    cache.fetch('QQ', 'c', 10, 'sampled', lambda: [])
+    assert [cache.contains('QQ', k, 10, 'sampled') for k in 'abc'] == [True, False, True]
+
+
+def test_cache_separates_link_check_modes():
+    cache = SearchResultCache()
+    cache.fetch('QQ', 'k', 10, 'none', lambda: ['unchecked'])
+    assert not cache.contains('QQ', 'k', 10, 'full')
+    assert cache.fetch('QQ', 'k', 10, 'full', lambda: ['checked']) == (['checked'], False)
+    assert cache.fetch('QQ', 'k', 10, 'none', lambda: []) == (['unchecked'], True)
+
+
+def test_prefetch_platforms_skips_cached_sources():
+    cache = SearchResultCache()
+    cache.fetch('QQ', 'k', 10, 'sampled', lambda: ['cached'])
+    searched = []
+
+    def search(source, keyword):
+        searched.append((source, keyword))
+        return [source]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        prefetch_platforms(cache, search, ['QQ', 'Kugou'], 'k', 10, 'sampled', executor)
+    assert searched == [('Kugou', 'k')]
+    assert cache.fetch('Kugou', 'k', 10, 'sampled', lambda: []) == (['Kugou'], True)
+    # 换了验证模式需要重新搜索
+    assert not cache.contains('QQ', 'k', 10, 'full')
@@ -0,0 +1,36 @@
+import pytest
+
+from musicdl_cmd import PLATFORM_PAGE_LIMITS, plan_search_pages, search_client_cfg
+
+
+@pytest.mark.parametrize('source, size, expected', [
+    ('NeteaseMusicClient', 10, (10, 1, 1)),
+    ('NeteaseMusicClient', 100, (100, 1, 1)),
+    ('NeteaseMusicClient', 101, (51, 2, 2)),
+    # 均分各页，不留一个只有几条的尾页
+    ('QQMusicClient', 61, (21, 3, 3)),
+    ('QQMusicClient', 300, (30, 10, 3)),
+    ('MiguMusicClient', 45, (15, 3, 3)),
+    # 未登记的平台按默认上限
+    ('UnknownMusicClient', 100, (20, 5, 4)),
+    # 非法的条数至少搜一条
+    ('KugouMusicClient', 0, (1, 1, 1)),
+    ('KugouMusicClient', '40', (20, 2, 2)),
+])
+def test_plan_search_pages(source, size, expected):
+    assert plan_search_pages(source, size) == expected
+
+
+@pytest.mark.parametrize('source', sorted(PLATFORM_PAGE_LIMITS))
+@pytest.mark.parametrize('size', [1, 7, 29, 30, 31, 99, 250, 1000])
+def test_plan_respects_platform_limits(source, size):
+    page_size, pages, concurrent = plan_search_pages(source, size)
+    max_page_size, max_concurrent = PLATFORM_PAGE_LIMITS[source]
+    assert page_size <= max_page_size
+    assert page_size * pages >= size > page_size * (pages - 1)
+    assert concurrent == min(pages, max_concurrent)
+
+
+def test_search_client_cfg_uses_planned_page_size():
+    cfg = search_client_cfg('QQMusicClient', 61, disable_print=True)
+    assert cfg == {'search_size_per_source': 61, 'search_size_per_page': 21, 'disable_print': True}
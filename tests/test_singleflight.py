@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from musicdl_cmd import CancelToken, OperationCancelled, SingleFlight
+
+
+def run_owner(flight, key, fn):
+    """在后台线程中作为第一个调用者执行 fn，返回 (线程, 开始信号, 放行信号, 结果列表)"""
+    started, release, outcome = threading.Event(), threading.Event(), []
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return fn()
+
+    def target():
+        try:
+            outcome.append(flight.do(key, blocking))
+        except BaseException as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    assert started.wait(5)
+    return thread, release, outcome
+
+
+def start_waiter(flight, key, fn, cancel_token=None):
+    outcome = []
+
+    def target():
+        try:
+            outcome.append(flight.do(key, fn, cancel_token))
+        except BaseException as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    time.sleep(0.05)    # 让等待方先拿到进行中的调用
+    return thread, outcome
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    owner, release, owner_outcome = run_owner(flight, 'k', lambda: 'result')
+    waiters = [start_waiter(flight, 'k', lambda: pytest.fail('不应再次执行')) for _ in range(3)]
+    release.set()
+    owner.join(5)
+    for thread, _ in waiters:
+        thread.join(5)
+    assert owner_outcome == [('result', False)]
+    assert [outcome for _, outcome in waiters] == [[('result', True)]] * 3
+    assert flight.stats == {'calls': 4, 'shared': 3}
+    assert flight.calls == {}
+
+
+def test_finished_calls_are_not_cached():
+    flight = SingleFlight()
+    assert flight.do('k', lambda: 1) == (1, False)
+    assert flight.do('k', lambda: 2) == (2, False)
+    assert flight.stats == {'calls': 2, 'shared': 0}
+
+
+def test_errors_are_shared_with_waiters():
+    flight = SingleFlight()
+
+    def broken():
+        raise ValueError('boom')
+
+    owner, release, owner_outcome = run_owner(flight, 'k', broken)
+    waiter, waiter_outcome = start_waiter(flight, 'k', lambda: 'unused')
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+    assert isinstance(owner_outcome[0], ValueError)
+    assert isinstance(waiter_outcome[0], ValueError)
+    assert flight.calls == {}
+
+
+@pytest.mark.parametrize('interrupt', [OperationCancelled, KeyboardInterrupt])
+def test_waiter_runs_again_when_owner_is_interrupted(interrupt):
+    flight = SingleFlight()
+
+    def interrupted():
+        raise interrupt()
+
+    owner, release, owner_outcome = run_owner(flight, 'k', interrupted)
+    runs = []
+    waiter, waiter_outcome = start_waiter(flight, 'k', lambda: runs.append(1) or 'own result')
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+    assert isinstance(owner_outcome[0], interrupt)
+    # 等待方只自己执行一次，不会反复拿到已结束的调用
+    assert waiter_outcome == [('own result', False)]
+    assert runs == [1]
+    assert flight.stats == {'calls': 2, 'shared': 0}
+    assert flight.calls == {}
+
+
+def test_cancelled_waiter_stops_waiting_only():
+    flight = SingleFlight()
+    owner, release, owner_outcome = run_owner(flight, 'k', lambda: 'result')
+    token = CancelToken()
+    waiter, waiter_outcome = start_waiter(flight, 'k', lambda: 'unused', token)
+    token.cancel()
+    waiter.join(5)
+    assert isinstance(waiter_outcome[0], OperationCancelled)
+    release.set()
+    owner.join(5)
+    assert owner_outcome == [('result', False)]
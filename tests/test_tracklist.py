@@ -0,0 +1,42 @@
+from musicdl_cmd import parse_tracklist, split_artist_title
+
+
+def test_split_artist_title():
+    assert split_artist_title(' 周杰伦 - 晴天 ') == ('周杰伦', '晴天')
+    assert split_artist_title('晴天') == ('', '晴天')
+    # 歌名里的连字符没有两侧空格时不拆分
+    assert split_artist_title('A-ha') == ('', 'A-ha')
+
+
+def test_parse_text(tmp_path):
+    path = tmp_path / 'list.txt'
+    path.write_text('# 收藏\n周杰伦 - 晴天\n\n七里香\n', encoding='utf-8')
+    entries = parse_tracklist(str(path))
+    assert [(e['line'], e['singer'], e['title']) for e in entries] == [(2, '周杰伦', '晴天'), (4, '', '七里香')]
+
+
+def test_parse_m3u_prefers_extinf(tmp_path):
+    path = tmp_path / 'list.m3u'
+    path.write_text(
+        '#EXTM3U\n'
+        '#EXTINF:269,周杰伦 - 晴天\n'
+        'music/whatever.mp3\n'
+        'D:\\Music\\陈奕迅 - 十年 (Live).flac\n',
+        encoding='utf-8'
+    )
+    entries = parse_tracklist(str(path))
+    assert [(e['line'], e['singer'], e['title']) for e in entries] == [(2, '周杰伦', '晴天'), (4, '陈奕迅', '十年')]
+
+
+def test_parse_csv_with_header(tmp_path):
+    path = tmp_path / 'list.csv'
+    path.write_text('歌名,歌手,专辑\n晴天,周杰伦,叶惠美\n,,\n十年,陈奕迅,\n', encoding='utf-8')
+    entries = parse_tracklist(str(path))
+    assert [(e['line'], e['singer'], e['title']) for e in entries] == [(2, '周杰伦', '晴天'), (4, '陈奕迅', '十年')]
+
+
+def test_parse_csv_without_header(tmp_path):
+    path = tmp_path / 'list.csv'
+    path.write_text('周杰伦,晴天\n陈奕迅 - 十年\n', encoding='utf-8')
+    entries = parse_tracklist(str(path))
+    assert [(e['singer'], e['title']) for e in entries] == [('周杰伦', '晴天'), ('陈奕迅', '十年')]
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+import pytest
+from requests.structures import CaseInsensitiveDict
+
+import musicdl_cmd
+from musicdl_cmd import DownloadUrlResolver, response_total_size
+
+
+def stub_response(status_code, **headers):
+    return SimpleNamespace(status_code=status_code, headers=CaseInsensitiveDict(
+        {name.replace('_', '-'): value for name, value in headers.items()}), close=lambda: None)
+
+
+@pytest.mark.parametrize('resp, expected', [
+    (stub_response(206, Content_Length='1', Content_Range='bytes 0-0/5242880'), 5242880),
+    (stub_response(206, Content_Length='1', Content_Range='bytes 0-0/*'), None),
+    (stub_response(206, Content_Length='1'), None),
+    (stub_response(200, Content_Length='5242880'), 5242880),
+    (stub_response(200), None),
+    (stub_response(404, Content_Length='120'), None),
+])
+def test_response_total_size(resp, expected):
+    assert response_total_size(resp) == expected
+
+
+@pytest.fixture
+def range_server(monkeypatch):
+    """替换链接探测请求：按 Range 返回 206，记录请求的链接"""
+    def request(self, method, url, request_overrides=None, range_bytes=None):
+        resp = stub_response(206, Content_Type='audio/mpeg', Content_Length='1', Content_Range='bytes 0-0/4096000')
+        return {'ok': True, 'resp': resp, 'status_code': 206, 'download_url': url + '&cdn=1',
+                'ctype': 'audio/mpeg', 'file_size_bytes': 1}
+
+    monkeypatch.setattr(musicdl_cmd.AudioLinkTester, 'request', request)
+
+
+def test_resolve_keeps_total_size_of_range_response(range_server, make_song):
+    resolver = DownloadUrlResolver()
+    song = make_song(download_url='http://cdn.example.com/a.mp3?sign=1', file_size_bytes=None)
+    entry = resolver.resolve(SimpleNamespace(), song)
+    assert entry['ok'] and entry['size'] == 4096000
+    assert resolver.apply(song)
+    assert song.download_url == 'http://cdn.example.com/a.mp3?sign=1&cdn=1'
+    assert song.file_size_bytes == 4096000
@@ -0,0 +1,41 @@
+import os
+
+from musicdl_cmd import SeenSongIndex
+
+
+def test_add_reports_new_songs_once(tmp_path, make_song):
+    seen = SeenSongIndex(path=str(tmp_path / 'seen.bin'))
+    song = make_song(identifier='001')
+    assert seen.add(song)
+    assert not seen.add(make_song(identifier='001'))
+    assert song in seen
+    # 同一个 ID 在不同平台上是不同的歌
+    assert make_song(identifier='001', source='NeteaseMusicClient') not in seen
+    assert len(seen) == 1
+
+
+def test_songs_without_identifier_use_singer_and_title(tmp_path, make_song):
+    seen = SeenSongIndex(path=str(tmp_path / 'seen.bin'))
+    seen.add(make_song(identifier=None, singers='周杰伦', song_name='晴天'))
+    assert make_song(identifier=None, singers=' 周杰伦 ', song_name='晴天') in seen
+    assert make_song(identifier=None, singers='周杰伦', song_name='七里香') not in seen
+
+
+def test_discard_and_persistence(tmp_path, make_song):
+    path = str(tmp_path / 'watch' / 'seen.bin')
+    seen = SeenSongIndex(path=path)
+    kept, dropped = make_song(identifier='1'), make_song(identifier='2')
+    seen.add(kept)
+    seen.add(dropped)
+    seen.discard(dropped)
+    seen.save()
+    assert os.path.getsize(path) == 8
+    reloaded = SeenSongIndex(path=path)
+    assert kept in reloaded and dropped not in reloaded
+
+
+def test_missing_or_corrupt_file_starts_empty(tmp_path):
+    assert len(SeenSongIndex(path=str(tmp_path / 'missing.bin'))) == 0
+    corrupt = tmp_path / 'corrupt.bin'
+    corrupt.write_bytes(b'\x01\x02\x03')
+    assert len(SeenSongIndex(path=str(corrupt))) == 0